@@ -1,15 +1,69 @@
 # flake8: noqa
 
 import sys
-import json
 import logging
 
-from dataclasses import asdict
+from functools import partial
+from contextlib import closing
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 from urllib3.connectionpool import log as urllib_logger
-from allegro.search import crawl, search, Product
+from allegro.search import iter_crawl, iter_search, Product, WorkerPool, SeenOffers
+from allegro.search import get_checkpoint, iter_queries, QueryProgress
+from allegro.search import get_work_queue, run_worker, iter_distributed_crawl
+from allegro.console.output import get_writer
+from allegro.constants import PROXY_CHECK_URL
 from allegro.types import Filters, Options
 from allegro.parsers import parse_arguments
 from allegro.proxy import load_from_file, filter_proxies, scrape_free_proxy_lists
+from allegro.proxy import ProxyReputation
+from allegro.utils import set_pool_size, set_parser_backend, close_sessions
+from allegro.utils import set_cache, cache_from_options
+from allegro.utils import set_rate_limiter, rate_limiter_from_options
+from allegro.utils import set_retry_policy, retry_policy_from_options
+from allegro.utils import MetricsRegistry, MetricsServer, set_metrics, start_metrics_server
+from allegro.utils import Profiler, set_profiler
+
+
+def _iter_search(
+    query: str,
+    options: Options,
+    proxies: List[str],
+    pool: WorkerPool,
+    seen: SeenOffers,
+    progress: QueryProgress = None,
+) -> Iterator[Product]:
+    # Single allegro offer
+    if "allegro.pl/oferta/" in query:
+        if seen.add(query):
+            # Create product object using url
+            yield Product.from_url(
+                url=query,
+                proxies=proxies,
+                timeout=options.get("request_timeout"),
+            )
+    # Search term (we get only first page of results)
+    else:
+        yield from iter_search(query, options, proxies, pool=pool, seen=seen)
+
+    if progress is not None:
+        progress.finish()
+
+
+def _report_metrics(metrics: MetricsRegistry, server: Optional[MetricsServer]):
+    if server is not None:
+        server.stop()
+
+    for line in metrics.get_summary():
+        logging.info(line)
+
+
+def _write_profile(profiler: Optional[Profiler], path: Optional[str]):
+    if profiler is None or path is None:
+        return
+
+    profiler.stop()
+    profiler.write_report(path)
+    logging.info(f"Saved profile to {path}")
 
 
 def console_entry_point():
@@ -19,9 +73,6 @@ def console_entry_point():
     # Proxies list
     proxies = []
 
-    # List containing Product objects
-    products = []
-
     # Create filters dict
     filters: Filters = {  # type: ignore
         "sorting": arguments.sorting,
@@ -49,8 +100,36 @@ def console_entry_point():
         "use_free_proxies": arguments.use_free_proxies,
         "proxies_file": arguments.proxies_file,
         "check_proxies": arguments.check_proxies,
+        "proxy_check_workers": arguments.proxy_check_workers,
+        "max_proxies": arguments.max_proxies,
+        "proxy_check_url": arguments.proxy_check_url,
+        "proxy_reputation": arguments.proxy_reputation,
         "request_timeout": arguments.request_timeout,
         "threads": arguments.threads,
+        "worker_kind": arguments.worker_kind,
+        "pool_size": arguments.pool_size,
+        "queue_size": arguments.queue_size,
+        "parser_backend": arguments.parser_backend,
+        "cache_dir": arguments.cache_dir,
+        "cache_listing_ttl": arguments.cache_listing_ttl,
+        "cache_offer_ttl": arguments.cache_offer_ttl,
+        "cache_size": arguments.cache_size,
+        "index_path": arguments.index_path,
+        "listing_only": arguments.listing_only,
+        "rate_limit": arguments.rate_limit,
+        "rate_burst": arguments.rate_burst,
+        "proxy_rate_limit": arguments.proxy_rate_limit,
+        "proxy_rate_burst": arguments.proxy_rate_burst,
+        "max_retries": arguments.max_retries,
+        "retry_backoff": arguments.retry_backoff,
+        "retry_budget": arguments.retry_budget,
+        "checkpoint_path": arguments.checkpoint_path,
+        "resume": arguments.resume,
+        "max_queries": arguments.max_queries,
+        "work_queue": arguments.work_queue,
+        "task_lease": arguments.task_lease,
+        "metrics_port": arguments.metrics_port,
+        "profile_path": arguments.profile_path,
     }
 
     # Set up logging
@@ -64,6 +143,47 @@ def console_entry_point():
     if arguments.verbose:
         urllib_logger.setLevel(logging.WARNING)
 
+    # Collect metrics, they are summarized at the end
+    metrics = MetricsRegistry()
+    set_metrics(metrics)
+
+    # Expose metrics of long running crawls
+    metrics_server = None
+    if options.get("metrics_port") is not None:
+        metrics_server = start_metrics_server(options["metrics_port"], metrics)
+        logging.info(f"Serving metrics on port {metrics_server.port}")
+
+    # Profile threads and worker processes started from now on
+    profiler = None
+    if options.get("profile_path") is not None:
+        profiler = Profiler()
+        profiler.start()
+        set_profiler(profiler)
+
+    # Set html parser
+    parser_backend = options.get("parser_backend")
+    if parser_backend is not None:
+        set_parser_backend(parser_backend)
+
+    # Set response cache
+    if options.get("cache_dir") is not None:
+        set_cache(cache_from_options(options))
+
+    # Set rate limits
+    rate_limiter = rate_limiter_from_options(options)
+    if rate_limiter is not None:
+        set_rate_limiter(rate_limiter)
+
+    # Set retry policy
+    retry_policy = retry_policy_from_options(options)
+    if retry_policy is not None:
+        set_retry_policy(retry_policy)
+
+    # Set size of the keep-alive connection pools
+    pool_size = options.get("pool_size")
+    if pool_size is not None:
+        set_pool_size(pool_size)
+
     # Use free proxies
     if options.get("use_free_proxies") is True:
         logging.info("Gathering proxies")
@@ -83,10 +203,22 @@ def console_entry_point():
             proxies.extend(new_proxies)
             logging.info(f"Loaded {len(new_proxies)} proxies")
 
+    # History of proxies from previous runs
+    reputation = None
+    if options.get("proxy_reputation") is not None and len(proxies) >= 1:
+        reputation = ProxyReputation(options["proxy_reputation"])
+
     # Check proxies
     if options.get("check_proxies") is True and len(proxies) >= 1:
         logging.info(f"Checking {len(proxies)} proxies")
-        proxies = filter_proxies(proxies, options.get("request_timeout"))
+        proxies = filter_proxies(
+            proxies,
+            timeout=options.get("request_timeout"),
+            workers=options.get("proxy_check_workers"),
+            max_proxies=options.get("max_proxies"),
+            url=options.get("proxy_check_url") or PROXY_CHECK_URL,
+            reputation=reputation,
+        )
         logging.info(f"Finished checking proxies, working proxies: {len(proxies)}")
 
     # Set proxies to None if list is empty
@@ -98,54 +230,153 @@ def console_entry_point():
         logging.error("Aborting, no working proxies found")
         sys.exit(1)
 
+    # Proxy pool starts with weights and quarantines from previous runs
+    if reputation is not None:
+        proxies = reputation.get_pool(proxies)  # type: ignore
+
+    # Queue shared by nodes of distributed crawl
+    work_queue = None
+    if options.get("work_queue") is not None:
+        work_queue = get_work_queue(options["work_queue"], lease=options.get("task_lease"))
+
+    # Worker only scrapes pages queued by the coordinator
+    if arguments.worker:
+        logging.info(f"Waiting for tasks from {options['work_queue']}")
+
+        try:
+            completed = run_worker(
+                work_queue,  # type: ignore
+                proxies,
+                timeout=options.get("request_timeout"),
+                threads=options.get("threads"),
+            )
+            logging.info(f"Finished, completed {completed} tasks")
+        finally:
+            close_sessions()
+
+            # Save health of proxies for next runs
+            if reputation is not None:
+                reputation.record_pool(proxies)  # type: ignore
+                reputation.save()
+
+            work_queue.close()  # type: ignore
+            _report_metrics(metrics, metrics_server)
+            _write_profile(profiler, options.get("profile_path"))
+
+        return
+
+    # Pool of workers shared by all queries
+    pool = None
+    threads = options.get("threads")
+    if threads is not None:
+        pool = WorkerPool(threads, options.get("worker_kind") or "process")
+
+    # Offers scraped by any query, duplicates are not fetched again
+    seen = SeenOffers()
+
+    # Progress of queries, saved so interrupted run can be resumed
+    checkpoint = None
+    resume = bool(options.get("resume"))
+    if options.get("checkpoint_path") is not None:
+        checkpoint = get_checkpoint(options["checkpoint_path"])
+
+        if not resume:
+            checkpoint.clear()
+
+        # Progress is saved only after products are flushed, so products of offers
+        # marked as completed are never lost
+        checkpoint.autosave = False
+
+    # Products are saved as soon as they are scrapped
+    writer = get_writer(
+        arguments.output,
+        arguments.format,
+        arguments.flush_interval,
+        append=resume,
+        on_flush=checkpoint.save if checkpoint is not None else None,
+    )
+
     try:
+        # Queries run at once and share the pool of workers
+        queries: List[Tuple[str, Callable[[], Iterable[Product]]]] = []
+
         # Search for specified products
-        if arguments.search is not None and len(arguments.search) >= 1:
-            # Iterate over all search arguments
-            for query in arguments.search:
-                # Single allegro offer
-                if "allegro.pl/oferta/" in query:
-                    # Create product object using url
-                    product = Product.from_url(
-                        url=query,
-                        proxies=proxies,
-                        timeout=options.get("request_timeout"),
-                    )
+        for query in arguments.search or []:
+            progress = None
+            if checkpoint is not None:
+                progress = checkpoint.get_progress(f"search:{query}", resume)
 
-                    # Add product to products list
-                    products.append(product)
-                # Search term (we get only first page of results)
-                else:
-                    # Start crawling
-                    results = search(query, options, proxies)
+                # Products of finished searches are already saved
+                if progress.done:
+                    continue
 
-                    # Extend product list with search results
-                    products.extend(results)
+            queries.append(
+                (
+                    query,
+                    partial(
+                        _iter_search, query, options, proxies, pool, seen, progress
+                    ),
+                )
+            )
 
         # Crawl specified search terms
-        if arguments.crawl is not None and len(arguments.crawl) >= 1:
-            # Iterate over all crawl argumets
-            for query in arguments.crawl:
-                # Start crawling
-                results = crawl(
-                    query, filters=filters, options=options, proxies=proxies
+        for query in arguments.crawl or []:
+            # Pages and offers are scraped by workers on other nodes
+            if work_queue is not None:
+                queries.append(
+                    (
+                        query,
+                        partial(
+                            iter_distributed_crawl,
+                            query,
+                            work_queue,
+                            options=options,
+                            filters=filters,
+                            seen=seen,
+                        ),
+                    )
+                )
+                continue
+
+            queries.append(
+                (
+                    query,
+                    partial(
+                        iter_crawl,
+                        query,
+                        filters=filters,
+                        options=options,
+                        proxies=proxies,
+                        pool=pool,
+                        seen=seen,
+                    ),
                 )
+            )
 
-                # Add results to products list
-                products.extend(results)
+        # Products are attributed to the query that found them, queries are stopped
+        # before sessions and the pool are closed
+        with closing(iter_queries(queries, options.get("max_queries"))) as products:
+            for query, product in products:
+                writer.write(product, query=query)
     except Exception as e:
         logging.error(e)
     finally:
-        if len(products) >= 1:
-            # Convert products to dicts
-            products = [asdict(var) for var in products if var is not None]
-
-            # Dump dicts to json string
-            json_dump = json.dumps(products, indent=4, ensure_ascii=False)
-
-            # Save json to file
-            with open(arguments.output, "w", encoding="utf-8") as output:
-                logging.info(f"Saving {len(products)} products to {arguments.output}")
-                output.write(json_dump)
-        else:
-            logging.warning("Didn't find any products")
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+        # Close keep-alive connections
+        close_sessions()
+
+        # Save health of proxies for next runs
+        if reputation is not None:
+            reputation.record_pool(proxies)  # type: ignore
+            reputation.save()
+
+        if work_queue is not None:
+            work_queue.close()
+
+        # Save products
+        writer.close()
+
+        _report_metrics(metrics, metrics_server)
+        _write_profile(profiler, options.get("profile_path"))
@@ -0,0 +1,196 @@
+import os
+import json
+import logging
+import threading
+
+from dataclasses import asdict
+from typing import IO, Callable, List, Optional
+from allegro.constants import DEFAULT_FLUSH_INTERVAL
+from allegro.search import Product
+
+
+def _get_record(product: Product, query: str = None) -> dict:
+    record = asdict(product)
+
+    # Query that found the product
+    if query is not None:
+        record["query"] = query
+
+    return record
+
+
+class JsonWriter:
+    """
+    ### Overview
+    - Keeps products in memory and saves them as one json array on `close`.
+
+    ### Args
+    - output: `str` path to the output file
+    - append: `bool` keep products from the existing file
+    - on_flush: `Callable[[], None]` called after products are saved
+    """
+
+    def __init__(
+        self, output: str, append: bool = False, on_flush: Callable[[], None] = None
+    ):
+        self.output = output
+        self.append = append
+        self.on_flush = on_flush
+        self.count = 0
+        self._products: List[dict] = []
+
+        if append and os.path.exists(output):
+            with open(output, "r", encoding="utf-8") as file:
+                self._products = json.load(file)
+
+    def write(self, product: Product, query: str = None):
+        if product is None:
+            return
+
+        self._products.append(_get_record(product, query))
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            logging.warning("Didn't find any products")
+        else:
+            # Dump dicts to json string
+            json_dump = json.dumps(self._products, indent=4, ensure_ascii=False)
+
+            # Save json to file
+            with open(self.output, "w", encoding="utf-8") as output:
+                logging.info(f"Saving {len(self._products)} products to {self.output}")
+                output.write(json_dump)
+
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonLinesWriter:
+    """
+    ### Overview
+    - Appends each product to the output file as one json line, as soon as it's
+      scrapped. The file is flushed every `flush_interval` seconds by a background
+      thread, so products scrapped before a crash are not lost, even if no product
+      comes after them.
+
+    ### Args
+    - output: `str` path to the output file
+    - flush_interval: `float` seconds between flushes, `0` flushes every product
+    - append: `bool` append to the existing file instead of overwriting it
+    - on_flush: `Callable[[], None]` called after the file is flushed
+    """
+
+    def __init__(
+        self,
+        output: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        append: bool = False,
+        on_flush: Callable[[], None] = None,
+    ):
+        self.output = output
+        self.flush_interval = flush_interval
+        self.append = append
+        self.on_flush = on_flush
+        self.count = 0
+        self._file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def write(self, product: Product, query: str = None):
+        if product is None:
+            return
+
+        with self._lock:
+            # File is created with the first product
+            if self._file is None:
+                self._file = open(
+                    self.output, "a" if self.append else "w", encoding="utf-8"
+                )
+
+                if self.flush_interval > 0:
+                    self._flusher = threading.Thread(
+                        target=self._flush_periodically, name="allegro-flush", daemon=True
+                    )
+                    self._flusher.start()
+
+            self._file.write(
+                json.dumps(_get_record(product, query), ensure_ascii=False) + "\n"
+            )
+            self.count += 1
+
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def _flush_periodically(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self):
+        # Flusher is stopped first, so it doesn't flush the closed file
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+
+        with self._lock:
+            file, self._file = self._file, None
+
+        if file is None:
+            logging.warning("Didn't find any products")
+        else:
+            file.close()
+
+            logging.info(f"Saved {self.count} products to {self.output}")
+
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_writer(
+    output: str,
+    output_format: str = None,
+    flush_interval: float = None,
+    append: bool = False,
+    on_flush: Callable[[], None] = None,
+):
+    """
+    ### Args
+    - output: `str` path to the output file
+    - output_format: `str` "json" or "jsonl"
+    - flush_interval: `float` seconds between flushes of "jsonl" output
+    - append: `bool` keep products from the existing file
+    - on_flush: `Callable[[], None]` called after products are saved to the file
+
+    ### Returns
+    - `JsonWriter` or `JsonLinesWriter`
+    """
+
+    if output_format == "jsonl":
+        if flush_interval is None:
+            flush_interval = DEFAULT_FLUSH_INTERVAL
+
+        return JsonLinesWriter(output, flush_interval, append, on_flush)
+
+    return JsonWriter(output, append, on_flush)
@@ -98,3 +98,83 @@ HEADERS = {
     "Sec-Fetch-Site": "same-origin",
     "Sec-Gpc": "1",
 }
+
+# Default number of requests kept in flight by the async functions
+DEFAULT_CONCURRENCY = 32
+
+# Default number of keep-alive connections per host and proxy
+DEFAULT_POOL_SIZE = 32
+
+# Default number of offer urls waiting to be scraped during crawl
+DEFAULT_QUEUE_SIZE = 200
+
+# Default number of seconds between flushes of jsonl output
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Parser used to build soup from pages
+DEFAULT_PARSER_BACKEND = "html.parser"
+
+# Default number of seconds cached listing pages are fresh
+DEFAULT_CACHE_LISTING_TTL = 600
+
+# Default number of seconds cached offer pages are fresh
+DEFAULT_CACHE_OFFER_TTL = 3600
+
+# Default max size of the response cache in bytes
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Default number of seconds blocked proxy is not used
+DEFAULT_PROXY_COOLDOWN = 60.0
+
+# Max number of seconds proxy that is blocked again and again is not used
+DEFAULT_PROXY_MAX_COOLDOWN = 900.0
+
+# Page used to check if proxy is not banned
+PROXY_CHECK_URL = (
+    "https://allegro.pl/oferta/typ-c-kabel-quick-charge-3-0-szybkie-ladowanie-7865547535"
+)
+
+# Default number of proxies checked at once
+DEFAULT_PROXY_CHECK_WORKERS = 32
+
+# Number of seconds proxy that worked is not checked again
+DEFAULT_REPUTATION_GOOD_TTL = 3600.0
+
+# Number of seconds proxy that didn't work is not checked again
+DEFAULT_REPUTATION_DEAD_TTL = 86400.0
+
+# Default number of retries of one page after transient errors
+DEFAULT_MAX_RETRIES = 3
+
+# Default number of seconds before first retry, doubled on every retry
+DEFAULT_RETRY_BACKOFF = 1.0
+
+# Max number of seconds between retries
+DEFAULT_RETRY_MAX_BACKOFF = 30.0
+
+# Number of recent requests checked by the circuit breaker
+DEFAULT_BREAKER_WINDOW = 20
+
+# Part of failed requests in the window that stops sending requests
+DEFAULT_BREAKER_THRESHOLD = 0.5
+
+# Number of seconds requests are not sent after the circuit breaker opens
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+# Default number of seconds between saves of the crawl checkpoint
+DEFAULT_CHECKPOINT_INTERVAL = 10.0
+
+# Default number of queries run at once
+DEFAULT_MAX_QUERIES = 4
+
+# Default number of seconds a worker owns a task before it's given to another worker
+DEFAULT_TASK_LEASE = 120.0
+
+# Default number of times a task is tried before it's dropped
+DEFAULT_TASK_ATTEMPTS = 3
+
+# Default number of seconds idle worker waits for new tasks before it stops
+DEFAULT_WORKER_IDLE_TIMEOUT = 60.0
+
+# Upper bounds in seconds of buckets of timing histograms
+DEFAULT_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
@@ -12,3 +12,4 @@ from allegro.parsers.product_parser import (
     find_product_images,
     find_product_parameters,
 )
+from allegro.parsers.product_extractor import extract_product
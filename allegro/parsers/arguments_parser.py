@@ -9,13 +9,24 @@ def _parse_basic(parser: ArgumentParser):
     parser.add_argument("--crawl", "-c", type=str, nargs="+", help="Enables crawling")
 
     # Output file
+    parser.add_argument("--output", "-o", help="Output file ex. C:/test/file.json")
+
+    # Output format
     parser.add_argument(
-        "--output", "-o", help="Output file ex. C:/test/file.json", required=True
+        "--format",
+        "-f",
+        default="json",
+        choices={"json", "jsonl"},
+        help="Output format, jsonl saves products as soon as they are scrapped",
     )
 
-    opts, _ = parser.parse_known_args()
-    if opts.search is None and opts.crawl is None:
-        parser.error("--crawl/-c or --search/-s is required")
+    # Flush interval
+    parser.add_argument(
+        "--flush-interval",
+        "-fi",
+        type=float,
+        help="Seconds between flushes of jsonl output",
+    )
 
     return parser
 
@@ -235,12 +246,245 @@ def _parse_options(parser: ArgumentParser):
         help="Check if proxies are not banned",
     )
 
+    # Proxy check workers
+    parser.add_argument(
+        "--proxy-check-workers",
+        "-pcw",
+        type=int,
+        help="Number of proxies checked at once",
+    )
+
+    # Max proxies
+    parser.add_argument(
+        "--max-proxies",
+        "-mp",
+        type=int,
+        help="Stop checking proxies when this many working proxies are found",
+    )
+
+    # Proxy check url
+    parser.add_argument(
+        "--proxy-check-url",
+        "-pcu",
+        type=str,
+        help="Page requested through proxies when they are checked",
+    )
+
+    # Proxy reputation
+    parser.add_argument(
+        "--proxy-reputation",
+        "-prep",
+        type=str,
+        help="Json file with history of proxies, shared across runs",
+    )
+
     # Request timeout
     parser.add_argument("--request-timeout", "-rt", type=int, help="Request timeout")
 
     # Threads
     parser.add_argument("--threads", "-t", type=int, help="Number of threads to use")
 
+    # Worker kind
+    parser.add_argument(
+        "--worker-kind",
+        "-wk",
+        help="Kind of workers used with --threads",
+        choices={"thread", "process", "async"},
+    )
+
+    # Offer queue size
+    parser.add_argument(
+        "--queue-size",
+        "-qs",
+        type=int,
+        help="Max number of offer urls waiting to be scraped during crawl",
+    )
+
+    # Parser backend
+    parser.add_argument(
+        "--parser",
+        "-pa",
+        dest="parser_backend",
+        help="Html parser, lxml and selectolax are faster but have to be installed",
+        choices={"html.parser", "lxml", "selectolax"},
+    )
+
+    # Connection pool size
+    parser.add_argument(
+        "--pool-size",
+        "-ps",
+        type=int,
+        help="Number of keep-alive connections per host and proxy",
+    )
+
+    # Response cache directory
+    parser.add_argument(
+        "--cache-dir", "-cd", type=str, help="Directory used to cache downloaded pages"
+    )
+
+    # Listing pages ttl
+    parser.add_argument(
+        "--cache-listing-ttl",
+        "-clt",
+        type=int,
+        help="Number of seconds cached listing pages are used without revalidation",
+    )
+
+    # Offer pages ttl
+    parser.add_argument(
+        "--cache-offer-ttl",
+        "-cot",
+        type=int,
+        help="Number of seconds cached offer pages are used without revalidation",
+    )
+
+    # Cache size
+    parser.add_argument(
+        "--cache-size", "-cs", type=int, help="Max size of the cache in megabytes"
+    )
+
+    # Offer index
+    parser.add_argument(
+        "--index",
+        "-ix",
+        dest="index_path",
+        type=str,
+        help="Database with offers from previous crawls, only changed offers are scraped",
+    )
+
+    # Listing only
+    parser.add_argument(
+        "--listing-only",
+        "-lo",
+        action="store_true",
+        default=None,
+        help="Make products from listing pages without fetching offer pages",
+    )
+
+    # Host rate limit
+    parser.add_argument(
+        "--rate-limit",
+        "-rl",
+        type=float,
+        help="Max number of requests per second sent to allegro",
+    )
+
+    # Host burst
+    parser.add_argument(
+        "--rate-burst",
+        "-rb",
+        type=int,
+        help="Number of requests that can be sent to allegro at once",
+    )
+
+    # Proxy rate limit
+    parser.add_argument(
+        "--proxy-rate-limit",
+        "-prl",
+        type=float,
+        help="Max number of requests per second sent through one proxy",
+    )
+
+    # Proxy burst
+    parser.add_argument(
+        "--proxy-rate-burst",
+        "-prb",
+        type=int,
+        help="Number of requests that can be sent through one proxy at once",
+    )
+
+    # Retries
+    parser.add_argument(
+        "--max-retries",
+        "-mr",
+        type=int,
+        help="Max number of retries of one page after timeouts, connection and server errors",
+    )
+
+    # Retry backoff
+    parser.add_argument(
+        "--retry-backoff",
+        "-rbk",
+        type=float,
+        help="Number of seconds before first retry, doubled on every retry",
+    )
+
+    # Retry budget
+    parser.add_argument(
+        "--retry-budget",
+        "-rbu",
+        type=int,
+        help="Max number of retries during the whole run",
+    )
+
+    # Checkpoint
+    parser.add_argument(
+        "--checkpoint",
+        "-ck",
+        dest="checkpoint_path",
+        type=str,
+        help="Path to the file where progress of crawls is saved",
+    )
+
+    # Resume
+    parser.add_argument(
+        "--resume",
+        "-re",
+        action="store_true",
+        default=None,
+        help="Continue crawls from the checkpoint, products are appended to the output",
+    )
+
+    # Queries run at once
+    parser.add_argument(
+        "--max-queries",
+        "-mq",
+        type=int,
+        help="Number of search and crawl queries run at once",
+    )
+
+    # Work queue
+    parser.add_argument(
+        "--work-queue",
+        "-wq",
+        type=str,
+        help="Queue shared by nodes of distributed crawl, redis://host:port/db or "
+        "path to sqlite database",
+    )
+
+    # Worker mode
+    parser.add_argument(
+        "--worker",
+        "-wo",
+        action="store_true",
+        default=None,
+        help="Scrape pages queued in the work queue by the coordinator",
+    )
+
+    # Task lease
+    parser.add_argument(
+        "--task-lease",
+        "-tl",
+        type=float,
+        help="Seconds before task of a crashed worker is given to another worker",
+    )
+
+    # Metrics port
+    parser.add_argument(
+        "--metrics-port",
+        "-mpo",
+        type=int,
+        help="Serve metrics in Prometheus text format on this port",
+    )
+
+    # Profile
+    parser.add_argument(
+        "--profile",
+        "-prf",
+        dest="profile_path",
+        help="Write cpu profile and timeline of requests to this file",
+    )
+
     return parser
 
 
@@ -263,5 +507,20 @@ def parse_arguments():
     # Parse options arguments
     parser = _parse_options(parser)
 
+    arguments = parser.parse_args()
+
+    if arguments.worker:
+        if arguments.work_queue is None:
+            parser.error("--worker/-wo requires --work-queue/-wq")
+    else:
+        if arguments.search is None and arguments.crawl is None:
+            parser.error("--crawl/-c or --search/-s is required")
+
+        if arguments.output is None:
+            parser.error("the following arguments are required: --output/-o")
+
+    if arguments.resume and arguments.checkpoint_path is None:
+        parser.error("--resume/-re requires --checkpoint/-ck")
+
     # Return parsed arguments
-    return parser.parse_args()
+    return arguments
@@ -0,0 +1,185 @@
+from typing import Callable, Dict, List, Tuple
+from allegro.utils import SelectolaxNode
+from allegro.utils.html import MULTI_VALUED_ATTRIBUTES
+
+# Fields that have to be found on every buy now offer page
+_REQUIRED_FIELDS = ("name", "price", "category", "seller", "quantity", "parameters")
+
+
+def _on_buy_now(element, fields: dict):
+    fields["buy_now"] = True
+
+
+def _on_name(element, fields: dict):
+    fields.setdefault("name", element.get("content"))
+
+
+def _on_category(element, fields: dict):
+    link = element.find("a")
+
+    # Last breadcrumb pointing to a category wins
+    if "allegro.pl/kategoria" in link.get("href"):
+        fields["category"] = link.get("href")
+
+
+def _on_price(element, fields: dict):
+    fields.setdefault("price", float(element.get("content")))
+
+
+def _on_seller(element, fields: dict):
+    fields.setdefault("seller", element.text.split(" - ")[0])
+
+
+def _on_quantity(element, fields: dict):
+    fields.setdefault("quantity", int(element.get("max")))
+
+
+def _on_rating(element, fields: dict):
+    fields.setdefault("rating", float(element.get("content")))
+
+
+def _on_image(element, fields: dict):
+    img = element.find("img")
+
+    if img is not None:
+        fields["images"].append(img.get("src"))
+
+
+def _on_parameters(element, fields: dict):
+    if "parameters" in fields:
+        return
+
+    parameters = {}
+
+    # Same structure as in `find_product_parameters`, but only inside of the box
+    parameters_list = element.find("ul", attrs={"data-reactroot": True})
+    for segment in parameters_list.find_all("li", recursive=False):
+        for part in segment.find("div").find_all("div"):
+            for parameter_object in part.find_all("li"):
+                objects = parameter_object.find("div").find_all("div")
+
+                parameters[objects[0].text[:-1]] = objects[1].text
+
+    fields["parameters"] = parameters
+
+
+# Rules are grouped by tag, each rule is a list of attribute conditions and a handler.
+# `True` means that attribute has to be present, string means that it has to match.
+_RULES: Dict[str, List[Tuple[Tuple[Tuple[str, object], ...], Callable]]] = {
+    "button": [
+        (
+            (
+                ("type", "submit"),
+                ("id", "buy-now-button"),
+                ("data-analytics-interaction-custom-flow-type", "BuyNow"),
+            ),
+            _on_buy_now,
+        )
+    ],
+    "meta": [
+        ((("property", "og:title"),), _on_name),
+        ((("itemprop", "price"),), _on_price),
+        ((("itemprop", "ratingValue"),), _on_rating),
+    ],
+    "div": [
+        (
+            (
+                ("data-role", "breadcrumb-item"),
+                ("itemscope", True),
+                ("itemprop", "itemListElement"),
+                ("itemtype", "http://schema.org/ListItem"),
+            ),
+            _on_category,
+        ),
+        ((("role", "button"), ("tabindex", "0")), _on_image),
+        (
+            (
+                ("data-box-name", "Parameters"),
+                ("data-prototype-id", "allegro.showoffer.parameters"),
+                ("data-analytics-category", "allegro.showoffer.parameters"),
+            ),
+            _on_parameters,
+        ),
+    ],
+    "a": [
+        (
+            (("href", "#aboutSeller"), ("data-analytics-click-value", "sellerLogin")),
+            _on_seller,
+        )
+    ],
+    "input": [((("type", "number"), ("name", "quantity")), _on_quantity)],
+}
+
+
+def _matches(attrs: dict, conditions: Tuple[Tuple[str, object], ...]) -> bool:
+    for key, expected in conditions:
+        if key not in attrs:
+            return False
+
+        if expected is True:
+            continue
+
+        value = attrs[key]
+
+        if value == expected:
+            continue
+
+        # bs4 gives list of tokens, selectolax gives raw string
+        if key in MULTI_VALUED_ATTRIBUTES:
+            tokens = value if isinstance(value, list) else (value or "").split()
+            if expected in tokens or " ".join(tokens) == expected:
+                continue
+
+        return False
+
+    return True
+
+
+def _iter_elements(soup):
+    """
+    Yields `(tag, attrs, element)` for every element of the page, in document order
+    """
+
+    if isinstance(soup, SelectolaxNode):
+        for node in soup.node.traverse():
+            yield node.tag, node.attributes, node
+    else:
+        for element in soup.descendants:
+            # Skip strings and comments
+            if element.name is not None:
+                yield element.name, element.attrs, element
+
+
+def extract_product(soup) -> dict:
+    """
+    ### Args
+    - soup: `BeautifulSoup` or `SelectolaxNode` parsed product page
+
+    ### Returns
+    - `dict` with `buy_now` flag and product fields, page is walked only once
+
+    ### Errors
+    - `AttributeError` if one of the required fields is missing on buy now offer page
+    """
+
+    fields: dict = {"buy_now": False, "images": []}
+    selectolax = isinstance(soup, SelectolaxNode)
+
+    for tag, attrs, element in _iter_elements(soup):
+        rules = _RULES.get(tag)
+
+        if rules is None:
+            continue
+
+        for conditions, handler in rules:
+            if _matches(attrs, conditions):
+                handler(SelectolaxNode(element) if selectolax else element, fields)
+
+    fields.setdefault("rating", 0.0)
+
+    if fields["buy_now"] is True:
+        for field in _REQUIRED_FIELDS:
+            if field not in fields:
+                raise AttributeError(f"Couldn't find product {field}")
+
+    return fields
@@ -1,5 +1,13 @@
 # flake8: noqa
 
-from allegro.proxy.proxy_checker import check_proxy, filter_proxies
+from allegro.proxy.proxy_checker import (
+    check_proxy,
+    filter_proxies,
+    validate_proxy,
+    validate_proxies,
+    ProxyCheck,
+)
 from allegro.proxy.proxy_file import load_from_file
 from allegro.proxy.proxy_gatherer import scrape_free_proxy_lists
+from allegro.proxy.proxy_reputation import ProxyReputation, ProxyRecord
+from allegro.utils.proxy_pool import ProxyPool, ProxyStats, get_proxy_pool
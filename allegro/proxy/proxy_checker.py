@@ -1,51 +1,182 @@
+import time
 import logging
-import requests
+import concurrent.futures
 
-from typing import List
-from bs4 import BeautifulSoup
-from allegro.constants import HEADERS
-from allegro.utils import check_captcha
+from typing import List, NamedTuple, Optional, TYPE_CHECKING
+from allegro.constants import HEADERS, PROXY_CHECK_URL, DEFAULT_PROXY_CHECK_WORKERS
+from allegro.utils import (
+    classify_response,
+    classify_exception,
+    get_proxy_object,
+    get_session,
+    ResponseKind,
+)
 
+if TYPE_CHECKING:
+    from allegro.proxy.proxy_reputation import ProxyReputation
+
+
+class ProxyCheck(NamedTuple):
+    proxy: str
+    kind: ResponseKind
+    latency: Optional[float]
+
+    @property
+    def working(self) -> bool:
+        return self.kind is ResponseKind.OK
+
+
+def validate_proxy(
+    proxy: str, timeout: int = None, url: str = PROXY_CHECK_URL
+) -> ProxyCheck:
+    """
+    ### Args
+    - proxy: `str` proxy in `ip:port` format
+    - timeout: `int` request timeout
+    - url: `str` page requested through the proxy
+
+    ### Returns
+    - `ProxyCheck` kind of the response and request time
+    """
 
-def check_proxy(proxy: str, timeout: int = None) -> bool:
     try:
-        # Send http GET request
-        request = requests.get(
-            url="https://allegro.pl/oferta/typ-c-kabel-quick-charge-3-0-szybkie-ladowanie-7865547535",  # noqa: E501
+        proxy_object = get_proxy_object(proxy)
+        start = time.monotonic()
+
+        # Send http GET request, the session is reused when the proxy is used later
+        request = get_session(proxy_object).get(
+            url=url,
             headers=HEADERS,
             timeout=timeout,
-            proxies={"http": f"https://{proxy}", "https": f"https://{proxy}"},
+            proxies=proxy_object,
         )
 
-        # Parse website
-        soup = BeautifulSoup(request.text, "html.parser")
-
-        if check_captcha(soup):
-            logging.debug("Captcha is required")
-            return False
-        else:
-            return True
+        latency = time.monotonic() - start
     except Exception as e:
         logging.debug("Can't connect to proxy server")
         logging.debug(e)
-        return False
+        return ProxyCheck(proxy, classify_exception(e), None)
+
+    # Proxy is checked without parsing the page
+    kind = classify_response(request)
+
+    if kind is not ResponseKind.OK:
+        logging.debug(f'Got "{kind.value}" response')
+
+    return ProxyCheck(proxy, kind, latency)
+
+
+def check_proxy(proxy: str, timeout: int = None, url: str = PROXY_CHECK_URL) -> bool:
+    return validate_proxy(proxy, timeout, url).working
+
+
+def validate_proxies(
+    proxies: List[str],
+    timeout: int = None,
+    workers: int = None,
+    max_proxies: int = None,
+    url: str = PROXY_CHECK_URL,
+) -> List[ProxyCheck]:
+    """
+    ### Args
+    - proxies: `List[str]` proxies in `ip:port` format
+    - timeout: `int` request timeout
+    - workers: `int` number of proxies checked at once
+    - max_proxies: `int` checking stops when this many working proxies are found
+    - url: `str` page requested through the proxies
 
+    ### Returns
+    - `List[ProxyCheck]` results of checked proxies, working proxies first, fastest first
+    """
 
-def filter_proxies(proxies: List[str], timeout: int = None) -> List[str]:
-    good_proxies = []
+    results: List[ProxyCheck] = []
+    good = 0
 
-    for index, proxy in enumerate(proxies):
-        proxy_is_working = check_proxy(proxy, timeout)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers or DEFAULT_PROXY_CHECK_WORKERS,
+        thread_name_prefix="allegro-proxy-check",
+    )
+    futures = [
+        executor.submit(validate_proxy, proxy, timeout, url) for proxy in proxies
+    ]
 
-        if proxy_is_working is True:
-            good_proxies.append(proxy)
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            if result.working:
+                good += 1
+
+            logging.info(
+                f'Proxy "{result.proxy}" is'
+                f' {"" if result.working else "not "}working'
+                f'{f" ({result.latency:.2f}s)" if result.working else ""}'
+                f" [{len(results)}/{len(proxies)}]"
+            )
+
+            # We have enough proxies
+            if max_proxies is not None and good >= max_proxies:
+                logging.info(f"Found {good} working proxies, stopping")
+                break
+    finally:
+        # Proxies that weren't checked yet are dropped
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+    return sorted(
+        results,
+        key=lambda result: (not result.working, result.latency or 0.0),
+    )
+
+
+def filter_proxies(
+    proxies: List[str],
+    timeout: int = None,
+    workers: int = None,
+    max_proxies: int = None,
+    url: str = PROXY_CHECK_URL,
+    reputation: "ProxyReputation" = None,
+) -> List[str]:
+    """
+    ### Args
+    - proxies: `List[str]` proxies in `ip:port` format
+    - timeout: `int` request timeout
+    - workers: `int` number of proxies checked at once
+    - max_proxies: `int` checking stops when this many working proxies are found
+    - url: `str` page requested through the proxies
+    - reputation: `ProxyReputation` history of proxies, proxies known to be good or
+                                    dead are not checked again
 
-        message = (
-            f'Proxy "{proxy}" is'
-            f' {"" if proxy_is_working is True else "not "}working'
-            f" [{index + 1}/{len(proxies)}]"
+    ### Returns
+    - `List[str]` working proxies, fastest first
+    """
+
+    known_good: List[str] = []
+
+    if reputation is not None:
+        known_good, dead, proxies = reputation.split(proxies)
+
+        logging.info(
+            f"Skipping {len(known_good)} working and {len(dead)} dead proxies"
+            " checked before"
         )
 
-        logging.info(message)
+        # Known good proxies count towards max proxies
+        if max_proxies is not None:
+            if len(known_good) >= max_proxies:
+                return known_good[:max_proxies]
+
+            max_proxies -= len(known_good)
+
+    results = validate_proxies(proxies, timeout, workers, max_proxies, url)
+
+    if reputation is not None:
+        for result in results:
+            reputation.record_check(result)
+
+        reputation.save()
 
-    return good_proxies
+    return known_good + [result.proxy for result in results if result.working]
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import logging
+import statistics
+import threading
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+from allegro.constants import (
+    DEFAULT_PROXY_COOLDOWN,
+    DEFAULT_REPUTATION_DEAD_TTL,
+    DEFAULT_REPUTATION_GOOD_TTL,
+)
+from allegro.proxy.proxy_checker import ProxyCheck
+from allegro.utils import ProxyPool, ProxyStats
+
+# Number of latency samples kept for each proxy
+_MAX_LATENCIES = 20
+
+# Failed checks after which proxy is considered dead
+_DEAD_FAILURES = 3
+
+
+@dataclass
+class ProxyRecord:
+    """
+    ### Overview
+    - History of one proxy, kept between runs.
+
+    ### Public attributes
+    - successes: `int` number of successful requests and checks
+    - failures: `int` number of failed requests and checks
+    - latencies: `List[float]` last check times in seconds
+    - latency: `Optional[float]` moving average of request time from the last run
+    - last_block: `float` `time.time` time of the last block, `0.0` if never blocked
+    - last_check: `float` `time.time` time of the last check
+    - last_check_ok: `bool` whether the last check succeeded
+    """
+
+    successes: int = 0
+    failures: int = 0
+    latencies: List[float] = field(default_factory=list)
+    latency: Optional[float] = None
+    last_block: float = 0.0
+    last_check: float = 0.0
+    last_check_ok: bool = False
+
+    @property
+    def success_rate(self) -> float:
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def median_latency(self) -> Optional[float]:
+        if len(self.latencies) == 0:
+            return None
+
+        return statistics.median(self.latencies)
+
+    @property
+    def expected_latency(self) -> Optional[float]:
+        # Requests of the last run are more recent than checks
+        return self.latency if self.latency is not None else self.median_latency
+
+    def add_latency(self, latency: float):
+        self.latencies.append(latency)
+        del self.latencies[:-_MAX_LATENCIES]
+
+
+class ProxyReputation:
+    """
+    ### Overview
+    - Json file with history of proxies, shared across runs. Used to skip checking
+      proxies known to be good or dead and to give proxy pool initial weights.
+
+    ### Args
+    - path: `str` path to the json file, created if it doesn't exist
+    - good_ttl: `float` number of seconds proxy that worked is not checked again
+    - dead_ttl: `float` number of seconds proxy that didn't work is not checked again
+    """
+
+    def __init__(
+        self,
+        path: str,
+        good_ttl: float = DEFAULT_REPUTATION_GOOD_TTL,
+        dead_ttl: float = DEFAULT_REPUTATION_DEAD_TTL,
+    ):
+        self.path = path
+        self.good_ttl = good_ttl
+        self.dead_ttl = dead_ttl
+
+        self._records: Dict[str, ProxyRecord] = {}
+        self._lock = threading.Lock()
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, proxy: str) -> Optional[ProxyRecord]:
+        return self._records.get(proxy)
+
+    def load(self):
+        """
+        Load records from the json file
+        """
+
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load proxy reputation from {self.path}")
+            logging.debug(e)
+            return
+
+        with self._lock:
+            self._records = {
+                proxy: ProxyRecord(**record) for proxy, record in data.items()
+            }
+
+    def save(self):
+        """
+        Save records to the json file
+        """
+
+        with self._lock:
+            data = {proxy: asdict(record) for proxy, record in self._records.items()}
+
+        # Write to temporary file first, so the file is never left half written
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+
+        os.replace(temp_path, self.path)
+
+    def record_check(self, result: ProxyCheck):
+        """
+        ### Args
+        - result: `ProxyCheck` result of proxy check
+        """
+
+        with self._lock:
+            record = self._records.setdefault(result.proxy, ProxyRecord())
+            record.last_check = time.time()
+            record.last_check_ok = result.working
+
+            if result.working:
+                record.successes += 1
+
+                if result.latency is not None:
+                    record.add_latency(result.latency)
+            else:
+                record.failures += 1
+
+                if result.kind.blocked:
+                    record.last_block = record.last_check
+
+    def record_pool(self, pool: ProxyPool):
+        """
+        ### Args
+        - pool: `ProxyPool` pool created by `get_pool`, its stats replace the records
+        """
+
+        with self._lock:
+            for proxy in pool:
+                stats = pool.get_stats(proxy)
+                record = self._records.setdefault(proxy, ProxyRecord())
+
+                record.successes = stats.successes
+                record.failures = stats.failures
+                record.last_block = max(record.last_block, stats.last_block)
+
+                # Pool keeps moving average, it's not mixed with check samples
+                if stats.latency is not None:
+                    record.latency = stats.latency
+
+    def split(self, proxies: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        ### Args
+        - proxies: `List[str]` proxies in `ip:port` format
+
+        ### Returns
+        - `Tuple[List[str], List[str], List[str]]` proxies known to be good, known to
+          be dead and proxies that have to be checked
+        """
+
+        now = time.time()
+        good, dead, unknown = [], [], []
+
+        for proxy in proxies:
+            record = self._records.get(proxy)
+
+            if record is None or record.last_check == 0.0:
+                unknown.append(proxy)
+            elif record.last_check_ok and now - record.last_check < self.good_ttl:
+                good.append(proxy)
+            elif (
+                not record.last_check_ok
+                and record.failures >= _DEAD_FAILURES
+                and record.success_rate < 0.25
+                and now - record.last_check < self.dead_ttl
+            ):
+                dead.append(proxy)
+            else:
+                unknown.append(proxy)
+
+        # Known good proxies, fastest first
+        good.sort(key=lambda proxy: self._records[proxy].expected_latency or 0.0)
+
+        return good, dead, unknown
+
+    def get_pool(self, proxies: List[str]) -> ProxyPool:
+        """
+        ### Args
+        - proxies: `List[str]` proxies in `ip:port` format
+
+        ### Returns
+        - `ProxyPool` pool with weights and quarantines from the records
+        """
+
+        now = time.time()
+        monotonic_now = time.monotonic()
+        stats = {}
+
+        for proxy in proxies:
+            record = self._records.get(proxy)
+            if record is None:
+                continue
+
+            # Recently blocked proxies stay in quarantine
+            cooldown_left = record.last_block + DEFAULT_PROXY_COOLDOWN - now
+
+            stats[proxy] = ProxyStats(
+                successes=record.successes,
+                failures=record.failures,
+                latency=record.expected_latency,
+                blocked_until=monotonic_now + cooldown_left if cooldown_left > 0 else 0.0,
+                last_block=record.last_block,
+            )
+
+        return ProxyPool(proxies, stats=stats)
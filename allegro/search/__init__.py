@@ -1,4 +1,43 @@
 # flake8: noqa
 
-from allegro.search.crawler import search, crawl
-from allegro.search.product import Product, parse_products
+from allegro.search.crawler import (
+    search,
+    crawl,
+    iter_search,
+    iter_crawl,
+    async_search,
+    async_crawl,
+    async_iter_search,
+    async_iter_crawl,
+    crawl_many,
+    iter_crawl_many,
+    async_crawl_many,
+)
+from allegro.search.product import (
+    Product,
+    UnsupportedOfferError,
+    parse_products,
+    async_parse_products,
+    scrape_offers,
+    iter_offers,
+    async_iter_offers,
+)
+from allegro.search.pool import WorkerPool
+from allegro.search.dedup import SeenOffers, get_offer_id
+from allegro.search.index import OfferIndex
+from allegro.search.checkpoint import Checkpoint, QueryProgress, get_checkpoint
+from allegro.search.scheduler import iter_queries
+from allegro.search.work_queue import (
+    Task,
+    WorkQueue,
+    MemoryQueue,
+    SQLiteQueue,
+    RedisQueue,
+    get_work_queue,
+)
+from allegro.search.distributed import (
+    run_task,
+    run_worker,
+    distributed_crawl,
+    iter_distributed_crawl,
+)
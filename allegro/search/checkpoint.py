@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from allegro.constants import DEFAULT_CHECKPOINT_INTERVAL
+from allegro.search.dedup import SeenOffers, get_offer_id
+from allegro.search.product import Product
+
+# Checkpoints shared by all crawls saving to the same file
+_checkpoints: Dict[str, "Checkpoint"] = {}
+_checkpoints_lock = threading.Lock()
+
+
+class QueryProgress:
+    """
+    ### Overview
+    - Progress of one query, changed by the crawl and saved by its checkpoint.
+
+    ### Public attributes
+    - page: `int` last listing page with all offers queued, `0` if none
+    - scrapped: `int` number of products returned so far
+    - listed: `bool` whether all listing pages were walked
+    - done: `bool` whether the query was finished
+    """
+
+    def __init__(self, checkpoint: "Checkpoint", data: dict):
+        self._checkpoint = checkpoint
+        self._data = data
+
+    @property
+    def page(self) -> int:
+        return self._data["page"]
+
+    @property
+    def scrapped(self) -> int:
+        return self._data["scrapped"]
+
+    @property
+    def listed(self) -> bool:
+        return self._data["listed"]
+
+    @property
+    def done(self) -> bool:
+        return self._data["done"]
+
+    def seed(self, seen: SeenOffers):
+        """
+        ### Args
+        - seen: `SeenOffers` set filled with completed and pending offers
+        """
+
+        with self._checkpoint._lock:
+            seen.update(self._data["completed"])
+            seen.update(self._data["pending"])
+
+    def get_pending(self) -> List[Union[Product, Tuple[str, Optional[str]]]]:
+        """
+        ### Returns
+        - `List[Union[Product, Tuple[str, Optional[str]]]]` queued offers that weren't
+          completed, products made from listing page or urls with fingerprints
+        """
+
+        with self._checkpoint._lock:
+            pending = list(self._data["pending"].values())
+
+        return [
+            Product.from_data_dump(item["product"])
+            if item.get("product") is not None
+            else (item["url"], item.get("fingerprint"))
+            for item in pending
+        ]
+
+    def add_pending(self, item: Union[Product, Tuple[str, Optional[str]]]):
+        """
+        ### Args
+        - item: `Union[Product, Tuple[str, Optional[str]]]` offer put in the queue
+        """
+
+        entry: Dict[str, Optional[str]]
+        if isinstance(item, Product):
+            url = item.url
+            entry = {"url": url, "product": item.get_data_dump()}
+        else:
+            url, fingerprint = item
+            entry = {"url": url, "fingerprint": fingerprint}
+
+        with self._checkpoint._lock:
+            self._data["pending"][get_offer_id(url)] = entry
+
+    def complete(self, url: str, counted: bool = True):
+        """
+        ### Args
+        - url: `str` url of the completed offer
+        - counted: `bool` whether product was returned, `False` for adverts and auctions
+        """
+
+        offer_id = get_offer_id(url)
+
+        with self._checkpoint._lock:
+            self._data["pending"].pop(offer_id, None)
+            self._data["completed"].append(offer_id)
+
+            if counted:
+                self._data["scrapped"] += 1
+
+        self._checkpoint._changed(force=False)
+
+    def page_done(self, page: int):
+        """
+        ### Args
+        - page: `int` listing page with all offers queued
+        """
+
+        with self._checkpoint._lock:
+            self._data["page"] = page
+
+        self._checkpoint._changed(force=False)
+
+    def listing_done(self):
+        """
+        Mark all listing pages as walked
+        """
+
+        with self._checkpoint._lock:
+            self._data["listed"] = True
+
+        self._checkpoint._changed(force=False)
+
+    def save(self):
+        """
+        Save the checkpoint
+        """
+
+        self._checkpoint._changed()
+
+    def finish(self):
+        """
+        Mark query as finished and save the checkpoint
+        """
+
+        with self._checkpoint._lock:
+            self._data["done"] = True
+            self._data["pending"] = {}
+
+        self._checkpoint._changed()
+
+
+class Checkpoint:
+    """
+    ### Overview
+    - Crawl progress saved to a json file, so interrupted crawls can be resumed.
+      Each query keeps its last listing page, completed offer ids and offers that
+      were queued but not completed.
+
+    ### Args
+    - path: `str` path to the json file, loaded if it exists
+    - interval: `float` min number of seconds between saves made during the crawl
+    - autosave: `bool` save when progress changes, if `False` the checkpoint is saved
+                       only by calling `save`, ex. after products are flushed to the output
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+        autosave: bool = True,
+    ):
+        self.path = path
+        self.interval = interval
+        self.autosave = autosave
+
+        self._queries: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self._last_save = time.monotonic()
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._queries))
+
+    def load(self):
+        """
+        Load progress from the json file
+        """
+
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load checkpoint from {self.path}")
+            logging.debug(e)
+            return
+
+        with self._lock:
+            self._queries = data.get("queries", {})
+
+    def save(self, force: bool = True):
+        """
+        ### Args
+        - force: `bool` save even if the last save was less than `interval` seconds ago
+        """
+
+        with self._lock:
+            if not force and time.monotonic() - self._last_save < self.interval:
+                return
+
+            self._last_save = time.monotonic()
+            data = json.dumps({"queries": self._queries}, ensure_ascii=False)
+
+            # Write to temporary file first, so the file is never left half written
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(data)
+
+            os.replace(temp_path, self.path)
+
+    def _changed(self, force: bool = True):
+        # Progress of queries changed, checkpoint without autosave is saved by its owner
+        if self.autosave:
+            self.save(force)
+
+    def clear(self):
+        """
+        Forget progress of all queries
+        """
+
+        with self._lock:
+            self._queries = {}
+
+        self.save()
+
+    def get_progress(self, key: str, resume: bool = True) -> QueryProgress:
+        """
+        ### Args
+        - key: `str` key of the query, search term with filters
+        - resume: `bool` keep saved progress, if `False` the query starts from scratch
+
+        ### Returns
+        - `QueryProgress` progress of the query
+        """
+
+        with self._lock:
+            data = self._queries.get(key)
+
+            if data is None or not resume:
+                data = self._queries[key] = {
+                    "page": 0,
+                    "scrapped": 0,
+                    "listed": False,
+                    "done": False,
+                    "completed": [],
+                    "pending": {},
+                }
+
+            return QueryProgress(self, data)
+
+
+def get_checkpoint(path: str) -> Checkpoint:
+    """
+    ### Args
+    - path: `str` path to the json file
+
+    ### Returns
+    - `Checkpoint` checkpoint shared by all crawls saving to this file
+    """
+
+    key = os.path.abspath(path)
+
+    with _checkpoints_lock:
+        checkpoint = _checkpoints.get(key)
+
+        if checkpoint is None:
+            checkpoint = _checkpoints[key] = Checkpoint(path)
+
+        return checkpoint
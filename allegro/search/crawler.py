@@ -1,29 +1,183 @@
+import asyncio
 import logging
 
-from typing import List
+from functools import partial
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from types import FunctionType
-from allegro.constants import FILTERS
+from allegro.constants import FILTERS, DEFAULT_MAX_QUERIES
 from allegro.types import Filters, Options
-from allegro.utils import get_soup
-from allegro.search.product import parse_products, Product
+from allegro.utils import (
+    get_soup,
+    async_get_soup,
+    set_parser_backend,
+    set_cache,
+    cache_from_options,
+    set_rate_limiter,
+    get_rate_limiter,
+    rate_limiter_from_options,
+    set_retry_policy,
+    get_retry_policy,
+    retry_policy_from_options,
+)
+from allegro.search.pool import WorkerPool
+from allegro.search.dedup import SeenOffers
+from allegro.search.index import OfferIndex
+from allegro.search.checkpoint import QueryProgress, get_checkpoint
+from allegro.search.scheduler import iter_queries
+from allegro.search.pipeline import iter_pipeline, async_iter_pipeline, _get_offer_item
+from allegro.search.product import (
+    LISTING_STRAINER,
+    Product,
+    async_iter_offers,
+    find_offer_sections,
+    iter_offers,
+)
+
+
+def _build_query_string(filters: Filters = None) -> str:
+    # List containing query filters for product
+    query = []
 
+    # init empty query string
+    query_string = ""
 
-def search(
-    search_term: str, options: Options = None, proxies: List[str] = None
-) -> List[Product]:
+    if filters is not None:
+        for key, value in filters.items():
+            # skip filters with None value
+            if value is None:
+                continue
+
+            if type(value) == bool and value is True:
+                query.append(FILTERS[key])
+            elif type(value) == list:
+                query.extend([FILTERS[key][val] for val in value])  # type: ignore
+            elif type(FILTERS[key]) == FunctionType:  # type: ignore
+                query.append(FILTERS[key](value))  # type: ignore
+            elif type(value) == str:
+                if FILTERS[key][value] is not None:  # type: ignore
+                    query.append(FILTERS[key][value])  # type: ignore
+            else:
+                logging.warning(f"Unhandled type {type(value)} of value {value}")
+
+        # Create query string
+        if len(query) >= 1:
+            for q in query:
+                query_string += f"&{q}"
+
+    return query_string
+
+
+def _apply_options(options: Options = None):
+    # Parser backend is set for the whole process, it's checked by set_parser_backend
+    parser_backend = options.get("parser_backend") if options is not None else None
+    if parser_backend is not None:
+        set_parser_backend(parser_backend)
+
+    # Response cache is set for the whole process
+    if options is not None and options.get("cache_dir") is not None:
+        set_cache(cache_from_options(options))
+
+    # Rate limits are set for the whole process, buckets are kept between calls,
+    # part of the limits left to this process by a process pool is kept too
+    rate_limiter = rate_limiter_from_options(options) if options is not None else None
+    current = get_rate_limiter()
+    if rate_limiter is not None and (
+        current is None
+        or rate_limiter.get_settings() not in (current.get_settings(), current.split_from)
+    ):
+        set_rate_limiter(rate_limiter)
+
+    # Retry budget is kept between calls with the same settings
+    retry_policy = retry_policy_from_options(options) if options is not None else None
+    current_policy = get_retry_policy()
+    if retry_policy is not None and retry_policy.get_settings() not in (
+        current_policy.get_settings(),
+        current_policy.split_from,
+    ):
+        set_retry_policy(retry_policy)
+
+
+def _load_progress(
+    search_term: str, query_string: str, options: Options = None
+) -> Optional[QueryProgress]:
+    if options is None:
+        return None
+
+    checkpoint_path = options.get("checkpoint_path")
+    if checkpoint_path is None:
+        return None
+
+    # Same search term with other filters is another query
+    progress = get_checkpoint(checkpoint_path).get_progress(
+        f"{search_term}{query_string}", resume=bool(options.get("resume"))
+    )
+
+    if progress.done:
+        logging.info(f'Crawl of "{search_term}" was already finished, skipping')
+    elif progress.page > 0:
+        logging.info(
+            f'Resuming crawl of "{search_term}" from {progress.page + 1} page, '
+            f"{progress.scrapped} products were already scrapped"
+        )
+
+    return progress
+
+
+def _split_sections(
+    sections: list, options: Options = None, seen: SeenOffers = None
+) -> Tuple[List[Product], List[str]]:
+    # Products made from listing page and urls of offers that have to be scraped
+    ready: List[Product] = []
+    urls: List[str] = []
+
+    if seen is None:
+        seen = SeenOffers()
+
+    if options is not None:
+        listing_only = bool(options.get("listing_only"))
+        fetch_if = options.get("fetch_if")
+    else:
+        listing_only = False
+        fetch_if = None
+
+    for section in sections:
+        item = _get_offer_item(
+            section, seen, listing_only=listing_only, fetch_if=fetch_if
+        )
+
+        if isinstance(item, Product):
+            ready.append(item)
+        elif item is not None:
+            urls.append(item[0])
+
+    return ready, urls
+
+
+def _get_search_url(search_term: str) -> str:
+    # create url and encode spaces
+    return f"https://allegro.pl/listing?string={search_term}".replace(" ", "%20")
+
+
+def iter_search(
+    search_term: str,
+    options: Options = None,
+    proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
+) -> Iterator[Product]:
     """
     ### Args
     - search_term: `str` name of the searched item
+    - options: `Options` search options
+    - proxies: `List[str]` proxies list
+    - pool: `WorkerPool` shared pool used to scrape offers
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
 
     ### Returns
-    - `List[Product]` list containing scrapped products
+    - `Iterator[Product]` scrapped products, yielded as soon as they are scrapped
     """
 
-    # Products list
-    products = []
-
-    # Current product
-    product = None
+    _apply_options(options)
 
     # Set settings
     if options is not None:
@@ -31,120 +185,87 @@ def search(
     else:
         timeout = None
 
-    # create url and encode spaces
-    url = f"https://allegro.pl/listing?string={search_term}".replace(" ", "%20")
-
     # Try to parse url
-    soup = get_soup(url=url, proxies=proxies)
+    soup = get_soup(
+        url=_get_search_url(search_term),
+        proxies=proxies,
+        timeout=timeout,
+        parse_only=LISTING_STRAINER,
+    )
 
     # Find all products on a page, each section is one product
-    sections = soup.find_all(
-        "article",
-        attrs={
-            "data-role": "offer",
-            "data-analytics-view-custom-index0": True,
-            "data-analytics-view-custom-deliverylabel": True,
-            "data-analytics-view-custom-page": True,
-            "data-analytics-view-value": True,
-        },
-    )
+    sections = find_offer_sections(soup)
 
-    # Number of products found
-    products_number = len(sections)
-
-    logging.info(f"Found {products_number} products")
-    for index, section in enumerate(sections):
-        # Find url to product in a tag
-        product_link = section.find("a", attrs={"rel": "nofollow", "tabindex": "-1"})
-
-        try:
-            product = Product.from_url(
-                url=product_link.get("href"), proxies=proxies, timeout=timeout
-            )
-        except ValueError as e:
-            raise e
-        except NotImplementedError:
-            logging.info(
-                f'Ignoring "{product_link}" '
-                "because it's advert or auction "
-                f"[{index + 1}/{products_number}]"
-            )
-            continue
-
-        if product is not None:
-            if logging.DEBUG >= logging.root.level:
-                message = (
-                    f'Scraping "{product.name}" '
-                    f'with url "{product.url}" '
-                    f"[{index + 1}/{products_number}]"
-                )
-            else:
-                message = (
-                    f'Scraping "{product.name}" ' f"[{index + 1}/{products_number}]"
-                )
+    logging.info(f"Found {len(sections)} products")
 
-            logging.info(message)
+    ready, products_urls = _split_sections(sections, options, seen)
 
-            # Add product to list
-            products.append(product)
+    # Products made from listing page are not scraped
+    yield from ready
 
-    # Return list with products
-    return products
+    # Scrape all products from the page
+    yield from iter_offers(
+        products_urls,
+        proxies=proxies,
+        timeout=timeout,
+        pool=pool,
+    )
 
 
-def crawl(
+def search(
     search_term: str,
     options: Options = None,
-    filters: Filters = None,
     proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
 ) -> List[Product]:
     """
     ### Args
     - search_term: `str` name of the searched item
     - options: `Options` search options
-    - filters: `Filters` product filters
-    - proxies: `List[str]` dictionary containing proxy
+    - proxies: `List[str]` proxies list
+    - pool: `WorkerPool` shared pool used to scrape offers
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
 
     ### Returns
     - `List[Product]` list containing scrapped products
     """
 
-    # No options so we default to results from first page
-    if options is None and filters is None:
-        logging.warning("No options and filters, scraping only first page")
-        return search(search_term)
+    return list(iter_search(search_term, options, proxies, pool, seen))
 
-    # List containing query filters for product
-    query = []
 
-    # Products list
-    products: List[Product] = []
+def iter_crawl(
+    search_term: str,
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
+) -> Iterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options
+    - filters: `Filters` product filters
+    - proxies: `List[str]` proxies list
+    - pool: `WorkerPool` shared pool used to scrape offers, if `None` and `threads`
+                         option is set, one pool is created for the whole crawl
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
 
-    # init empty query string
-    query_string = ""
+    ### Returns
+    - `Iterator[Product]` scrapped products, yielded as soon as they are scrapped
+    """
 
-    if filters is not None:
-        for key, value in filters.items():
-            # skip filters with None value
-            if value is None:
-                continue
+    # No options so we default to results from first page
+    if options is None and filters is None:
+        logging.warning("No options and filters, scraping only first page")
+        yield from iter_search(search_term, pool=pool, seen=seen)
+        return
 
-            if type(value) == bool and value is True:
-                query.append(FILTERS[key])
-            elif type(value) == list:
-                query.extend([FILTERS[key][val] for val in value])  # type: ignore
-            elif type(FILTERS[key]) == FunctionType:  # type: ignore
-                query.append(FILTERS[key](value))  # type: ignore
-            elif type(value) == str:
-                if FILTERS[key][value] is not None:  # type: ignore
-                    query.append(FILTERS[key][value])  # type: ignore
-            else:
-                logging.warning(f"Unhandled type {type(value)} of value {value}")
+    _apply_options(options)
 
-        # Create query string
-        if len(query) >= 1:
-            for q in query:
-                query_string += f"&{q}"
+    # Create query string from filters
+    query_string = _build_query_string(filters)
 
     if options is not None:
         start_page = options.get("start_page")
@@ -152,14 +273,22 @@ def crawl(
         max_results = options.get("max_results")
         timeout = options.get("request_timeout")
         threads = options.get("threads")
+        worker_kind = options.get("worker_kind")
+        queue_size = options.get("queue_size")
+        index_path = options.get("index_path")
+        listing_only = bool(options.get("listing_only"))
+        fetch_if = options.get("fetch_if")
     else:
         start_page = None
         pages_to_fetch = None
         max_results = None
         timeout = None
         threads = None
-
-    remaining_items = None
+        worker_kind = None
+        queue_size = None
+        index_path = None
+        listing_only = False
+        fetch_if = None
 
     if start_page is None:
         start_page = 1
@@ -170,60 +299,421 @@ def crawl(
     if pages_to_fetch is not None:
         logging.info(f"Will fetch {pages_to_fetch} pages")
 
-        for page_num in range(start_page, pages_to_fetch + 1):
-            # TODO: CHECK IF WE'VE REACHED LAST PAGE
-            logging.info(f"Fetching {page_num} page")
+    # Progress saved by interrupted crawl
+    progress = _load_progress(search_term, query_string, options)
+    if progress is not None:
+        if progress.done:
+            return
+
+        # Completed and pending offers are not queued again by the listing walk
+        if seen is None:
+            seen = SeenOffers()
+        progress.seed(seen)
+
+        if progress.page > 0:
+            start_page = progress.page + 1
+
+    # Pool is owned by the crawl, it's reused by every page
+    owned_pool = None
+    if pool is None and threads is not None:
+        owned_pool = pool = WorkerPool(threads, worker_kind or "process")
+
+    # Offers from previous crawls, only new and changed offers are scraped
+    index = OfferIndex(index_path) if index_path is not None else None
+
+    try:
+        # Listing pages are fetched ahead while offers are scraped
+        yield from iter_pipeline(
+            search_term=search_term,
+            query_string=query_string,
+            start_page=start_page,
+            pages_to_fetch=pages_to_fetch,
+            max_results=max_results,
+            proxies=proxies,
+            timeout=timeout,
+            pool=pool,
+            queue_size=queue_size,
+            seen=seen,
+            index=index,
+            listing_only=listing_only,
+            fetch_if=fetch_if,
+            progress=progress,
+        )
+    finally:
+        if owned_pool is not None:
+            owned_pool.shutdown()
+
+        if index is not None:
+            index.close()
 
-            if max_results is not None:
-                remaining_items = max_results - len(products)
 
-            # Fetch offers
-            offers = parse_products(
-                search_term=search_term,
-                page_num=page_num,
-                query_string=query_string,
-                proxies=proxies,
-                timeout=timeout,
-                max_results=remaining_items,
-                threads=threads,
-            )
+def crawl(
+    search_term: str,
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
+) -> List[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options
+    - filters: `Filters` product filters
+    - proxies: `List[str]` dictionary containing proxy
+    - pool: `WorkerPool` shared pool used to scrape offers, if `None` and `threads`
+                         option is set, one pool is created for the whole crawl
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+
+    ### Returns
+    - `List[Product]` list containing scrapped products
+    """
+
+    products = list(iter_crawl(search_term, options, filters, proxies, pool, seen))
+
+    logging.info(f"Fetched {len(products)} products")
 
-            # add new products to products list
-            products.extend(offers[0])
+    # return products
+    return products
 
-            logging.info(f"Fetched {len(products)} products from {page_num} pages")
 
-            # Stop crawling
-            if offers[1] is False:
-                break
+def iter_crawl_many(
+    search_terms: List[str],
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
+) -> Iterator[Tuple[str, Product]]:
+    """
+    ### Args
+    - search_terms: `List[str]` names of the searched items
+    - options: `Options` search options, `max_queries` limits queries crawled at once
+    - filters: `Filters` product filters, shared by all queries
+    - proxies: `List[str]` proxies list
+    - pool: `WorkerPool` shared pool used to scrape offers, if `None` and `threads`
+                         option is set, one pool is created for all queries
+    - seen: `SeenOffers` offers already scraped, shared by all queries
+
+    ### Returns
+    - `Iterator[Tuple[str, Product]]` search term and its product, yielded as soon as
+                                      they are scrapped
+    """
+
+    _apply_options(options)
+
+    if options is not None:
+        threads = options.get("threads")
+        worker_kind = options.get("worker_kind")
+        max_queries = options.get("max_queries")
+    else:
+        threads = None
+        worker_kind = None
+        max_queries = None
+
+    # One pool limits offers fetched at once by all queries
+    owned_pool = None
+    if pool is None and threads is not None:
+        owned_pool = pool = WorkerPool(threads, worker_kind or "process")
+
+    queries = [
+        (
+            search_term,
+            partial(iter_crawl, search_term, options, filters, proxies, pool, seen),
+        )
+        for search_term in dict.fromkeys(search_terms)
+    ]
+
+    try:
+        yield from iter_queries(queries, max_queries)
+    finally:
+        if owned_pool is not None:
+            owned_pool.shutdown()
+
+
+def crawl_many(
+    search_terms: List[str],
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    pool: WorkerPool = None,
+    seen: SeenOffers = None,
+) -> Dict[str, List[Product]]:
+    """
+    ### Args
+    - search_terms: `List[str]` names of the searched items
+    - options: `Options` search options, `max_queries` limits queries crawled at once
+    - filters: `Filters` product filters, shared by all queries
+    - proxies: `List[str]` proxies list
+    - pool: `WorkerPool` shared pool used to scrape offers, if `None` and `threads`
+                         option is set, one pool is created for all queries
+    - seen: `SeenOffers` offers already scraped, shared by all queries
+
+    ### Returns
+    - `Dict[str, List[Product]]` scrapped products of each search term
+    """
+
+    products: Dict[str, List[Product]] = {term: [] for term in search_terms}
+
+    for search_term, product in iter_crawl_many(
+        search_terms, options, filters, proxies, pool, seen
+    ):
+        products[search_term].append(product)
+
+    logging.info(
+        f"Fetched {sum(len(value) for value in products.values())} products "
+        f"for {len(products)} queries"
+    )
+
+    return products
+
+
+async def async_iter_search(
+    search_term: str,
+    options: Options = None,
+    proxies: List[str] = None,
+    seen: SeenOffers = None,
+) -> AsyncIterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options, `concurrency` limits offers fetched at once
+    - proxies: `List[str]` proxies list
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+
+    ### Returns
+    - `AsyncIterator[Product]` scrapped products, yielded as soon as they are scrapped
+    """
+
+    _apply_options(options)
+
+    if options is not None:
+        timeout = options.get("request_timeout")
+        concurrency = options.get("concurrency")
     else:
-        # Start number
-        page_num = start_page
-
-        # Start loop
-        while True:
-            # Fetch offers
-            offers = parse_products(
-                search_term=search_term,
-                page_num=page_num,
-                query_string=query_string,
-                proxies=proxies,
-                timeout=timeout,
-                max_results=max_results,
-                threads=threads,
-            )
-
-            # add new products to products list
-            products.extend(offers[0])
-
-            logging.info(f"Fetched {len(products)} products from {page_num} pages")
-
-            # Stop crawling
-            if offers[1] is False:
-                break
-
-            # increase page num
-            page_num += 1
+        timeout = None
+        concurrency = None
+
+    # Try to parse url
+    soup = await async_get_soup(
+        _get_search_url(search_term),
+        proxies,
+        timeout,
+        concurrency,
+        parse_only=LISTING_STRAINER,
+    )
+
+    # Find all products on a page, each section is one product
+    sections = find_offer_sections(soup)
+
+    logging.info(f"Found {len(sections)} products")
+
+    ready, products_urls = _split_sections(sections, options, seen)
+
+    # Products made from listing page are not scraped
+    for product in ready:
+        yield product
+
+    # Scrape all products from the page
+    async for product in async_iter_offers(
+        products_urls,
+        proxies=proxies,
+        timeout=timeout,
+        concurrency=concurrency,
+    ):
+        yield product
+
+
+async def async_search(
+    search_term: str,
+    options: Options = None,
+    proxies: List[str] = None,
+    seen: SeenOffers = None,
+) -> List[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options, `concurrency` limits offers fetched at once
+    - proxies: `List[str]` proxies list
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+
+    ### Returns
+    - `List[Product]` list containing scrapped products
+    """
+
+    return [
+        product
+        async for product in async_iter_search(search_term, options, proxies, seen)
+    ]
+
+
+async def async_iter_crawl(
+    search_term: str,
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    seen: SeenOffers = None,
+) -> AsyncIterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options, `concurrency` limits offers fetched at once
+    - filters: `Filters` product filters
+    - proxies: `List[str]` proxies list
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+
+    ### Returns
+    - `AsyncIterator[Product]` scrapped products, yielded as soon as they are scrapped
+    """
+
+    # No options so we default to results from first page
+    if options is None and filters is None:
+        logging.warning("No options and filters, scraping only first page")
+        async for product in async_iter_search(search_term, seen=seen):
+            yield product
+
+        return
+
+    _apply_options(options)
+
+    # Create query string from filters
+    query_string = _build_query_string(filters)
+
+    if options is not None:
+        start_page = options.get("start_page")
+        pages_to_fetch = options.get("pages_to_fetch")
+        max_results = options.get("max_results")
+        timeout = options.get("request_timeout")
+        concurrency = options.get("concurrency")
+        queue_size = options.get("queue_size")
+        index_path = options.get("index_path")
+        listing_only = bool(options.get("listing_only"))
+        fetch_if = options.get("fetch_if")
+    else:
+        start_page = None
+        pages_to_fetch = None
+        max_results = None
+        timeout = None
+        concurrency = None
+        queue_size = None
+        index_path = None
+        listing_only = False
+        fetch_if = None
+
+    if start_page is None:
+        start_page = 1
+
+    if max_results is not None:
+        logging.info(f"Max results {max_results}")
+
+    if pages_to_fetch is not None:
+        logging.info(f"Will fetch {pages_to_fetch} pages")
+
+    # Progress saved by interrupted crawl
+    progress = _load_progress(search_term, query_string, options)
+    if progress is not None:
+        if progress.done:
+            return
+
+        # Completed and pending offers are not queued again by the listing walk
+        if seen is None:
+            seen = SeenOffers()
+        progress.seed(seen)
+
+        if progress.page > 0:
+            start_page = progress.page + 1
+
+    # Offers from previous crawls, only new and changed offers are scraped
+    index = OfferIndex(index_path) if index_path is not None else None
+
+    try:
+        # Listing pages are fetched ahead while offers are scraped
+        async for product in async_iter_pipeline(
+            search_term=search_term,
+            query_string=query_string,
+            start_page=start_page,
+            pages_to_fetch=pages_to_fetch,
+            max_results=max_results,
+            proxies=proxies,
+            timeout=timeout,
+            concurrency=concurrency,
+            queue_size=queue_size,
+            seen=seen,
+            index=index,
+            listing_only=listing_only,
+            fetch_if=fetch_if,
+            progress=progress,
+        ):
+            yield product
+    finally:
+        if index is not None:
+            index.close()
+
+
+async def async_crawl(
+    search_term: str,
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    seen: SeenOffers = None,
+) -> List[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - options: `Options` search options, `concurrency` limits offers fetched at once
+    - filters: `Filters` product filters
+    - proxies: `List[str]` proxies list
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+
+    ### Returns
+    - `List[Product]` list containing scrapped products
+    """
+
+    products = [
+        product
+        async for product in async_iter_crawl(
+            search_term, options, filters, proxies, seen
+        )
+    ]
+
+    logging.info(f"Fetched {len(products)} products")
 
     # return products
     return products
+
+
+async def async_crawl_many(
+    search_terms: List[str],
+    options: Options = None,
+    filters: Filters = None,
+    proxies: List[str] = None,
+    seen: SeenOffers = None,
+) -> Dict[str, List[Product]]:
+    """
+    ### Args
+    - search_terms: `List[str]` names of the searched items
+    - options: `Options` search options, `max_queries` limits queries crawled at once and
+                         `concurrency` limits requests sent at once by all queries
+    - filters: `Filters` product filters, shared by all queries
+    - proxies: `List[str]` proxies list
+    - seen: `SeenOffers` offers already scraped, shared by all queries
+
+    ### Returns
+    - `Dict[str, List[Product]]` scrapped products of each search term
+    """
+
+    max_queries = options.get("max_queries") if options is not None else None
+    semaphore = asyncio.Semaphore(max_queries or DEFAULT_MAX_QUERIES)
+
+    async def crawl_one(search_term: str) -> List[Product]:
+        async with semaphore:
+            try:
+                return await async_crawl(search_term, options, filters, proxies, seen)
+            except Exception as e:
+                logging.error(f'Query "{search_term}" failed: {e}')
+                return []
+
+    search_terms = list(dict.fromkeys(search_terms))
+    results = await asyncio.gather(*(crawl_one(term) for term in search_terms))
+
+    return dict(zip(search_terms, results))
@@ -0,0 +1,101 @@
+import re
+import logging
+import threading
+
+from typing import Iterable, List, Set
+from urllib.parse import urlsplit, parse_qs
+
+# Offer id is the number at the end of the offer path
+_OFFER_ID_PATTERN = re.compile(r"/oferta/(?:[^/]*-)?(\d+)/?$")
+
+
+def get_offer_id(url: str) -> str:
+    """
+    ### Args
+    - url: `str` url of the offer page or `events/clicks` redirect to it
+
+    ### Returns
+    - `str` offer id, url without query string if the id can't be found
+    """
+
+    parts = urlsplit(url)
+
+    # Sponsored offers are linked through click tracking redirect
+    if parts.path.rstrip("/").endswith("/events/clicks"):
+        redirect = parse_qs(parts.query).get("redirect")
+        if redirect:
+            return get_offer_id(redirect[0])
+
+    match = _OFFER_ID_PATTERN.search(parts.path)
+    if match is not None:
+        return match.group(1)
+
+    return f"{parts.netloc.lower()}{parts.path}"
+
+
+class SeenOffers:
+    """
+    ### Overview
+    - Thread safe set of offer ids, used to skip offers that were already queued
+      by other pages or queries, before any request is sent.
+    """
+
+    def __init__(self):
+        self._ids: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, url: str) -> bool:
+        return get_offer_id(url) in self._ids
+
+    def add(self, url: str) -> bool:
+        """
+        ### Args
+        - url: `str` url of the offer page
+
+        ### Returns
+        - `bool` `True` if offer wasn't seen before
+        """
+
+        offer_id = get_offer_id(url)
+
+        with self._lock:
+            if offer_id in self._ids:
+                logging.debug(f'Skipping duplicate offer "{offer_id}"')
+                return False
+
+            self._ids.add(offer_id)
+
+        return True
+
+    def update(self, offer_ids: Iterable[str]):
+        """
+        ### Args
+        - offer_ids: `Iterable[str]` ids of offers that should be skipped
+        """
+
+        with self._lock:
+            self._ids.update(offer_ids)
+
+    def discard(self, offer_ids: Iterable[str]):
+        """
+        ### Args
+        - offer_ids: `Iterable[str]` ids of offers that were queued but not scraped,
+                                     other queries can queue them again
+        """
+
+        with self._lock:
+            self._ids.difference_update(offer_ids)
+
+    def filter(self, urls: List[str]) -> List[str]:
+        """
+        ### Args
+        - urls: `List[str]` urls of offer pages
+
+        ### Returns
+        - `List[str]` urls of offers that weren't seen before
+        """
+
+        return [url for url in urls if self.add(url)]
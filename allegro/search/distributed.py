@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+
+from typing import Iterator, List, Optional, Set
+from allegro.constants import DEFAULT_WORKER_IDLE_TIMEOUT
+from allegro.types import Filters, Options
+from allegro.utils import get_soup, get_metrics
+from allegro.search.crawler import _apply_options, _build_query_string
+from allegro.search.dedup import SeenOffers, get_offer_id
+from allegro.search.product import (
+    LISTING_STRAINER,
+    Product,
+    UnsupportedOfferError,
+    _get_listing_url,
+    find_offer_sections,
+    find_offer_url,
+    is_last_page,
+)
+from allegro.search.work_queue import Task, WorkQueue
+
+# Number of seconds between checks of the queue
+_POLL_INTERVAL = 0.5
+
+
+def _put_listing(
+    work_queue: WorkQueue,
+    group: str,
+    search_term: str,
+    query_string: str,
+    page_num: int,
+    pages_to_fetch: Optional[int],
+):
+    work_queue.put(
+        f"listing:{group}:{page_num}",
+        "listing",
+        {
+            "search_term": search_term,
+            "query_string": query_string,
+            "page": page_num,
+            "pages_to_fetch": pages_to_fetch,
+        },
+        group,
+    )
+
+
+def run_task(
+    work_queue: WorkQueue,
+    task: Task,
+    proxies: List[str] = None,
+    timeout: int = None,
+) -> Optional[str]:
+    """
+    ### Args
+    - work_queue: `WorkQueue` queue that new tasks are put in
+    - task: `Task` claimed task
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+
+    ### Returns
+    - `Optional[str]` data dump of scrapped product or json object with urls of offers
+                      found on listing page, offers are queued by the coordinator
+    """
+
+    if task.kind == "offer":
+        return Product.from_url(task.payload["url"], proxies, timeout).get_data_dump()
+
+    if task.kind != "listing":
+        raise ValueError(f'Unknown task kind "{task.kind}"')
+
+    payload = task.payload
+    page_num = payload["page"]
+    pages_to_fetch = payload["pages_to_fetch"]
+
+    logging.info(f"Fetching {page_num} page")
+
+    url = _get_listing_url(payload["search_term"], payload["query_string"], page_num)
+    soup = get_soup(url, proxies, timeout, parse_only=LISTING_STRAINER)
+
+    # Offers are sent to the coordinator, it skips offers that were already returned
+    offers = [find_offer_url(section) for section in find_offer_sections(soup)]
+
+    # Next page is queued before the page is completed, so the crawl isn't finished
+    # too early
+    if not is_last_page(soup, page_num) and (
+        pages_to_fetch is None or page_num < pages_to_fetch
+    ):
+        _put_listing(
+            work_queue,
+            task.group,
+            payload["search_term"],
+            payload["query_string"],
+            page_num + 1,
+            pages_to_fetch,
+        )
+
+    return json.dumps({"offers": offers})
+
+
+def _work(
+    work_queue: WorkQueue,
+    proxies: Optional[List[str]],
+    timeout: Optional[int],
+    idle_timeout: Optional[float],
+    stop_event: threading.Event,
+    counter: List[int],
+):
+    worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    idle_since = time.monotonic()
+
+    while not stop_event.is_set():
+        task = work_queue.claim(worker)
+
+        if task is None:
+            if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                return
+
+            stop_event.wait(_POLL_INTERVAL)
+            continue
+
+        try:
+            result = run_task(work_queue, task, proxies, timeout)
+        # Adverts and auctions are completed without result
+        except UnsupportedOfferError:
+            logging.info(f'Ignoring "{task.payload.get("url")}" because it\'s advert or auction')
+            result = None
+        except Exception as e:
+            logging.warning(f'Task "{task.id}" failed, it will be retried: {e}')
+            work_queue.release(task)
+            continue
+
+        work_queue.complete(task, result)
+        counter[0] += 1
+        idle_since = time.monotonic()
+
+
+def run_worker(
+    work_queue: WorkQueue,
+    proxies: List[str] = None,
+    timeout: int = None,
+    threads: int = None,
+    idle_timeout: Optional[float] = DEFAULT_WORKER_IDLE_TIMEOUT,
+    stop_event: threading.Event = None,
+) -> int:
+    """
+    ### Args
+    - work_queue: `WorkQueue` queue shared with the coordinator
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - threads: `int` number of tasks run at once
+    - idle_timeout: `Optional[float]` seconds without tasks after which worker stops,
+                                      `None` runs until `stop_event` is set
+    - stop_event: `threading.Event` stops the worker when set
+
+    ### Returns
+    - `int` number of completed tasks
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    counters = [[0] for _ in range(threads or 1)]
+    workers = [
+        threading.Thread(
+            target=_work,
+            args=(work_queue, proxies, timeout, idle_timeout, stop_event, counter),
+            name="allegro-task",
+            daemon=True,
+        )
+        for counter in counters
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        stop_event.set()
+
+    return sum(counter[0] for counter in counters)
+
+
+def iter_distributed_crawl(
+    search_term: str,
+    work_queue: WorkQueue,
+    options: Options = None,
+    filters: Filters = None,
+    seen: SeenOffers = None,
+) -> Iterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - work_queue: `WorkQueue` queue shared with the workers
+    - options: `Options` search options
+    - filters: `Filters` product filters
+    - seen: `SeenOffers` offers already returned, skipped
+
+    ### Returns
+    - `Iterator[Product]` products scrapped by the workers, in order of completion
+
+    ### Notes
+    - Coordinator only queues the first listing page and offers found by workers and
+      collects results, pages and offers are fetched by workers started with
+      `run_worker` on any node.
+    """
+
+    _apply_options(options)
+
+    query_string = _build_query_string(filters)
+
+    if options is not None:
+        start_page = options.get("start_page") or 1
+        pages_to_fetch = options.get("pages_to_fetch")
+        max_results = options.get("max_results")
+    else:
+        start_page = 1
+        pages_to_fetch = None
+        max_results = None
+
+    if seen is None:
+        seen = SeenOffers()
+
+    # Tasks and results of this crawl, tasks of previous crawls are not reused
+    group = f"{uuid.uuid4().hex}:{search_term}{query_string}"
+    _put_listing(work_queue, group, search_term, query_string, start_page, pages_to_fetch)
+
+    scrapped = 0
+
+    # Ids of offers queued by this crawl, that weren't returned yet
+    claimed: Set[str] = set()
+
+    try:
+        while max_results is None or scrapped < max_results:
+            # Results of completed tasks are pushed before the count drops to zero
+            pending = work_queue.pending(group)
+            results = work_queue.pop_results(group)
+
+            get_metrics().set("allegro_queue_depth", pending, queue="work")
+
+            for data in results:
+                record = json.loads(data)
+
+                # Offers are queued once, offers found by other pages or queries are skipped
+                if "offers" in record:
+                    for offer_url in record["offers"]:
+                        if seen.add(offer_url):
+                            claimed.add(get_offer_id(offer_url))
+                            work_queue.put(
+                                f"offer:{group}:{get_offer_id(offer_url)}",
+                                "offer",
+                                {"url": offer_url},
+                                group,
+                            )
+                    continue
+
+                product = Product(**record)
+                claimed.discard(get_offer_id(product.url))
+                scrapped += 1
+
+                logging.info(
+                    f'Scrapped "{product.name}"'
+                    f" [{scrapped}{f'/{max_results}' if max_results is not None else ''}]"
+                )
+
+                yield product
+
+                # We've hit max results
+                if max_results == scrapped:
+                    break
+
+            if pending == 0 and not results:
+                # Remaining offers were adverts or auctions, completed without result
+                claimed.clear()
+                return
+
+            if not results:
+                time.sleep(_POLL_INTERVAL)
+    finally:
+        # Tasks that are no longer needed are dropped
+        work_queue.cancel(group)
+
+        # Dropped offers can be scraped by other queries sharing `seen`
+        seen.discard(claimed)
+
+
+def distributed_crawl(
+    search_term: str,
+    work_queue: WorkQueue,
+    options: Options = None,
+    filters: Filters = None,
+    seen: SeenOffers = None,
+) -> List[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - work_queue: `WorkQueue` queue shared with the workers
+    - options: `Options` search options
+    - filters: `Filters` product filters
+    - seen: `SeenOffers` offers already returned, skipped
+
+    ### Returns
+    - `List[Product]` products scrapped by the workers
+    """
+
+    products = list(iter_distributed_crawl(search_term, work_queue, options, filters, seen))
+
+    logging.info(f"Fetched {len(products)} products")
+
+    return products
@@ -0,0 +1,96 @@
+import time
+import sqlite3
+import threading
+
+from typing import NamedTuple, Optional
+from allegro.search.product import Product
+
+
+class IndexEntry(NamedTuple):
+    fingerprint: str
+    product: Optional[Product]
+
+
+class OfferIndex:
+    """
+    ### Overview
+    - Persistent SQLite index of offers keyed by offer id, used by incremental
+      crawls. Each offer keeps its last listing fingerprint and the last scrapped
+      product, `None` for adverts and auctions.
+
+    ### Args
+    - path: `str` path to the database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        # Listing stage reads the index from its own thread
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS offers ("
+            "offer_id TEXT PRIMARY KEY, "
+            "fingerprint TEXT NOT NULL, "
+            "product TEXT, "
+            "updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM offers").fetchone()[0]
+
+    def get(self, offer_id: str) -> Optional[IndexEntry]:
+        """
+        ### Args
+        - offer_id: `str` id of the offer
+
+        ### Returns
+        - `Optional[IndexEntry]` last fingerprint and product, `None` if offer is new
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprint, product FROM offers WHERE offer_id = ?",
+                (offer_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        fingerprint, product = row
+
+        return IndexEntry(
+            fingerprint, Product.from_data_dump(product) if product else None
+        )
+
+    def put(self, offer_id: str, fingerprint: str, product: Optional[Product]):
+        """
+        ### Args
+        - offer_id: `str` id of the offer
+        - fingerprint: `str` listing fingerprint of the offer
+        - product: `Optional[Product]` scrapped product, `None` for adverts and auctions
+        """
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO offers VALUES (?, ?, ?, ?)",
+                (
+                    offer_id,
+                    fingerprint,
+                    product.get_data_dump() if product is not None else None,
+                    time.time(),
+                ),
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,653 @@
+import asyncio
+import logging
+import queue
+import threading
+import concurrent.futures
+
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+from allegro.constants import DEFAULT_CONCURRENCY, DEFAULT_QUEUE_SIZE
+from allegro.utils import get_soup, async_get_soup, get_metrics
+from allegro.search.pool import WorkerPool
+from allegro.search.dedup import SeenOffers, get_offer_id
+from allegro.search.index import OfferIndex
+from allegro.search.checkpoint import QueryProgress
+from allegro.search.product import (
+    LISTING_STRAINER,
+    Product,
+    UnsupportedOfferError,
+    _get_listing_url,
+    find_offer_sections,
+    find_offer_url,
+    get_listing_fingerprint,
+    is_last_page,
+)
+
+# Put in the queue by the listing stage when there are no more pages
+_LISTING_DONE = object()
+
+
+def _put(url_queue: queue.Queue, item, stop_event: threading.Event) -> bool:
+    # Wait for free space in the queue, unless offer stage has stopped
+    while not stop_event.is_set():
+        try:
+            url_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _get_offer_item(
+    section,
+    seen: SeenOffers,
+    index: Optional[OfferIndex] = None,
+    listing_only: bool = False,
+    fetch_if: Callable[[Product], bool] = None,
+    claimed: Set[str] = None,
+) -> Union[None, Product, Tuple[str, Optional[str]]]:
+    offer_url = find_offer_url(section)
+
+    # Duplicate offers are skipped before they are requested
+    if not seen.add(offer_url):
+        return None
+
+    # Offers claimed by the query are released if it stops before they are scraped
+    if claimed is not None:
+        claimed.add(get_offer_id(offer_url))
+
+    if listing_only:
+        product = Product.from_section(section)
+
+        # Offer page is fetched only for products matching the predicate
+        if fetch_if is None or not fetch_if(product):
+            return product
+
+    if index is None:
+        return offer_url, None
+
+    fingerprint = get_listing_fingerprint(section)
+    entry = index.get(get_offer_id(offer_url))
+
+    # Offer didn't change since last crawl, adverts and auctions are skipped
+    if entry is not None and entry.fingerprint == fingerprint:
+        logging.debug(f'Offer "{offer_url}" didn\'t change since last crawl')
+        return entry.product
+
+    return offer_url, fingerprint
+
+
+def _update_index(
+    index: Optional[OfferIndex],
+    url: str,
+    fingerprint: Optional[str],
+    product: Optional[Product],
+):
+    if index is not None and fingerprint is not None:
+        index.put(get_offer_id(url), fingerprint, product)
+
+
+def _complete(progress: Optional[QueryProgress], url: str, counted: bool = True):
+    if progress is not None:
+        progress.complete(url, counted)
+
+
+def _finish(progress: Optional[QueryProgress]):
+    if progress is not None:
+        progress.finish()
+
+
+def _release(seen: SeenOffers, claimed: Set[str]):
+    # Offers queued but not scraped can be scraped by other queries sharing `seen`
+    if claimed:
+        logging.debug(f"Releasing {len(claimed)} offers that were not scraped")
+        seen.discard(claimed)
+        claimed.clear()
+
+
+def _walk_listing(
+    url_queue: queue.Queue,
+    stop_event: threading.Event,
+    search_term: str,
+    query_string: str,
+    start_page: int,
+    pages_to_fetch: Optional[int],
+    proxies: Optional[List[str]],
+    timeout: Optional[int],
+    seen: SeenOffers,
+    index: Optional[OfferIndex],
+    listing_only: bool,
+    fetch_if: Optional[Callable[[Product], bool]],
+    progress: Optional[QueryProgress],
+    claimed: Set[str],
+):
+    page_num = start_page
+
+    try:
+        # Offers queued before the crawl was interrupted go first
+        if progress is not None:
+            for pending_item in progress.get_pending():
+                if not _put(url_queue, pending_item, stop_event):
+                    return
+
+            if progress.listed:
+                return
+
+        while pages_to_fetch is None or page_num <= pages_to_fetch:
+            if stop_event.is_set():
+                return
+
+            logging.info(f"Fetching {page_num} page")
+
+            # try to parse website
+            url = _get_listing_url(search_term, query_string, page_num)
+            soup = get_soup(url, proxies, timeout, parse_only=LISTING_STRAINER)
+
+            # Find all products on a page, each section is one product
+            sections = find_offer_sections(soup)
+
+            logging.info(f"Found {len(sections)} products on {page_num} page")
+
+            for section in sections:
+                item = _get_offer_item(
+                    section, seen, index, listing_only, fetch_if, claimed
+                )
+                if item is None:
+                    continue
+
+                if progress is not None:
+                    progress.add_pending(item)
+
+                # Blocks when offer stage falls behind
+                if not _put(url_queue, item, stop_event):
+                    return
+
+            if progress is not None:
+                progress.page_done(page_num)
+
+            if is_last_page(soup, page_num):
+                logging.info("Reached last page, stopping")
+                break
+
+            page_num += 1
+
+        if progress is not None:
+            progress.listing_done()
+    except Exception as e:
+        # Let offer stage raise the exception
+        _put(url_queue, e, stop_event)
+    finally:
+        _put(url_queue, _LISTING_DONE, stop_event)
+
+
+def _scrape_inline(
+    url: str, proxies: List[str] = None, timeout: int = None
+) -> concurrent.futures.Future:
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    try:
+        future.set_result(Product.from_url(url, proxies, timeout))
+    except Exception as e:
+        future.set_exception(e)
+
+    return future
+
+
+def iter_pipeline(
+    search_term: str,
+    query_string: str = "",
+    start_page: int = 1,
+    pages_to_fetch: int = None,
+    max_results: int = None,
+    proxies: List[str] = None,
+    timeout: int = None,
+    pool: WorkerPool = None,
+    queue_size: int = None,
+    seen: SeenOffers = None,
+    index: OfferIndex = None,
+    listing_only: bool = False,
+    fetch_if: Callable[[Product], bool] = None,
+    progress: QueryProgress = None,
+) -> Iterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - query_string: `str` query string with filters
+    - start_page: `int` first listing page
+    - pages_to_fetch: `int` last listing page, all pages are fetched if `None`
+    - max_results: `int` max number of products to return
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - pool: `WorkerPool` pool used to scrape offers, offers are scraped one by one if `None`
+    - queue_size: `int` max number of offer urls waiting to be scraped
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+    - index: `OfferIndex` index of offers from previous crawls, only new and changed
+                          offers are scraped, the rest is taken from the index
+    - listing_only: `bool` products are made from listing page, without fetching offers
+    - fetch_if: `Callable[[Product], bool]` with `listing_only`, offer page is fetched
+                                           only for products matching the predicate
+    - progress: `QueryProgress` progress saved to the checkpoint, listing walk starts
+                                at `start_page` and offers pending in it are queued first
+
+    ### Returns
+    - `Iterator[Product]` scrapped products, in order of completion
+
+    ### Notes
+    - Listing pages are walked by a background thread that puts offer urls in a
+      bounded queue, so next pages are fetched while offers are scraped. When the
+      queue is full the listing stage waits for the offer stage.
+    """
+
+    scrapped = progress.scrapped if progress is not None else 0
+
+    if max_results is not None and scrapped >= max_results:
+        _finish(progress)
+        return
+
+    url_queue: queue.Queue = queue.Queue(maxsize=queue_size or DEFAULT_QUEUE_SIZE)
+    stop_event = threading.Event()
+
+    if seen is None:
+        seen = SeenOffers()
+
+    # Ids of offers marked as seen by this query, that weren't scraped yet
+    claimed: Set[str] = set()
+
+    listing_thread = threading.Thread(
+        target=_walk_listing,
+        args=(
+            url_queue,
+            stop_event,
+            search_term,
+            query_string,
+            start_page,
+            pages_to_fetch,
+            proxies,
+            timeout,
+            seen,
+            index,
+            listing_only,
+            fetch_if,
+            progress,
+            claimed,
+        ),
+        name="allegro-listing",
+        daemon=True,
+    )
+    listing_thread.start()
+
+    # Offers that are being scraped
+    in_flight: Dict[concurrent.futures.Future, Tuple[str, Optional[str]]] = {}
+    max_in_flight = pool.workers if pool is not None else 1
+    listing_done = False
+
+    try:
+        while True:
+            # Products made from listing page or taken from the index
+            ready: List[Product] = []
+
+            # Keep all workers busy
+            while not listing_done and len(in_flight) < max_in_flight:
+                try:
+                    item = url_queue.get(block=len(in_flight) == 0 and not ready)
+                except queue.Empty:
+                    break
+
+                if item is _LISTING_DONE:
+                    listing_done = True
+                elif isinstance(item, Exception):
+                    raise item
+                elif isinstance(item, Product):
+                    ready.append(item)
+                elif pool is not None:
+                    in_flight[pool.submit(item[0], proxies, timeout)] = item
+                else:
+                    in_flight[_scrape_inline(item[0], proxies, timeout)] = item
+
+            get_metrics().set("allegro_queue_depth", url_queue.qsize(), queue="offers")
+
+            for product in ready:
+                scrapped += 1
+
+                logging.info(
+                    f'Found "{product.name}" without scraping offer page'
+                    f" [{scrapped}{f'/{max_results}' if max_results is not None else ''}]"
+                )
+
+                claimed.discard(get_offer_id(product.url))
+                yield product
+                _complete(progress, product.url)
+
+                # We've hit max results
+                if max_results == scrapped:
+                    _finish(progress)
+                    return
+
+            if len(in_flight) == 0:
+                if listing_done:
+                    _finish(progress)
+                    break
+
+                continue
+
+            # Check the queue again soon if workers are free
+            if listing_done or len(in_flight) >= max_in_flight:
+                wait_timeout = None
+            else:
+                wait_timeout = 0.1
+
+            done, _ = concurrent.futures.wait(
+                in_flight,
+                timeout=wait_timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+
+            for future in done:
+                product_url, fingerprint = in_flight.pop(future)
+
+                try:
+                    product = future.result()
+                # Ignore adverts and auctions
+                except UnsupportedOfferError:
+                    logging.info(
+                        f'Ignoring "{product_url}" because it\'s advert or auction'
+                    )
+                    _update_index(index, product_url, fingerprint, None)
+                    _complete(progress, product_url, counted=False)
+                    claimed.discard(get_offer_id(product_url))
+                    continue
+
+                _update_index(index, product_url, fingerprint, product)
+                claimed.discard(get_offer_id(product_url))
+
+                scrapped += 1
+
+                logging.info(
+                    f'Scrapped "{product.name}"'
+                    f'{f" with url {product.url}" if logging.DEBUG >= logging.root.level else ""}'
+                    f" [{scrapped}{f'/{max_results}' if max_results is not None else ''}]"
+                )
+
+                yield product
+                _complete(progress, product_url)
+
+                # We've hit max results
+                if max_results == scrapped:
+                    _finish(progress)
+                    return
+    finally:
+        # Stop listing stage and offers that are no longer needed
+        stop_event.set()
+
+        for future in in_flight:
+            future.cancel()
+
+        listing_thread.join()
+        _release(seen, claimed)
+
+        # Offers that were not completed stay pending
+        if progress is not None:
+            progress.save()
+
+
+async def _async_walk_listing(
+    url_queue: asyncio.Queue,
+    search_term: str,
+    query_string: str,
+    start_page: int,
+    pages_to_fetch: Optional[int],
+    proxies: Optional[List[str]],
+    timeout: Optional[int],
+    concurrency: int,
+    seen: SeenOffers,
+    index: Optional[OfferIndex],
+    listing_only: bool,
+    fetch_if: Optional[Callable[[Product], bool]],
+    progress: Optional[QueryProgress],
+    claimed: Set[str],
+):
+    page_num = start_page
+
+    try:
+        # Offers queued before the crawl was interrupted go first
+        if progress is not None:
+            for pending_item in progress.get_pending():
+                await url_queue.put(pending_item)
+
+            if progress.listed:
+                await url_queue.put(_LISTING_DONE)
+                return
+
+        while pages_to_fetch is None or page_num <= pages_to_fetch:
+            logging.info(f"Fetching {page_num} page")
+
+            # try to parse website
+            url = _get_listing_url(search_term, query_string, page_num)
+            soup = await async_get_soup(
+                url, proxies, timeout, concurrency, parse_only=LISTING_STRAINER
+            )
+
+            # Find all products on a page, each section is one product
+            sections = find_offer_sections(soup)
+
+            logging.info(f"Found {len(sections)} products on {page_num} page")
+
+            for section in sections:
+                item = _get_offer_item(
+                    section, seen, index, listing_only, fetch_if, claimed
+                )
+                if item is None:
+                    continue
+
+                if progress is not None:
+                    progress.add_pending(item)
+
+                # Waits when offer stage falls behind
+                await url_queue.put(item)
+
+            if progress is not None:
+                progress.page_done(page_num)
+
+            if is_last_page(soup, page_num):
+                logging.info("Reached last page, stopping")
+                break
+
+            page_num += 1
+
+        if progress is not None:
+            progress.listing_done()
+    except Exception as e:
+        # Let offer stage raise the exception
+        await url_queue.put(e)
+
+    await url_queue.put(_LISTING_DONE)
+
+
+async def async_iter_pipeline(
+    search_term: str,
+    query_string: str = "",
+    start_page: int = 1,
+    pages_to_fetch: int = None,
+    max_results: int = None,
+    proxies: List[str] = None,
+    timeout: int = None,
+    concurrency: int = None,
+    queue_size: int = None,
+    seen: SeenOffers = None,
+    index: OfferIndex = None,
+    listing_only: bool = False,
+    fetch_if: Callable[[Product], bool] = None,
+    progress: QueryProgress = None,
+) -> AsyncIterator[Product]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - query_string: `str` query string with filters
+    - start_page: `int` first listing page
+    - pages_to_fetch: `int` last listing page, all pages are fetched if `None`
+    - max_results: `int` max number of products to return
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - concurrency: `int` number of offer pages fetched at once
+    - queue_size: `int` max number of offer urls waiting to be scraped
+    - seen: `SeenOffers` offers already scraped by other queries, skipped
+    - index: `OfferIndex` index of offers from previous crawls, only new and changed
+                          offers are scraped, the rest is taken from the index
+    - listing_only: `bool` products are made from listing page, without fetching offers
+    - fetch_if: `Callable[[Product], bool]` with `listing_only`, offer page is fetched
+                                           only for products matching the predicate
+    - progress: `QueryProgress` progress saved to the checkpoint, listing walk starts
+                                at `start_page` and offers pending in it are queued first
+
+    ### Returns
+    - `AsyncIterator[Product]` scrapped products, in order of completion
+    """
+
+    scrapped = progress.scrapped if progress is not None else 0
+
+    if max_results is not None and scrapped >= max_results:
+        _finish(progress)
+        return
+
+    if concurrency is None:
+        concurrency = DEFAULT_CONCURRENCY
+
+    url_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or DEFAULT_QUEUE_SIZE)
+
+    if seen is None:
+        seen = SeenOffers()
+
+    # Ids of offers marked as seen by this query, that weren't scraped yet
+    claimed: Set[str] = set()
+
+    listing_task = asyncio.ensure_future(
+        _async_walk_listing(
+            url_queue,
+            search_term,
+            query_string,
+            start_page,
+            pages_to_fetch,
+            proxies,
+            timeout,
+            concurrency,
+            seen,
+            index,
+            listing_only,
+            fetch_if,
+            progress,
+            claimed,
+        )
+    )
+
+    # Offers that are being scraped
+    in_flight: Dict[asyncio.Future, Tuple[str, Optional[str]]] = {}
+    listing_done = False
+
+    try:
+        while True:
+            # Products made from listing page or taken from the index
+            ready: List[Product] = []
+
+            # Keep all requests slots busy
+            while not listing_done and len(in_flight) < concurrency:
+                if len(in_flight) == 0 and not ready:
+                    item = await url_queue.get()
+                else:
+                    try:
+                        item = url_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+
+                if item is _LISTING_DONE:
+                    listing_done = True
+                elif isinstance(item, Exception):
+                    raise item
+                elif isinstance(item, Product):
+                    ready.append(item)
+                else:
+                    task = asyncio.ensure_future(
+                        Product.async_from_url(item[0], proxies, timeout, concurrency)
+                    )
+                    in_flight[task] = item
+
+            get_metrics().set("allegro_queue_depth", url_queue.qsize(), queue="offers")
+
+            for product in ready:
+                scrapped += 1
+
+                logging.info(
+                    f'Found "{product.name}" without scraping offer page'
+                    f" [{scrapped}{f'/{max_results}' if max_results is not None else ''}]"
+                )
+
+                claimed.discard(get_offer_id(product.url))
+                yield product
+                _complete(progress, product.url)
+
+                # We've hit max results
+                if max_results == scrapped:
+                    _finish(progress)
+                    return
+
+            if len(in_flight) == 0:
+                if listing_done:
+                    _finish(progress)
+                    break
+
+                continue
+
+            # Check the queue again soon if request slots are free
+            if listing_done or len(in_flight) >= concurrency:
+                wait_timeout = None
+            else:
+                wait_timeout = 0.1
+
+            done, _ = await asyncio.wait(
+                in_flight, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for future in done:
+                product_url, fingerprint = in_flight.pop(future)
+
+                try:
+                    product = future.result()
+                # Ignore adverts and auctions
+                except UnsupportedOfferError:
+                    logging.info(
+                        f'Ignoring "{product_url}" because it\'s advert or auction'
+                    )
+                    _update_index(index, product_url, fingerprint, None)
+                    _complete(progress, product_url, counted=False)
+                    claimed.discard(get_offer_id(product_url))
+                    continue
+
+                _update_index(index, product_url, fingerprint, product)
+                claimed.discard(get_offer_id(product_url))
+
+                scrapped += 1
+
+                logging.info(
+                    f'Scrapped "{product.name}"'
+                    f'{f" with url {product.url}" if logging.DEBUG >= logging.root.level else ""}'
+                    f" [{scrapped}{f'/{max_results}' if max_results is not None else ''}]"
+                )
+
+                yield product
+                _complete(progress, product_url)
+
+                # We've hit max results
+                if max_results == scrapped:
+                    _finish(progress)
+                    return
+    finally:
+        # Stop listing stage and offers that are no longer needed
+        listing_task.cancel()
+
+        for future in in_flight:
+            future.cancel()
+
+        _release(seen, claimed)
+
+        # Offers that were not completed stay pending
+        if progress is not None:
+            progress.save()
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import concurrent.futures
+
+from functools import partial
+
+from typing import List, Optional, Tuple
+from allegro.utils import (
+    get_parser_backend,
+    set_parser_backend,
+    get_cache,
+    set_cache,
+    ResponseCache,
+    get_rate_limiter,
+    set_rate_limiter,
+    RateLimiter,
+    get_retry_policy,
+    set_retry_policy,
+    RetryPolicy,
+    ProxyPool,
+    Metrics,
+    get_metrics,
+    set_metrics,
+    Profiler,
+    get_profiler,
+    set_profiler,
+)
+from allegro.search.product import Product
+
+WORKER_KINDS = ("thread", "process", "async")
+
+
+def _init_worker(
+    parser_backend: str,
+    cache: Optional[ResponseCache],
+    rate_limiter: Optional[RateLimiter],
+    retry_policy: RetryPolicy,
+    metrics: Metrics,
+    profiler: Optional[Profiler],
+):
+    # Settings have to be passed to worker processes
+    set_parser_backend(parser_backend)
+    set_cache(cache)
+    set_rate_limiter(rate_limiter)
+    set_retry_policy(retry_policy)
+    set_metrics(metrics)
+    set_profiler(profiler)
+
+    if profiler is not None:
+        profiler.start()
+
+
+def _flush_worker(proxies: List[str] = None) -> tuple:
+    profiler = get_profiler()
+
+    return (
+        get_metrics().flush(),
+        profiler.flush() if profiler is not None else None,
+        proxies.flush() if isinstance(proxies, ProxyPool) else None,
+    )
+
+
+def _scrape_offer(url: str, proxies: List[str] = None, timeout: int = None):
+    # Metrics, profile and proxy outcomes of the worker process are sent back with every offer
+    try:
+        return Product.from_url(url, proxies, timeout), None, _flush_worker(proxies)
+    except Exception as e:
+        return None, e, _flush_worker(proxies)
+
+
+def _cancel_offer(future: concurrent.futures.Future, result: concurrent.futures.Future):
+    # Offer nobody waits for is not scraped, unless a worker has already started it
+    if result.cancelled():
+        future.cancel()
+
+
+def _resolve_offer(
+    result: concurrent.futures.Future,
+    proxies: Optional[List[str]],
+    future: concurrent.futures.Future,
+):
+    # Offer was cancelled before it was scraped
+    if future.cancelled():
+        result.cancel()
+
+    if not result.set_running_or_notify_cancel():
+        return
+
+    try:
+        product, error, (metrics, profile, reports) = future.result()
+    except BaseException as e:
+        result.set_exception(e)
+        return
+
+    get_metrics().merge(metrics)
+
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.merge(profile)
+
+    if isinstance(proxies, ProxyPool):
+        proxies.merge(reports)
+
+    if error is not None:
+        result.set_exception(error)
+    else:
+        result.set_result(product)
+
+
+class WorkerPool:
+    """
+    ### Overview
+    - Long-lived pool of workers that scrape offer pages. One pool is meant to be
+      shared by all pages of a crawl and by all queries, so workers are started once.
+
+    ### Args
+    - workers: `int` number of workers, for async workers it's the number of
+                     offer pages fetched at once
+    - kind: `str` "thread", "process" or "async"
+    """
+
+    def __init__(self, workers: int, kind: str = "process"):
+        if kind not in WORKER_KINDS:
+            raise ValueError(f"Unknown worker kind: {kind}")
+
+        self.workers = workers
+        self.kind = kind
+
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._limits: Optional[
+            Tuple[Optional[RateLimiter], RetryPolicy, Optional[RateLimiter], RetryPolicy]
+        ] = None
+
+        if kind == "thread":
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="allegro-worker"
+            )
+        elif kind == "process":
+            # Each process gets its part of the limits, main process fetching listing
+            # pages included, limits of the main process are restored on shutdown
+            rate_limiter = get_rate_limiter()
+            retry_policy = get_retry_policy()
+            part_limiter = rate_limiter.split(workers + 1) if rate_limiter is not None else None
+            part_policy = retry_policy.split(workers + 1)
+
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(
+                    get_parser_backend(),
+                    get_cache(),
+                    part_limiter,
+                    part_policy,
+                    get_metrics(),
+                    get_profiler(),
+                ),
+            )
+
+            self._limits = (rate_limiter, retry_policy, part_limiter, part_policy)
+            set_rate_limiter(part_limiter)
+            set_retry_policy(part_policy)
+        else:
+            # Event loop running in the background, offers are scheduled on it
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="allegro-worker-loop", daemon=True
+            )
+            self._loop_thread.start()
+
+    def submit(
+        self, url: str, proxies: List[str] = None, timeout: int = None
+    ) -> concurrent.futures.Future:
+        """
+        ### Args
+        - url: `str` url of the offer page
+        - proxies: `List[str]` proxies list
+        - timeout: `int` request timeout
+
+        ### Returns
+        - `concurrent.futures.Future` future resolving to `Product`
+        """
+
+        if self._loop is not None:
+            return asyncio.run_coroutine_threadsafe(
+                self._scrape(url, proxies, timeout), self._loop
+            )
+
+        if self.kind == "thread":
+            return self._executor.submit(Product.from_url, url, proxies, timeout)  # type: ignore
+
+        # Metrics, profiles and proxy outcomes of worker processes are merged before
+        # the product is returned
+        result: concurrent.futures.Future = concurrent.futures.Future()
+        future = self._executor.submit(_scrape_offer, url, proxies, timeout)  # type: ignore
+        future.add_done_callback(partial(_resolve_offer, result, proxies))
+        result.add_done_callback(partial(_cancel_offer, future))
+
+        return result
+
+    async def _scrape(self, url: str, proxies: List[str] = None, timeout: int = None):
+        # Semaphore has to be created inside of the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        async with self._semaphore:
+            return await Product.async_from_url(url, proxies, timeout, self.workers)
+
+    async def _finish_tasks(self, cancel: bool):
+        current_task = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current_task]
+
+        if cancel:
+            for task in tasks:
+                task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self, wait: bool = True):
+        """
+        ### Args
+        - wait: `bool` wait for running offers to finish
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+        if self._limits is not None:
+            rate_limiter, retry_policy, part_limiter, part_policy = self._limits
+            self._limits = None
+
+            # Limits are restored unless they were replaced in the meantime
+            if get_rate_limiter() is part_limiter:
+                set_rate_limiter(rate_limiter)
+            if get_retry_policy() is part_policy:
+                set_retry_policy(retry_policy)
+
+        if self._loop is not None and self._loop_thread is not None:
+            # Finish or cancel offers that are still scheduled
+            asyncio.run_coroutine_threadsafe(
+                self._finish_tasks(cancel=not wait), self._loop
+            ).result()
+
+            # Threads sending requests of the loop are stopped with it
+            if hasattr(self._loop, "shutdown_default_executor"):
+                asyncio.run_coroutine_threadsafe(
+                    self._loop.shutdown_default_executor(), self._loop
+                ).result()
+
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -1,21 +1,27 @@
+import time
+import asyncio
 import logging
 import json
 
 import concurrent.futures
-from dataclasses import dataclass
-from typing import List, Tuple
-from allegro.utils import get_soup
-from allegro.parsers import (
-    find_product_category,
-    find_product_images,
-    find_product_name,
-    find_product_parameters,
-    find_product_price,
-    find_product_quantity,
-    find_product_rating,
-    find_product_seller,
-    is_buynow_offer,
-)
+from bs4 import BeautifulSoup, SoupStrainer
+from functools import partial
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from allegro.constants import DEFAULT_CONCURRENCY
+from allegro.utils import get_soup, async_get_soup, get_metrics, get_profiler
+from allegro.parsers import extract_product
+from allegro.search.dedup import SeenOffers
+
+if TYPE_CHECKING:
+    from allegro.search.pool import WorkerPool
+
+
+class UnsupportedOfferError(NotImplementedError):
+    """
+    ### Overview
+    - Raised for auctions and advertisements, they have no product to scrape.
+    """
 
 
 @dataclass(frozen=True)
@@ -56,48 +62,130 @@ class Product:
         ### Returns
         - `Product` that contains the metadata of a product.
         """
-        if "allegro.pl/oferta" not in url:
-            if (
-                "allegro.pl/events/clicks" not in url
-                and "&redirect=https%3A%2F%2Fallegro.pl%2Foferta" not in url
-            ):
-                raise ValueError(f"Passed url is not that of a product: {url}")
+
+        _check_product_url(url)
 
         # try to parse product
         soup = get_soup(url=url, proxies=proxies, timeout=timeout)
 
-        if is_buynow_offer(soup) is False:
-            raise NotImplementedError("Auctions and advertisements are not supported")
+        return cls.from_soup(url, soup)
 
-        # Find name in parsed website
-        name = find_product_name(soup)
+    @classmethod
+    async def async_from_url(
+        cls,
+        url: str,
+        proxies: List[str] = None,
+        timeout: int = None,
+        concurrency: int = None,
+    ):
+        """
+        ### Args
+        - url: `str` a url of a product that we want to scrape
+        - proxies: `List[str]` proxies list
+        - concurrency: `int` number of requests that can be in flight at once
 
-        # Find price in parsed website
-        price = find_product_price(soup)
+        ### Returns
+        - `Product` that contains the metadata of a product.
+        """
+
+        _check_product_url(url)
+
+        # try to parse product
+        soup = await async_get_soup(
+            url=url, proxies=proxies, timeout=timeout, concurrency=concurrency
+        )
+
+        return cls.from_soup(url, soup)
+
+    @classmethod
+    def from_soup(cls, url: str, soup: BeautifulSoup):
+        """
+        ### Args
+        - url: `str` a url of a product
+        - soup: `BeautifulSoup` parsed product page
 
-        # Find category in parsed website
-        category = find_product_category(soup)
+        ### Returns
+        - `Product` that contains the metadata of a product.
+        """
 
-        # Find seller in parsed website
-        seller = find_product_seller(soup)
+        # Find all fields in one pass over the page
+        start = time.perf_counter()
+        fields = extract_product(soup)
 
-        # Find quantity in parsed website
-        quantity = find_product_quantity(soup)
+        extract_time = time.perf_counter() - start
+        metrics = get_metrics()
+        metrics.observe("allegro_extract_seconds", extract_time)
 
-        # Find rating in parsed website
-        rating = find_product_rating(soup)
+        profiler = get_profiler()
+        if profiler is not None:
+            profiler.record("extract", extract_time, url=url)
 
-        # Find images in parsed website
-        images = find_product_images(soup)
+        if fields["buy_now"] is False:
+            raise UnsupportedOfferError("Auctions and advertisements are not supported")
 
-        # Find parameters in parsed website
-        parameters = find_product_parameters(soup)
+        metrics.inc("allegro_products_total")
 
         # Return product object
         return cls(
-            url, name, category, price, seller, quantity, rating, images, parameters
+            url,
+            fields["name"],
+            fields["category"],
+            fields["price"],
+            fields["seller"],
+            fields["quantity"],
+            fields["rating"],
+            fields["images"],
+            fields["parameters"],
         )
 
+    @classmethod
+    def from_section(cls, section):
+        """
+        ### Args
+        - section: offer section found by `find_offer_sections`
+
+        ### Returns
+        - `Product` with fields found on the listing page, category, seller and
+          quantity are left empty
+        """
+
+        # Offer title
+        title_tag = section.find("h2")
+        name = title_tag.text.strip() if title_tag is not None else ""
+
+        # Thumbnails, lazy loaded images have placeholder instead
+        images = [
+            image.get("src")
+            for image in section.find_all("img", attrs={"src": True})
+            if _LISTING_PLACEHOLDER not in image.get("src")
+        ]
+
+        # Short parameters list, ex. "Stan: Nowy"
+        parameters = {
+            key.text.strip(): value.text.strip()
+            for key, value in zip(section.find_all("dt"), section.find_all("dd"))
+        }
+
+        return cls(
+            find_offer_url(section),
+            name,
+            "",
+            find_offer_price(section) or 0.0,
+            "",
+            0,
+            0.0,
+            images,
+            parameters,
+        )
+
+    def get_data_dump(self) -> str:
+        """
+        ### Returns
+        - `str` json string with all fields, used by `from_data_dump`
+        """
+
+        return json.dumps(asdict(self), ensure_ascii=False)
+
     @classmethod
     def from_data_dump(cls, data: str):
         """
@@ -116,32 +204,42 @@ class Product:
         return cls(**data_dict)
 
 
-def parse_products(
-    search_term: str,
-    query_string: str = "",
-    page_num: int = 1,
-    proxies: List[str] = None,
-    max_results: int = None,
-    timeout: int = None,
-    threads: int = None,
-) -> Tuple[List[Product], bool]:
+def _check_product_url(url: str):
+    if "allegro.pl/oferta" not in url:
+        if (
+            "allegro.pl/events/clicks" not in url
+            and "&redirect=https%3A%2F%2Fallegro.pl%2Foferta" not in url
+        ):
+            raise ValueError(f"Passed url is not that of a product: {url}")
+
+
+def _get_listing_url(search_term: str, query_string: str = "", page_num: int = 1) -> str:
     # create url and encode spaces
-    url = (
+    return (
         f"https://allegro.pl/listing?string={search_term}"
         f"{query_string}&p={str(page_num)}".replace(" ", "%20")
     )
 
-    # Current product
-    product = None
 
-    # try to parse website
-    soup = get_soup(url, proxies)
+# Image shown on listing page before the thumbnail is loaded
+_LISTING_PLACEHOLDER = "allegrostatic.com/metrum/placeholder"
+
+# Parts of listing page used by the crawler, rest of the page is not parsed
+LISTING_STRAINER = SoupStrainer(
+    name=["article", "input"], attrs={"data-role": ["offer", "page-number-input"]}
+)
 
-    # Products list
-    products: List[Product] = []
 
-    # Find all products on a page, each section is one product
-    sections = soup.find_all(
+def find_offer_sections(soup: BeautifulSoup) -> list:
+    """
+    ### Args
+    - soup: `BeautifulSoup` parsed listing page
+
+    ### Returns
+    - `list` of offer sections, each section is one product
+    """
+
+    return soup.find_all(
         "article",
         attrs={
             "data-role": "offer",
@@ -152,8 +250,227 @@ def parse_products(
         },
     )
 
+
+def find_offer_url(section) -> str:
+    """
+    ### Args
+    - section: offer section found by `find_offer_sections`
+
+    ### Returns
+    - `str` url to the offer page
+    """
+
+    # Find url to product in a tag
+    product_link = section.find("a", attrs={"rel": "nofollow", "tabindex": "-1"})
+
+    return product_link.get("href")
+
+
+def find_offer_price(section) -> Optional[float]:
+    """
+    ### Args
+    - section: offer section found by `find_offer_sections`
+
+    ### Returns
+    - `Optional[float]` current price of the offer, `None` if it can't be found
+    """
+
+    for price_tag in section.find_all("span", attrs={"aria-label": True}):
+        label = price_tag.get("aria-label")
+
+        # Current price label, ex. "22,00 zł aktualna cena"
+        if label.endswith("aktualna cena"):
+            price = label.rsplit("zł", 1)[0].replace("\xa0", "").replace(" ", "")
+            try:
+                return float(price.replace(",", "."))
+            except ValueError:
+                return None
+
+    return None
+
+
+def get_listing_fingerprint(section) -> str:
+    """
+    ### Args
+    - section: offer section found by `find_offer_sections`
+
+    ### Returns
+    - `str` fingerprint of the offer, changes when price or delivery changes
+
+    ### Notes
+    - Position of the offer (`page` and `index0` attributes) is not part of the
+      fingerprint, it changes every time other offers are added to the listing.
+    """
+
+    return "|".join(
+        [
+            section.get("data-analytics-view-value") or "",
+            section.get("data-analytics-view-custom-deliverylabel") or "",
+            str(find_offer_price(section)),
+        ]
+    )
+
+
+def is_last_page(soup: BeautifulSoup, page_num: int) -> bool:
+    pagination_input = soup.find(
+        "input", attrs={"data-role": "page-number-input", "data-page": True}
+    )
+
+    # Results that fit on one page have no pagination
+    if pagination_input is None:
+        return True
+
+    last_page = int(str(pagination_input.get("data-maxpage")))
+
+    return page_num == last_page
+
+
+def iter_offers(
+    products_urls: List[str],
+    proxies: List[str] = None,
+    timeout: int = None,
+    max_results: int = None,
+    pool: "WorkerPool" = None,
+) -> Iterator[Product]:
+    """
+    ### Args
+    - products_urls: `List[str]` urls of offer pages
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - max_results: `int` max number of products to return
+    - pool: `WorkerPool` pool used to scrape offers, offers are scraped one by one if `None`
+
+    ### Returns
+    - `Iterator[Product]` scrapped products, yielded as soon as they are scrapped
+    """
+
+    # Number of products that will be scrapped
+    if max_results is not None and max_results < len(products_urls):
+        print_num = max_results
+    else:
+        print_num = len(products_urls)
+
+    if max_results == 0:
+        return
+
+    futures: Dict[concurrent.futures.Future, str] = {}
+
+    if pool is not None:
+        futures = {
+            pool.submit(product_url, proxies, timeout): product_url
+            for product_url in products_urls
+        }
+        completed = (
+            (futures[future], future.result)
+            for future in concurrent.futures.as_completed(futures)
+        )
+    else:
+        completed = (
+            (product_url, partial(Product.from_url, product_url, proxies, timeout))
+            for product_url in products_urls
+        )
+
+    # Number of scrapped products
+    scrapped = 0
+
+    try:
+        for index, (product_url, get_result) in enumerate(completed, start=1):
+            # Create product object using url
+            try:
+                product = get_result()
+            # Ignore adverts and auctions
+            except NotImplementedError:
+                logging.info(
+                    f'Ignoring "{product_url}" '
+                    "because it's advert or auction "
+                    f"[{index}/{print_num}]"
+                )
+                continue
+
+            scrapped += 1
+
+            logging.info(
+                f'Scrapped "{product.name}"'
+                f'{f" with url {product.url}" if logging.DEBUG >= logging.root.level else ""}'
+                f" [{scrapped}/{print_num}]"
+            )
+
+            yield product
+
+            # We've hit max results
+            if max_results == scrapped:
+                return
+    finally:
+        # Cancel offers that are no longer needed
+        for future in futures:
+            future.cancel()
+
+
+def scrape_offers(
+    products_urls: List[str],
+    proxies: List[str] = None,
+    timeout: int = None,
+    max_results: int = None,
+    pool: "WorkerPool" = None,
+) -> List[Product]:
+    """
+    ### Args
+    - products_urls: `List[str]` urls of offer pages
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - max_results: `int` max number of products to return
+    - pool: `WorkerPool` pool used to scrape offers, offers are scraped one by one if `None`
+
+    ### Returns
+    - `List[Product]` list containing scrapped products
+    """
+
+    return list(iter_offers(products_urls, proxies, timeout, max_results, pool))
+
+
+def parse_products(
+    search_term: str,
+    query_string: str = "",
+    page_num: int = 1,
+    proxies: List[str] = None,
+    max_results: int = None,
+    timeout: int = None,
+    threads: int = None,
+    pool: "WorkerPool" = None,
+    seen: SeenOffers = None,
+) -> Tuple[List[Product], bool]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - query_string: `str` query string with filters
+    - page_num: `int` number of the listing page
+    - proxies: `List[str]` proxies list
+    - max_results: `int` max number of products to return
+    - timeout: `int` request timeout
+    - threads: `int` number of workers used when no pool is passed
+    - pool: `WorkerPool` shared pool used to scrape offers
+    - seen: `SeenOffers` offers already scraped by other pages or queries, skipped
+
+    ### Returns
+    - `Tuple[List[Product], bool]` scrapped products and whether there are more pages
+    """
+
+    # create url and encode spaces
+    url = _get_listing_url(search_term, query_string, page_num)
+
+    # try to parse website
+    soup = get_soup(url, proxies, timeout, parse_only=LISTING_STRAINER)
+
+    # Find all products on a page, each section is one product
+    sections = find_offer_sections(soup)
+
+    # Duplicate offers are skipped before they are requested
+    products_urls = (seen if seen is not None else SeenOffers()).filter(
+        [find_offer_url(section) for section in sections]
+    )
+
     # Number of products found
-    sections_len = len(sections)
+    sections_len = len(products_urls)
 
     if max_results is not None and sections_len > max_results:
         logging.info(
@@ -162,122 +479,170 @@ def parse_products(
     else:
         logging.info(f"Found {sections_len} products")
 
-    if threads is not None:
-        products_urls: List[str] = []
-        for section in sections:
-            # max products
-            if max_results != len(products_urls):
-                # Find url to product in a tag
-                product_link = section.find(
-                    "a", attrs={"rel": "nofollow", "tabindex": "-1"}
-                )
-                product_url = product_link.get("href")
-                products_urls.append(product_url)
-
-        # Threadding magic
-        with concurrent.futures.ProcessPoolExecutor(max_workers=threads) as executor:
-            future_to_product = {
-                executor.submit(Product.from_url, urll, proxies, timeout): urll
-                for urll in products_urls
-            }
-            for index, future in enumerate(
-                concurrent.futures.as_completed(future_to_product)
-            ):
-                index = index + 1
-
-                # Start future
-                future_to_product[future]
-
-                if max_results is not None:
-                    if max_results > sections_len:
-                        print_num = sections_len
-                    else:
-                        print_num = max_results
-                else:
-                    print_num = sections_len
-
-                # Try to get product
-                try:
-                    product = future.result()
-
-                    # Add product to products list
-                    products.append(product)
-
-                    if logging.DEBUG >= logging.root.level:
-                        message = f" with url {product.url}"
-                    else:
-                        message = ""
-
-                    logging.info(
-                        f'Scrapped "{product.name}"'
-                        f"{message}"
-                        f" [{index}/{print_num}]"
-                    )
-
-                    # We've hit max results so we return products
-                    if max_results == len(products):
-                        return products, False
-                # Advert and auction
-                except NotImplementedError:
-                    logging.info(
-                        f'Ignoring "{products_urls[index]}" '
-                        "because it's advert or auction "
-                        f"[{index}/{print_num}]"
-                    )
-
-            # Shutdown executor, not sure if needed but I will leave it
-            executor.shutdown(wait=True)
+    if pool is None and threads is not None:
+        from allegro.search.pool import WorkerPool
+
+        # No shared pool, create one just for this page
+        with WorkerPool(threads) as page_pool:
+            products = scrape_offers(
+                products_urls, proxies, timeout, max_results, page_pool
+            )
     else:
-        for index, section in enumerate(sections):
-            index += 1
+        products = scrape_offers(products_urls, proxies, timeout, max_results, pool)
 
-            # max products
-            if max_results == len(products):
-                return products, False
+    # max products
+    if max_results == len(products):
+        return products, False
 
-            # Find url to product in a tag
-            product_link = section.find(
-                "a", attrs={"rel": "nofollow", "tabindex": "-1"}
-            )
-            product_url = product_link.get("href")
+    if is_last_page(soup, page_num):
+        logging.info("Reached last page, stopping")
+        return products, False
 
-            if max_results is not None:
-                if max_results > sections_len:
-                    print_num = sections_len
-                else:
-                    print_num = max_results
-            else:
-                print_num = sections_len
+    # Return list with products
+    return products, True
 
-            # Create product object using url
-            try:
-                product = Product.from_url(
-                    url=product_url, proxies=proxies, timeout=timeout
-                )
 
-                logging.info(
-                    f'Scraping "{product.name}"'
-                    f'{f" with url {product.url}" if logging.DEBUG >= logging.root.level else ""}'
-                    f" [{index}/{print_num}]"
-                )
+async def async_iter_offers(
+    products_urls: List[str],
+    proxies: List[str] = None,
+    timeout: int = None,
+    max_results: int = None,
+    concurrency: int = None,
+) -> AsyncIterator[Product]:
+    """
+    ### Args
+    - products_urls: `List[str]` urls of offer pages
+    - proxies: `List[str]` proxies list
+    - timeout: `int` request timeout
+    - max_results: `int` max number of products to return
+    - concurrency: `int` number of offer pages fetched at once
+
+    ### Returns
+    - `AsyncIterator[Product]` scrapped products, yielded as soon as they are scrapped
+    """
+
+    if concurrency is None:
+        concurrency = DEFAULT_CONCURRENCY
+
+    # Number of products that will be scrapped
+    if max_results is not None and max_results < len(products_urls):
+        print_num = max_results
+    else:
+        print_num = len(products_urls)
+
+    if max_results == 0:
+        return
+
+    # Limits number of offer pages fetched at once
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def scrape(product_url: str) -> Product:
+        async with semaphore:
+            return await Product.async_from_url(
+                product_url, proxies, timeout, concurrency
+            )
+
+    tasks = [asyncio.ensure_future(scrape(product_url)) for product_url in products_urls]
 
-                # Add product to list
-                products.append(product)
+    # Number of scrapped products
+    scrapped = 0
+
+    try:
+        for index, future in enumerate(asyncio.as_completed(tasks), start=1):
+            try:
+                product = await future
             # Ignore adverts and auctions
             except NotImplementedError:
                 logging.info(
-                    f'Ignoring "{product_link}" '
-                    "because it's advert or auction "
-                    f"[{index}/{print_num}]"
+                    f"Ignoring offer because it's advert or auction [{index}/{print_num}]"
                 )
+                continue
 
-    pagination_input = soup.find(
-        "input", attrs={"data-role": "page-number-input", "data-page": True}
+            scrapped += 1
+
+            logging.info(
+                f'Scrapped "{product.name}"'
+                f'{f" with url {product.url}" if logging.DEBUG >= logging.root.level else ""}'
+                f" [{scrapped}/{print_num}]"
+            )
+
+            yield product
+
+            # We've hit max results
+            if max_results == scrapped:
+                return
+    finally:
+        # Cancel offers that are no longer needed
+        for task in tasks:
+            task.cancel()
+
+
+async def async_parse_products(
+    search_term: str,
+    query_string: str = "",
+    page_num: int = 1,
+    proxies: List[str] = None,
+    max_results: int = None,
+    timeout: int = None,
+    concurrency: int = None,
+    seen: SeenOffers = None,
+) -> Tuple[List[Product], bool]:
+    """
+    ### Args
+    - search_term: `str` name of the searched item
+    - query_string: `str` query string with filters
+    - page_num: `int` number of the listing page
+    - proxies: `List[str]` proxies list
+    - max_results: `int` max number of products to return
+    - timeout: `int` request timeout
+    - concurrency: `int` number of offer pages fetched at once
+    - seen: `SeenOffers` offers already scraped by other pages or queries, skipped
+
+    ### Returns
+    - `Tuple[List[Product], bool]` scrapped products and whether there are more pages
+    """
+
+    if concurrency is None:
+        concurrency = DEFAULT_CONCURRENCY
+
+    # create url and encode spaces
+    url = _get_listing_url(search_term, query_string, page_num)
+
+    # try to parse website
+    soup = await async_get_soup(
+        url, proxies, timeout, concurrency, parse_only=LISTING_STRAINER
+    )
+
+    # Find all products on a page, each section is one product
+    sections = find_offer_sections(soup)
+
+    # Duplicate offers are skipped before they are requested
+    products_urls = (seen if seen is not None else SeenOffers()).filter(
+        [find_offer_url(section) for section in sections]
     )
 
-    last_page = int(pagination_input.get("data-maxpage"))
+    # Number of products found
+    sections_len = len(products_urls)
+
+    if max_results is not None and sections_len > max_results:
+        logging.info(
+            f"Found {sections_len} products, but only scraping {max_results} products"
+        )
+    else:
+        logging.info(f"Found {sections_len} products")
+
+    products = [
+        product
+        async for product in async_iter_offers(
+            products_urls, proxies, timeout, max_results, concurrency
+        )
+    ]
+
+    # max products
+    if max_results == len(products):
+        return products, False
 
-    if page_num == last_page:
+    if is_last_page(soup, page_num):
         logging.info("Reached last page, stopping")
         return products, False
 
@@ -0,0 +1,117 @@
+import queue
+import logging
+import threading
+import concurrent.futures
+
+from typing import Callable, Iterable, Iterator, Sequence, Tuple
+from allegro.constants import DEFAULT_MAX_QUERIES
+from allegro.search.product import Product
+
+# Put in the queue by a query when it has no more products
+_QUERY_DONE = object()
+
+
+def _put(product_queue: queue.Queue, item, stop_event: threading.Event) -> bool:
+    # Wait for free space in the queue, unless results are no longer needed
+    while not stop_event.is_set():
+        try:
+            product_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _run_query(
+    name: str,
+    job: Callable[[], Iterable[Product]],
+    product_queue: queue.Queue,
+    stop_event: threading.Event,
+):
+    if stop_event.is_set():
+        return
+
+    products = None
+
+    try:
+        products = iter(job())
+
+        for product in products:
+            # Query is resumed after the product is consumed, so offers are marked as
+            # completed only when their products are saved
+            consumed = threading.Event()
+            if not _put(product_queue, (name, product, consumed), stop_event):
+                return
+
+            while not consumed.wait(0.1):
+                if stop_event.is_set():
+                    return
+    except Exception as e:
+        logging.error(f'Query "{name}" failed: {e}')
+    finally:
+        # Let the query clean up its pool and index
+        close = getattr(products, "close", None)
+        if close is not None:
+            close()
+
+        _put(product_queue, (name, _QUERY_DONE, None), stop_event)
+
+
+def iter_queries(
+    queries: Sequence[Tuple[str, Callable[[], Iterable[Product]]]],
+    max_queries: int = None,
+) -> Iterator[Tuple[str, Product]]:
+    """
+    ### Args
+    - queries: `Sequence[Tuple[str, Callable[[], Iterable[Product]]]]` name of each query
+                                                                     and function returning
+                                                                     its products
+    - max_queries: `int` number of queries run at once
+
+    ### Returns
+    - `Iterator[Tuple[str, Product]]` name of the query and its product, in order of
+                                      completion
+
+    ### Notes
+    - Each query runs in its own thread. Queries sharing one `WorkerPool` keep at most
+      `workers` offers in its queue each, so offers of all queries are interleaved.
+    - Failed query is logged and doesn't stop other queries.
+    - Query is resumed only after its last product is consumed, so it doesn't run
+      ahead of the consumer.
+    - Closing the iterator stops queries and waits until their threads finish.
+    """
+
+    if len(queries) == 0:
+        return
+
+    workers = min(max_queries or DEFAULT_MAX_QUERIES, len(queries))
+
+    # Bounded, so queries wait when products are not consumed
+    product_queue: queue.Queue = queue.Queue(maxsize=workers * 2)
+    stop_event = threading.Event()
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="allegro-query"
+    )
+
+    for name, job in queries:
+        executor.submit(_run_query, name, job, product_queue, stop_event)
+
+    running = len(queries)
+
+    try:
+        while running > 0:
+            name, product, consumed = product_queue.get()
+
+            if product is _QUERY_DONE:
+                running -= 1
+                continue
+
+            yield name, product
+            consumed.set()
+    finally:
+        # Stop queries that are still running, queries that didn't start are skipped,
+        # running queries are waited for, so they don't outlive sessions and pools
+        stop_event.set()
+        executor.shutdown(wait=True)
@@ -0,0 +1,513 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+from allegro.constants import DEFAULT_TASK_LEASE, DEFAULT_TASK_ATTEMPTS
+
+
+class Task(NamedTuple):
+    id: str
+    kind: str
+    payload: dict
+    attempts: int
+    group: str
+
+
+class WorkQueue(ABC):
+    """
+    ### Overview
+    - Queue of tasks shared by the coordinator and workers of a distributed crawl.
+      Claimed task is leased to the worker, if it's not completed before the lease
+      ends, it's given to another worker. Tasks with the same id are queued once.
+      Tasks and results belong to groups, so many crawls can share one queue.
+
+    ### Args
+    - lease: `float` number of seconds a worker owns a claimed task
+    - max_attempts: `int` number of times a task is claimed before it's dropped
+    """
+
+    def __init__(
+        self, lease: float = DEFAULT_TASK_LEASE, max_attempts: int = DEFAULT_TASK_ATTEMPTS
+    ):
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    def put(self, task_id: str, kind: str, payload: dict, group: str = "") -> bool:
+        """
+        ### Args
+        - task_id: `str` id of the task, tasks that were already queued are skipped
+        - kind: `str` kind of the task
+        - payload: `dict` json serializable arguments of the task
+        - group: `str` group of the task, results are pushed to this group
+
+        ### Returns
+        - `bool` `True` if task was queued
+        """
+
+    @abstractmethod
+    def claim(self, worker: str) -> Optional[Task]:
+        """
+        ### Args
+        - worker: `str` id of the worker
+
+        ### Returns
+        - `Optional[Task]` leased task, `None` if there is no task to do right now
+        """
+
+    @abstractmethod
+    def complete(self, task: Task, result: str = None):
+        """
+        ### Args
+        - task: `Task` claimed task
+        - result: `str` result pushed to the group of the task, `None` if there is no result
+        """
+
+    @abstractmethod
+    def release(self, task: Task):
+        """
+        ### Args
+        - task: `Task` claimed task that failed, it can be claimed again right away
+        """
+
+    @abstractmethod
+    def pop_results(self, group: str = "", limit: int = 100) -> List[str]:
+        """
+        ### Args
+        - group: `str` group of the results
+        - limit: `int` max number of results
+
+        ### Returns
+        - `List[str]` results in order they were pushed, removed from the queue
+        """
+
+    @abstractmethod
+    def pending(self, group: str = "") -> int:
+        """
+        ### Args
+        - group: `str` group of the tasks
+
+        ### Returns
+        - `int` number of tasks in the group that were not completed or dropped
+        """
+
+    @abstractmethod
+    def cancel(self, group: str = ""):
+        """
+        ### Args
+        - group: `str` group of the tasks, its tasks are dropped
+        """
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MemoryQueue(WorkQueue):
+    """
+    ### Overview
+    - Work queue kept in memory, shared only by threads of one process. Used by tests
+      and to run coordinator and workers in one process.
+    """
+
+    def __init__(
+        self, lease: float = DEFAULT_TASK_LEASE, max_attempts: int = DEFAULT_TASK_ATTEMPTS
+    ):
+        super().__init__(lease, max_attempts)
+
+        self._tasks: Dict[str, Task] = {}
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+        self._results: Dict[str, Deque[str]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def put(self, task_id: str, kind: str, payload: dict, group: str = "") -> bool:
+        with self._lock:
+            if task_id in self._tasks:
+                return False
+
+            self._tasks[task_id] = Task(task_id, kind, payload, 0, group)
+            self._pending[task_id] = 0.0
+
+            return True
+
+    def claim(self, worker: str) -> Optional[Task]:
+        now = time.time()
+
+        with self._lock:
+            for task_id, available_at in list(self._pending.items()):
+                if available_at > now:
+                    continue
+
+                task = self._tasks[task_id]
+                task = self._tasks[task_id] = task._replace(attempts=task.attempts + 1)
+
+                if task.attempts > self.max_attempts:
+                    logging.warning(f'Dropping task "{task_id}" after {self.max_attempts} attempts')
+                    del self._pending[task_id]
+                    continue
+
+                # Leased task goes to the end of the queue
+                self._pending[task_id] = now + self.lease
+                self._pending.move_to_end(task_id)
+
+                return task
+
+        return None
+
+    def complete(self, task: Task, result: str = None):
+        with self._lock:
+            # Lease has ended and task was completed by another worker
+            if task.id not in self._pending:
+                return
+
+            del self._pending[task.id]
+
+            if result is not None:
+                self._results[task.group].append(result)
+
+    def release(self, task: Task):
+        with self._lock:
+            if task.id in self._pending:
+                self._pending[task.id] = 0.0
+
+    def pop_results(self, group: str = "", limit: int = 100) -> List[str]:
+        with self._lock:
+            results = self._results[group]
+
+            return [results.popleft() for _ in range(min(limit, len(results)))]
+
+    def pending(self, group: str = "") -> int:
+        with self._lock:
+            return sum(self._tasks[task_id].group == group for task_id in self._pending)
+
+    def cancel(self, group: str = ""):
+        with self._lock:
+            for task_id in list(self._pending):
+                if self._tasks[task_id].group == group:
+                    del self._pending[task_id]
+
+
+class SQLiteQueue(WorkQueue):
+    """
+    ### Overview
+    - Work queue stored in SQLite database, shared by processes that can open the
+      file. Claims are made in write transactions, so SQLite file lock keeps two
+      workers from claiming one task.
+
+    ### Args
+    - path: `str` path to the database file
+    - lease: `float` number of seconds a worker owns a claimed task
+    - max_attempts: `int` number of times a task is claimed before it's dropped
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease: float = DEFAULT_TASK_LEASE,
+        max_attempts: int = DEFAULT_TASK_ATTEMPTS,
+    ):
+        super().__init__(lease, max_attempts)
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        # Transactions are started by hand, workers wait for the file lock
+        self._connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, "
+            "kind TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "grp TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, "
+            "available_at REAL NOT NULL, "
+            "worker TEXT)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, grp TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        # Write lock of the database file is taken right away
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+            self._connection.execute("COMMIT")
+
+    def put(self, task_id: str, kind: str, payload: dict, group: str = "") -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, ?, 'pending', 0, 0, NULL)",
+                (task_id, kind, json.dumps(payload), group),
+            )
+
+            return cursor.rowcount == 1
+
+    def claim(self, worker: str) -> Optional[Task]:
+        with self._transaction() as connection:
+            while True:
+                now = time.time()
+                row = connection.execute(
+                    "SELECT id, kind, payload, attempts, grp FROM tasks "
+                    "WHERE state = 'pending' AND available_at <= ? "
+                    "ORDER BY available_at, rowid LIMIT 1",
+                    (now,),
+                ).fetchone()
+
+                if row is None:
+                    return None
+
+                task_id, kind, payload, attempts, group = row
+                attempts += 1
+
+                if attempts > self.max_attempts:
+                    logging.warning(
+                        f'Dropping task "{task_id}" after {self.max_attempts} attempts'
+                    )
+                    connection.execute(
+                        "UPDATE tasks SET state = 'dropped' WHERE id = ?", (task_id,)
+                    )
+                    continue
+
+                connection.execute(
+                    "UPDATE tasks SET attempts = ?, available_at = ?, worker = ? "
+                    "WHERE id = ?",
+                    (attempts, now + self.lease, worker, task_id),
+                )
+
+                return Task(task_id, kind, json.loads(payload), attempts, group)
+
+    def complete(self, task: Task, result: str = None):
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET state = 'done' WHERE id = ? AND state = 'pending'",
+                (task.id,),
+            )
+
+            # Lease has ended and task was completed by another worker
+            if cursor.rowcount == 1 and result is not None:
+                connection.execute(
+                    "INSERT INTO results (grp, data) VALUES (?, ?)", (task.group, result)
+                )
+
+    def release(self, task: Task):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE tasks SET available_at = 0 WHERE id = ? AND state = 'pending'",
+                (task.id,),
+            )
+
+    def pop_results(self, group: str = "", limit: int = 100) -> List[str]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, data FROM results WHERE grp = ? ORDER BY id LIMIT ?",
+                (group, limit),
+            ).fetchall()
+
+            if rows:
+                connection.execute(
+                    "DELETE FROM results WHERE grp = ? AND id <= ?", (group, rows[-1][0])
+                )
+
+        return [data for _, data in rows]
+
+    def pending(self, group: str = "") -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE grp = ? AND state = 'pending'", (group,)
+            ).fetchone()[0]
+
+    def cancel(self, group: str = ""):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE tasks SET state = 'cancelled' WHERE grp = ? AND state = 'pending'",
+                (group,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def _decode(value) -> str:
+    # Redis clients return bytes, unless responses are decoded
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class RedisQueue(WorkQueue):
+    """
+    ### Overview
+    - Work queue stored in Redis or any server speaking Redis protocol, shared by
+      workers on all nodes. Tasks waiting to be claimed are kept in a sorted set
+      ordered by the time they become available, claims are made with `SET NX` lease
+      keys that expire with the lease.
+
+    ### Args
+    - url: `str` url of the server, `redis://host:port/db`
+    - lease: `float` number of seconds a worker owns a claimed task
+    - max_attempts: `int` number of times a task is claimed before it's dropped
+    - prefix: `str` prefix of the keys, queues with other prefixes don't share tasks
+    - client: client with `redis.Redis` interface, created from `url` if `None`
+
+    ### Notes
+    - Requires `redis` package, unless client is passed.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        lease: float = DEFAULT_TASK_LEASE,
+        max_attempts: int = DEFAULT_TASK_ATTEMPTS,
+        prefix: str = "allegro",
+        client=None,
+    ):
+        super().__init__(lease, max_attempts)
+
+        self.url = url
+        self.prefix = prefix
+
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+
+        self._client = client
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def put(self, task_id: str, kind: str, payload: dict, group: str = "") -> bool:
+        data = json.dumps({"kind": kind, "payload": payload, "group": group})
+
+        # Tasks with the same id are queued once
+        if not self._client.hsetnx(self._key("tasks"), task_id, data):
+            return False
+
+        self._client.sadd(self._key(f"group:{group}"), task_id)
+        self._client.zadd(self._key("pending"), {task_id: 0}, nx=True)
+
+        return True
+
+    def _drop(self, task_id: str, group: str):
+        self._client.zrem(self._key("pending"), task_id)
+        self._client.srem(self._key(f"group:{group}"), task_id)
+
+    def claim(self, worker: str) -> Optional[Task]:
+        now = time.time()
+        pending = self._key("pending")
+
+        for task_id in self._client.zrangebyscore(pending, "-inf", now, start=0, num=10):
+            task_id = _decode(task_id)
+
+            # Only one worker gets the lease
+            if not self._client.set(
+                self._key(f"lease:{task_id}"), worker, nx=True, px=int(self.lease * 1000)
+            ):
+                continue
+
+            data = self._client.hget(self._key("tasks"), task_id)
+            if data is None:
+                continue
+
+            task = json.loads(_decode(data))
+            attempts = self._client.hincrby(self._key("attempts"), task_id, 1)
+
+            if attempts > self.max_attempts:
+                logging.warning(f'Dropping task "{task_id}" after {self.max_attempts} attempts')
+                self._drop(task_id, task["group"])
+                continue
+
+            # Task becomes available again when the lease ends
+            self._client.zadd(pending, {task_id: now + self.lease}, xx=True)
+
+            return Task(task_id, task["kind"], task["payload"], attempts, task["group"])
+
+        return None
+
+    def complete(self, task: Task, result: str = None):
+        # Lease has ended and task was completed by another worker
+        if not self._client.zrem(self._key("pending"), task.id):
+            return
+
+        # Result is pushed before the task stops being pending in its group
+        if result is not None:
+            self._client.rpush(self._key(f"results:{task.group}"), result)
+
+        self._client.srem(self._key(f"group:{task.group}"), task.id)
+        self._client.delete(self._key(f"lease:{task.id}"))
+
+    def release(self, task: Task):
+        self._client.delete(self._key(f"lease:{task.id}"))
+        self._client.zadd(self._key("pending"), {task.id: 0}, xx=True)
+
+    def pop_results(self, group: str = "", limit: int = 100) -> List[str]:
+        results = self._key(f"results:{group}")
+
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.lrange(results, 0, limit - 1)
+        pipeline.ltrim(results, limit, -1)
+        values, _ = pipeline.execute()
+
+        return [_decode(value) for value in values]
+
+    def pending(self, group: str = "") -> int:
+        return self._client.scard(self._key(f"group:{group}"))
+
+    def cancel(self, group: str = ""):
+        for task_id in self._client.smembers(self._key(f"group:{group}")):
+            self._drop(_decode(task_id), group)
+
+    def close(self):
+        close = getattr(self._client, "close", None)
+        if close is not None:
+            close()
+
+
+def get_work_queue(url: str, lease: float = None, max_attempts: int = None) -> WorkQueue:
+    """
+    ### Args
+    - url: `str` `redis://host:port/db`, `memory://` or path to SQLite database file
+    - lease: `float` number of seconds a worker owns a claimed task
+    - max_attempts: `int` number of times a task is claimed before it's dropped
+
+    ### Returns
+    - `WorkQueue` queue backend matching the url
+    """
+
+    lease = lease if lease is not None else DEFAULT_TASK_LEASE
+    max_attempts = max_attempts if max_attempts is not None else DEFAULT_TASK_ATTEMPTS
+    scheme = urlsplit(url).scheme
+
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisQueue(url, lease, max_attempts)
+
+    if scheme == "memory":
+        return MemoryQueue(lease, max_attempts)
+
+    if scheme == "sqlite":
+        url = url[len("sqlite://"):]
+
+    return SQLiteQueue(url, lease, max_attempts)
@@ -1,4 +1,4 @@
-from typing import Optional, TypedDict
+from typing import Any, Callable, Literal, Optional, TypedDict
 
 
 class Options(TypedDict):
@@ -8,5 +8,35 @@ class Options(TypedDict):
     use_free_proxies: Optional[bool]
     proxies_file: Optional[str]
     check_proxies: Optional[bool]
+    proxy_check_workers: Optional[int]
+    max_proxies: Optional[int]
+    proxy_check_url: Optional[str]
+    proxy_reputation: Optional[str]
     request_timeout: Optional[int]
     threads: Optional[int]
+    worker_kind: Optional[Literal["thread", "process", "async"]]
+    concurrency: Optional[int]
+    pool_size: Optional[int]
+    queue_size: Optional[int]
+    parser_backend: Optional[Literal["html.parser", "lxml", "selectolax"]]
+    cache_dir: Optional[str]
+    cache_listing_ttl: Optional[int]
+    cache_offer_ttl: Optional[int]
+    cache_size: Optional[int]
+    index_path: Optional[str]
+    listing_only: Optional[bool]
+    rate_limit: Optional[float]
+    rate_burst: Optional[int]
+    proxy_rate_limit: Optional[float]
+    proxy_rate_burst: Optional[int]
+    max_retries: Optional[int]
+    retry_backoff: Optional[float]
+    retry_budget: Optional[int]
+    checkpoint_path: Optional[str]
+    resume: Optional[bool]
+    max_queries: Optional[int]
+    work_queue: Optional[str]
+    task_lease: Optional[float]
+    metrics_port: Optional[int]
+    profile_path: Optional[str]
+    fetch_if: Optional[Callable[[Any], bool]]
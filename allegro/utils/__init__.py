@@ -1,4 +1,57 @@
 # flake8: noqa
 
-from allegro.utils.soup import get_soup
-from allegro.utils.check import check_soup, check_captcha
+from allegro.utils.soup import get_soup, async_get_soup
+from allegro.utils.check import (
+    check_soup,
+    check_page,
+    check_captcha,
+    classify_response,
+    classify_exception,
+    ResponseKind,
+)
+from allegro.utils.session import (
+    get_session,
+    get_proxy_object,
+    set_pool_size,
+    ensure_pool_size,
+    close_sessions,
+)
+from allegro.utils.html import (
+    make_soup,
+    set_parser_backend,
+    get_parser_backend,
+    SelectolaxNode,
+    PARSER_BACKENDS,
+)
+from allegro.utils.cache import (
+    ResponseCache,
+    set_cache,
+    get_cache,
+    normalize_url,
+    get_url_kind,
+    cache_from_options,
+)
+from allegro.utils.proxy_pool import ProxyPool, ProxyStats, get_proxy_pool
+from allegro.utils.rate_limit import (
+    TokenBucket,
+    RateLimiter,
+    set_rate_limiter,
+    get_rate_limiter,
+    rate_limiter_from_options,
+)
+from allegro.utils.retry import (
+    RetryPolicy,
+    CircuitBreaker,
+    set_retry_policy,
+    get_retry_policy,
+    retry_policy_from_options,
+)
+from allegro.utils.metrics import (
+    Metrics,
+    MetricsRegistry,
+    MetricsServer,
+    set_metrics,
+    get_metrics,
+    start_metrics_server,
+)
+from allegro.utils.profiler import Profiler, set_profiler, get_profiler
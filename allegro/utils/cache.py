@@ -0,0 +1,351 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+
+from typing import NamedTuple, Optional
+from allegro.types import Options
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from allegro.constants import (
+    DEFAULT_CACHE_LISTING_TTL,
+    DEFAULT_CACHE_OFFER_TTL,
+    DEFAULT_CACHE_SIZE,
+)
+
+# Request headers that change the response
+_VARY_HEADERS = ("Accept-Language", "User-Agent")
+
+# Response headers kept in the cache
+_STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+# Suffix of the cache files
+_SUFFIX = ".gz"
+
+_cache: Optional["ResponseCache"] = None
+
+
+class CachedResponse(NamedTuple):
+    response: requests.Response
+    path: str
+    fresh: bool
+
+
+def normalize_url(url: str) -> str:
+    """
+    ### Args
+    - url: `str` url of the page
+
+    ### Returns
+    - `str` url with lowercase host, sorted query and without fragment
+    """
+
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, "")
+    )
+
+
+def get_url_kind(url: str) -> str:
+    """
+    ### Args
+    - url: `str` url of the page
+
+    ### Returns
+    - `str` `"offer"` for offer pages, `"listing"` for everything else
+    """
+
+    if "/oferta/" in urlsplit(url).path:
+        return "offer"
+
+    return "listing"
+
+
+class ResponseCache:
+    """
+    ### Overview
+    - Gzip compressed on-disk cache of pages, shared by threads and processes.
+    - File modification time is the time the page was stored or revalidated,
+      access time is the time it was last used and is used for LRU eviction.
+
+    ### Args
+    - directory: `str` directory with cached pages
+    - listing_ttl: `int` number of seconds listing pages are fresh
+    - offer_ttl: `int` number of seconds offer pages are fresh
+    - max_size: `int` max size of the cache in bytes
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        listing_ttl: int = DEFAULT_CACHE_LISTING_TTL,
+        offer_ttl: int = DEFAULT_CACHE_OFFER_TTL,
+        max_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.directory = directory
+        self.listing_ttl = listing_ttl
+        self.offer_ttl = offer_ttl
+        self.max_size = max_size
+
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __reduce__(self):
+        # Cache is recreated from its settings in worker processes
+        return (
+            self.__class__,
+            (self.directory, self.listing_ttl, self.offer_ttl, self.max_size),
+        )
+
+    def get_path(self, url: str, headers: dict = None) -> str:
+        """
+        ### Args
+        - url: `str` url of the page
+        - headers: `dict` request headers
+
+        ### Returns
+        - `str` path of the cache file
+        """
+
+        key = normalize_url(url)
+        for name in _VARY_HEADERS:
+            key += f"\n{name}: {(headers or {}).get(name, '')}"
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.directory, digest + _SUFFIX)
+
+    def get_ttl(self, url: str) -> int:
+        if get_url_kind(url) == "offer":
+            return self.offer_ttl
+
+        return self.listing_ttl
+
+    def load(self, url: str, headers: dict = None) -> Optional[CachedResponse]:
+        """
+        ### Args
+        - url: `str` url of the page
+        - headers: `dict` request headers
+
+        ### Returns
+        - `Optional[CachedResponse]` cached response, `None` if page is not cached
+        """
+
+        path = self.get_path(url, headers)
+
+        try:
+            stored = os.stat(path).st_mtime
+            with open(path, "rb") as file:
+                data = gzip.decompress(file.read())
+        except (OSError, EOFError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.debug(f"Failed to read cached page {path}")
+                logging.debug(e)
+
+            return None
+
+        meta, _, content = data.partition(b"\n")
+        meta = json.loads(meta)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = meta["url"]
+        response.encoding = meta["encoding"]
+        response.headers.update(meta["headers"])
+        response._content = content
+
+        fresh = time.time() - stored < self.get_ttl(url)
+
+        # Mark page as recently used
+        self._touch(path, stored)
+
+        return CachedResponse(response, path, fresh)
+
+    def store(self, url: str, headers: dict, response: requests.Response):
+        """
+        ### Args
+        - url: `str` url of the page
+        - headers: `dict` request headers
+        - response: `requests.Response` response with the page
+        """
+
+        path = self.get_path(url, headers)
+
+        meta = {
+            "url": url,
+            "encoding": response.encoding,
+            "headers": {
+                name: response.headers[name]
+                for name in _STORED_HEADERS
+                if name in response.headers
+            },
+        }
+        data = gzip.compress(
+            json.dumps(meta).encode("utf-8") + b"\n" + response.content, 5
+        )
+
+        # Write to temporary file first, so other workers never read partial files
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.debug(f"Failed to cache page {url}")
+            logging.debug(e)
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - old_size
+
+        self._evict()
+
+    def revalidate(
+        self, cached: CachedResponse, response: requests.Response
+    ) -> requests.Response:
+        """
+        ### Args
+        - cached: `CachedResponse` stale cached response
+        - response: `requests.Response` `304 Not Modified` response from the server
+
+        ### Returns
+        - `requests.Response` cached response, fresh again
+        """
+
+        for name in ("ETag", "Last-Modified"):
+            if name in response.headers:
+                cached.response.headers[name] = response.headers[name]
+
+        self._touch(cached.path, time.time())
+
+        return cached.response
+
+    def clear(self):
+        """
+        Remove all cached pages
+        """
+
+        with self._lock:
+            for entry in self._scan():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+            self._size = 0
+
+    def _touch(self, path: str, stored: float):
+        try:
+            os.utime(path, (time.time(), stored))
+        except OSError:
+            pass
+
+    def _scan(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.name.endswith(_SUFFIX)]
+
+    def _evict(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._scan())
+
+            if self._size <= self.max_size:
+                return
+
+            # Remove least recently used pages, files may be removed by other processes
+            entries = []
+            for entry in self._scan():
+                try:
+                    entries.append((entry.stat().st_atime, entry.stat().st_size, entry))
+                except OSError:
+                    pass
+
+            self._size = sum(size for _, size, _ in entries)
+            entries.sort(key=lambda item: item[0])
+
+            for _, size, entry in entries:
+                if self._size <= self.max_size:
+                    break
+
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+
+                self._size -= size
+
+
+def conditional_headers(cached: CachedResponse) -> dict:
+    """
+    ### Args
+    - cached: `CachedResponse` stale cached response
+
+    ### Returns
+    - `dict` headers used to revalidate the cached page
+    """
+
+    headers = {}
+
+    if "ETag" in cached.response.headers:
+        headers["If-None-Match"] = cached.response.headers["ETag"]
+
+    if "Last-Modified" in cached.response.headers:
+        headers["If-Modified-Since"] = cached.response.headers["Last-Modified"]
+
+    return headers
+
+
+def cache_from_options(options: Options) -> Optional[ResponseCache]:
+    """
+    ### Args
+    - options: `Options` options with cache settings, cache size is in megabytes
+
+    ### Returns
+    - `Optional[ResponseCache]` cache, `None` if cache directory is not set
+    """
+
+    cache_dir = options.get("cache_dir")
+    if cache_dir is None:
+        return None
+
+    # Zero is a valid setting, ex. listing pages that are always revalidated
+    listing_ttl = options.get("cache_listing_ttl")
+    offer_ttl = options.get("cache_offer_ttl")
+    cache_size = options.get("cache_size")
+
+    return ResponseCache(
+        cache_dir,
+        listing_ttl=listing_ttl if listing_ttl is not None else DEFAULT_CACHE_LISTING_TTL,
+        offer_ttl=offer_ttl if offer_ttl is not None else DEFAULT_CACHE_OFFER_TTL,
+        max_size=cache_size * 1024 * 1024 if cache_size is not None else DEFAULT_CACHE_SIZE,
+    )
+
+
+def set_cache(cache: Optional[ResponseCache]):
+    """
+    ### Args
+    - cache: `Optional[ResponseCache]` cache used by `get_soup`, `None` disables it
+    """
+
+    global _cache
+
+    _cache = cache
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    ### Returns
+    - `Optional[ResponseCache]` cache used by `get_soup`
+    """
+
+    return _cache
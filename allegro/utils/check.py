@@ -1,29 +1,234 @@
+import time
 import logging
 import requests
 
-from bs4 import BeautifulSoup
-from typing import Optional
+from enum import Enum
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Optional, Tuple
 from allegro.constants import HEADERS
+from allegro.utils.html import make_soup
+from allegro.utils.cache import get_cache, conditional_headers
+from allegro.utils.rate_limit import get_rate_limiter
+from allegro.utils.metrics import get_metrics, get_proxy_label
+from allegro.utils.profiler import get_profiler
+from allegro.utils.session import get_session
 
 
-def check_soup(
-    url: str, proxies: dict = None, timeout: int = None
-) -> Optional[BeautifulSoup]:
+class ResponseKind(Enum):
+    """
+    ### Overview
+    - Kind of the response, found before the page is parsed.
+    """
+
+    OK = "ok"
+    CAPTCHA = "captcha"
+    JS_WALL = "js_wall"
+    RATE_LIMIT = "rate_limit"
+    TIMEOUT = "timeout"
+    CONNECTION = "connection"
+    SERVER_ERROR = "server_error"
+    ERROR = "error"
+
+    @property
+    def blocked(self) -> bool:
+        return self in (ResponseKind.CAPTCHA, ResponseKind.JS_WALL, ResponseKind.RATE_LIMIT)
+
+    @property
+    def transient(self) -> bool:
+        return self in (
+            ResponseKind.RATE_LIMIT,
+            ResponseKind.TIMEOUT,
+            ResponseKind.CONNECTION,
+            ResponseKind.SERVER_ERROR,
+        )
+
+
+# Markers of pages asking to solve a captcha
+_CAPTCHA_MARKERS = (b"'t':'fe'", b"captcha-delivery.com/captcha", b"g-recaptcha", b"h-captcha")
+
+# Markers of pages that require javascript (DataDome interstitial)
+_JS_WALL_MARKERS = (b"captcha-delivery.com", b"enable JS", b"enable JavaScript")
+
+# Pages smaller than this are checked for markers, real pages are much bigger
+_SMALL_PAGE_SIZE = 64 * 1024
+
+
+def classify_response(response: requests.Response) -> ResponseKind:
+    """
+    ### Args
+    - response: `requests.Response` response from the server
+
+    ### Returns
+    - `ResponseKind` kind of the response, only status, headers and raw bytes are used
+    """
+
+    if response.status_code == 429 or response.headers.get("x-reason") == "Too Many Requests":
+        return ResponseKind.RATE_LIMIT
+
+    if response.status_code >= 500:
+        return ResponseKind.SERVER_ERROR
+
+    content = response.content
+
+    # Block pages are small, so markers are only searched in small pages
+    if len(content) < _SMALL_PAGE_SIZE or response.status_code == 403:
+        if any(marker in content for marker in _CAPTCHA_MARKERS):
+            return ResponseKind.CAPTCHA
+
+        if any(marker in content for marker in _JS_WALL_MARKERS):
+            return ResponseKind.JS_WALL
+
+    # Forbidden without known markers, proxy is blocked anyway
+    if response.status_code == 403:
+        return ResponseKind.CAPTCHA
+
+    # less than 10 divs so we probably got warning to enable javascript
+    if content.count(b"<div") < 10:
+        return ResponseKind.JS_WALL
+
+    return ResponseKind.OK
+
+
+def classify_exception(error: Exception) -> ResponseKind:
+    """
+    ### Args
+    - error: `Exception` exception raised while sending the request
+
+    ### Returns
+    - `ResponseKind` kind of the failure
+    """
+
+    # Connect timeouts are connection errors too, so timeouts are checked first
+    if isinstance(error, requests.Timeout):
+        return ResponseKind.TIMEOUT
+
+    if isinstance(error, requests.ConnectionError):
+        return ResponseKind.CONNECTION
+
+    return ResponseKind.ERROR
+
+
+def _fetch(url: str, proxies: dict = None, timeout: int = None):
+    cache = get_cache()
+    cached = cache.load(url, HEADERS) if cache is not None else None
+
+    # Fresh pages are not requested at all
+    if cached is not None and cached.fresh:
+        logging.debug(f"Using cached page {url}")
+        return cached.response, None
+
+    headers = HEADERS
+    if cached is not None:
+        headers = {**HEADERS, **conditional_headers(cached)}
+
+    # Wait for free slot of the host and proxy
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        rate_limiter.wait(url, proxies)
+
+    # Send http GET request, body is downloaded separately to measure both
+    start = time.perf_counter()
+    request = get_session(proxies).get(
+        url, headers=headers, proxies=proxies, timeout=timeout, stream=True
+    )
+    first_byte = time.perf_counter()
+    content = request.content
+    end = time.perf_counter()
+
+    metrics = get_metrics()
+    metrics.observe(
+        "allegro_request_seconds", end - start, proxy=get_proxy_label(proxies)
+    )
+    metrics.inc("allegro_downloaded_bytes_total", len(content))
+
+    profiler = get_profiler()
+    if profiler is not None:
+        # Name lookup and connect are measured in urllib3 by the profiler
+        connect = profiler.get_time("dns", "connect")
+        profiler.record("ttfb", first_byte - start - connect)
+        profiler.record("download", end - first_byte)
+
+    # Page didn't change since it was cached
+    if cache is not None and cached is not None and request.status_code == 304:
+        logging.debug(f"Revalidated cached page {url}")
+        return cache.revalidate(cached, request), None
+
+    return request, cache
+
+
+def check_page(
+    url: str,
+    proxies: dict = None,
+    timeout: int = None,
+    parse_only: SoupStrainer = None,
+) -> Tuple[Optional[BeautifulSoup], ResponseKind]:
+    """
+    ### Args
+    - url: `str` url of the page
+    - proxies: `dict` proxy object passed to requests
+    - timeout: `int` request timeout
+    - parse_only: `SoupStrainer` only matching parts of the page are parsed
+
+    ### Returns
+    - `Tuple[Optional[BeautifulSoup], ResponseKind]` soup, `None` if page is blocked
+    """
+
+    metrics = get_metrics()
+    profiler = get_profiler()
+
+    if profiler is not None:
+        profiler.begin(url, get_proxy_label(proxies))
+
     try:
-        # Send http GET request
-        request = requests.get(url, headers=HEADERS, proxies=proxies, timeout=timeout)
+        request, cache = _fetch(url, proxies, timeout)
     except Exception as e:
         logging.debug("Failed to get response from server")
         logging.debug(e)
-        return None
+
+        kind = classify_exception(e)
+        metrics.inc("allegro_responses_total", kind=kind.value)
+
+        if profiler is not None:
+            profiler.end(kind.value)
+
+        return None, kind
+
+    # Blocked pages are never parsed
+    kind = classify_response(request)
+    metrics.inc("allegro_responses_total", kind=kind.value)
+
+    if profiler is not None:
+        profiler.end(kind.value)
+
+    if kind is not ResponseKind.OK:
+        logging.debug(f'Got "{kind.value}" response from {url}')
+        return None, kind
+
+    # Only pages that are not blocked are cached
+    if cache is not None and request.status_code == 200:
+        cache.store(url, HEADERS, request)
 
     # Parse website
-    soup = BeautifulSoup(request.text, "html.parser")
+    start = time.perf_counter()
+    soup = make_soup(request.text, parse_only=parse_only)
+    parse_time = time.perf_counter() - start
+    metrics.observe("allegro_parse_seconds", parse_time)
+
+    if profiler is not None:
+        profiler.record("parse", parse_time)
+
+    return soup, kind
+
+
+def check_soup(
+    url: str,
+    proxies: dict = None,
+    timeout: int = None,
+    parse_only: SoupStrainer = None,
+) -> Optional[BeautifulSoup]:
+    soup, _ = check_page(url, proxies, timeout, parse_only)
 
-    if check_captcha(soup):
-        return None
-    else:
-        return soup
+    return soup
 
 
 def check_captcha(soup: BeautifulSoup) -> bool:
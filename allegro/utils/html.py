@@ -0,0 +1,154 @@
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import List, Optional
+from allegro.constants import DEFAULT_PARSER_BACKEND
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+# Attributes that bs4 treats as lists of tokens
+MULTI_VALUED_ATTRIBUTES = {
+    "class",
+    "rel",
+    "rev",
+    "accept-charset",
+    "headers",
+    "accesskey",
+    "dropzone",
+}
+
+_parser_backend = DEFAULT_PARSER_BACKEND
+
+
+def _build_selector(name: str = None, attrs: dict = None) -> str:
+    selector = name or "*"
+
+    for key, value in (attrs or {}).items():
+        if value is True:
+            selector += f"[{key}]"
+        elif value is None or value is False:
+            selector += f":not([{key}])"
+        else:
+            # bs4 matches single token of multi valued attributes
+            operator = "~=" if key in MULTI_VALUED_ATTRIBUTES else "="
+            escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            selector += f'[{key}{operator}"{escaped}"]'
+
+    return selector
+
+
+class SelectolaxNode:
+    """
+    ### Overview
+    - Wraps selectolax (lexbor) node with the part of `BeautifulSoup` api used by
+      the parsers, so `find_product_*` functions work with every backend.
+
+    ### Args
+    - node: `LexborNode` wrapped node
+    """
+
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def find_all(
+        self,
+        name: str = None,
+        attrs: dict = None,
+        recursive: bool = True,
+        limit: int = None,
+    ) -> List["SelectolaxNode"]:
+        selector = _build_selector(name, attrs)
+
+        if recursive:
+            # Lexbor matches the node itself, bs4 only searches descendants
+            nodes = [node for node in self.node.css(selector) if node != self.node]
+        else:
+            nodes = [child for child in self.node.iter() if child.css_matches(selector)]
+
+        if limit is not None:
+            nodes = nodes[:limit]
+
+        return [SelectolaxNode(node) for node in nodes]
+
+    def find(
+        self, name: str = None, attrs: dict = None, recursive: bool = True
+    ) -> Optional["SelectolaxNode"]:
+        if recursive:
+            node = self.node.css_first(_build_selector(name, attrs))
+
+            if node is None:
+                return None
+
+            if node != self.node:
+                return SelectolaxNode(node)
+
+        nodes = self.find_all(name, attrs, recursive=recursive, limit=1)
+
+        return nodes[0] if len(nodes) >= 1 else None
+
+    def get(self, key: str, default=None):
+        return self.node.attributes.get(key, default)
+
+    def __getitem__(self, key: str):
+        return self.node.attributes[key]
+
+    @property
+    def attrs(self) -> dict:
+        return self.node.attributes
+
+    @property
+    def name(self) -> str:
+        return self.node.tag
+
+    @property
+    def text(self) -> str:
+        return self.node.text(deep=True)
+
+
+def set_parser_backend(backend: str):
+    """
+    ### Args
+    - backend: `str` "html.parser", "lxml" or "selectolax"
+
+    ### Notes
+    - lxml and selectolax have to be installed, `pip install allegro-scraper[fast]`
+    """
+
+    global _parser_backend
+
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+
+    # Fail early if backend is not installed
+    if backend == "lxml":
+        import lxml  # noqa: F401
+    elif backend == "selectolax":
+        import selectolax.lexbor  # noqa: F401
+
+    _parser_backend = backend
+
+
+def get_parser_backend() -> str:
+    return _parser_backend
+
+
+def make_soup(markup: str, backend: str = None, parse_only: SoupStrainer = None):
+    """
+    ### Args
+    - markup: `str` html of the page
+    - backend: `str` parser backend, backend set with `set_parser_backend` if `None`
+    - parse_only: `SoupStrainer` only matching parts of the page are kept by bs4
+                                 backends, selectolax always parses whole page
+
+    ### Returns
+    - `BeautifulSoup` or `SelectolaxNode` parsed page
+    """
+
+    backend = backend or _parser_backend
+
+    if backend == "selectolax":
+        from selectolax.lexbor import LexborHTMLParser
+
+        return SelectolaxNode(LexborHTMLParser(markup).root)
+
+    return BeautifulSoup(markup, backend, parse_only=parse_only)
@@ -0,0 +1,450 @@
+import time
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Optional, Tuple
+from allegro.constants import DEFAULT_METRICS_BUCKETS
+
+# Descriptions of metrics collected by the scraper
+METRICS_HELP = {
+    "allegro_request_seconds": "Time of http requests, by proxy",
+    "allegro_downloaded_bytes_total": "Bytes of downloaded pages",
+    "allegro_responses_total": "Responses by kind, blocked pages included",
+    "allegro_parse_seconds": "Time of parsing pages",
+    "allegro_extract_seconds": "Time of extracting product fields from offer pages",
+    "allegro_retries_total": "Retries of pages after transient failures, by kind",
+    "allegro_queue_depth": "Offers and tasks waiting to be scraped, by queue",
+    "allegro_products_total": "Scraped offer pages",
+}
+
+# Labels of one series, sorted by name
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """
+    ### Overview
+    - Interface of metrics collected by the scraper, this class ignores all of them.
+      Subclass it to send metrics somewhere else and pass it to `set_metrics`.
+
+    ### Notes
+    - Labels are passed as keyword arguments, ex. `inc("allegro_retries_total", kind="timeout")`.
+    - Metrics object is pickled to worker processes, `flush` and `merge` are used to send
+      metrics of offers scraped in worker processes back to the main process.
+    """
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        """
+        ### Args
+        - name: `str` name of the counter
+        - value: `float` value added to the counter
+        """
+
+    def observe(self, name: str, value: float, **labels: str):
+        """
+        ### Args
+        - name: `str` name of the histogram
+        - value: `float` observed value, ex. number of seconds
+        """
+
+    def set(self, name: str, value: float, **labels: str):
+        """
+        ### Args
+        - name: `str` name of the gauge
+        - value: `float` current value
+        """
+
+    def flush(self) -> Optional[dict]:
+        """
+        ### Returns
+        - `Optional[dict]` counters and histograms collected since last flush
+        """
+
+        return None
+
+    def merge(self, data: Optional[dict]):
+        """
+        ### Args
+        - data: `Optional[dict]` data returned by `flush` of other metrics object
+        """
+
+    def get_summary(self) -> List[str]:
+        """
+        ### Returns
+        - `List[str]` lines with summary of the collected metrics
+        """
+
+        return []
+
+
+_metrics: Metrics = Metrics()
+
+
+def _get_key(labels: Dict[str, str]) -> LabelsKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelsKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    labels = key + extra
+    if len(labels) == 0:
+        return ""
+
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry(Metrics):
+    """
+    ### Overview
+    - Keeps counters, gauges and histograms in memory, they can be rendered in
+      Prometheus text format or summarized at the end of the crawl.
+
+    ### Args
+    - buckets: `Tuple[float, ...]` upper bounds of histogram buckets
+
+    ### Public attributes
+    - started: `float` time when the registry was created, used to compute rates
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.started = time.time()
+
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelsKey, float]] = {}
+
+        # Count of every bucket, then sum and count of observed values
+        self._histograms: Dict[str, Dict[LabelsKey, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Worker processes start with empty registry
+        return (self.__class__, (self.buckets,))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        key = _get_key(labels)
+
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = _get_key(labels)
+
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0.0] * (len(self.buckets) + 2)
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+
+            values[-2] += value
+            values[-1] += 1
+
+    def set(self, name: str, value: float, **labels: str):
+        key = _get_key(labels)
+
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def flush(self) -> Optional[dict]:
+        # Gauges are current values of this process, so they are not sent
+        with self._lock:
+            data = {"counters": self._counters, "histograms": self._histograms}
+            self._counters = {}
+            self._histograms = {}
+
+        return data
+
+    def merge(self, data: Optional[dict]):
+        if data is None:
+            return
+
+        with self._lock:
+            for name, series in data["counters"].items():
+                counters = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    counters[key] = counters.get(key, 0.0) + value
+
+            for name, series in data["histograms"].items():
+                histograms = self._histograms.setdefault(name, {})
+                for key, values in series.items():
+                    current = histograms.get(key)
+                    if current is None:
+                        histograms[key] = list(values)
+                    else:
+                        histograms[key] = [a + b for a, b in zip(current, values)]
+
+    def get_value(self, name: str, **labels: str) -> float:
+        """
+        ### Args
+        - name: `str` name of the counter or gauge
+        - labels: only series with these labels are counted
+
+        ### Returns
+        - `float` sum of matching series
+        """
+
+        wanted = set(_get_key(labels))
+
+        with self._lock:
+            series = {**self._counters.get(name, {}), **self._gauges.get(name, {})}
+
+            return sum(value for key, value in series.items() if wanted <= set(key))
+
+    def get_histogram(self, name: str, **labels: str) -> Tuple[float, int]:
+        """
+        ### Args
+        - name: `str` name of the histogram
+        - labels: only series with these labels are counted
+
+        ### Returns
+        - `Tuple[float, int]` sum and count of observed values
+        """
+
+        wanted = set(_get_key(labels))
+        total = 0.0
+        count = 0
+
+        with self._lock:
+            for key, values in self._histograms.get(name, {}).items():
+                if wanted <= set(key):
+                    total += values[-2]
+                    count += int(values[-1])
+
+        return total, count
+
+    def render(self) -> str:
+        """
+        ### Returns
+        - `str` metrics in Prometheus text exposition format
+        """
+
+        lines = []
+
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    if name in METRICS_HELP:
+                        lines.append(f"# HELP {name} {METRICS_HELP[name]}")
+
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+            for name, histogram in sorted(self._histograms.items()):
+                if name in METRICS_HELP:
+                    lines.append(f"# HELP {name} {METRICS_HELP[name]}")
+
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(histogram.items()):
+                    bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+                    counts = values[: len(self.buckets)] + [values[-1]]
+
+                    for bound, count in zip(bounds, counts):
+                        labels = _format_labels(key, (("le", bound),))
+                        lines.append(f"{name}_bucket{labels} {_format_value(count)}")
+
+                    labels = _format_labels(key)
+                    lines.append(f"{name}_sum{labels} {_format_value(values[-2])}")
+                    lines.append(f"{name}_count{labels} {_format_value(values[-1])}")
+
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self) -> List[str]:
+        elapsed = max(time.time() - self.started, 1e-9)
+        summary = []
+
+        request_time, requests = self.get_histogram("allegro_request_seconds")
+        downloaded = self.get_value("allegro_downloaded_bytes_total")
+        if requests > 0:
+            summary.append(
+                f"Requests: {requests}, {request_time / requests:.2f}s on average, "
+                f"{downloaded / 1024 / 1024:.1f} MB downloaded"
+            )
+
+        with self._lock:
+            responses = dict(self._counters.get("allegro_responses_total", {}))
+            proxies = sorted(
+                {
+                    value
+                    for key in self._histograms.get("allegro_request_seconds", {})
+                    for name, value in key
+                    if name == "proxy"
+                }
+            )
+
+        responses_num = sum(responses.values())
+        if responses_num > 0:
+            kinds: Dict[str, float] = {}
+            for key, value in responses.items():
+                kind = dict(key).get("kind", "")
+                kinds[kind] = kinds.get(kind, 0.0) + value
+
+            blocked = sum(
+                kinds.get(kind, 0.0) for kind in ("captcha", "js_wall", "rate_limit")
+            )
+            summary.append(
+                "Responses: "
+                + ", ".join(f"{kind} {int(value)}" for kind, value in sorted(kinds.items()))
+                + f" ({blocked / responses_num:.1%} blocked)"
+            )
+
+        retries = self.get_value("allegro_retries_total")
+        if retries > 0:
+            summary.append(f"Retries: {int(retries)}")
+
+        parse_time, parsed = self.get_histogram("allegro_parse_seconds")
+        extract_time, extracted = self.get_histogram("allegro_extract_seconds")
+        if parsed > 0:
+            summary.append(
+                f"Parsing: {parse_time / parsed * 1000:.1f}ms per page"
+                + (
+                    f", extraction: {extract_time / extracted * 1000:.1f}ms per offer"
+                    if extracted > 0
+                    else ""
+                )
+            )
+
+        products = self.get_value("allegro_products_total")
+        summary.append(
+            f"Products: {int(products)} in {elapsed:.1f}s ({products / elapsed:.2f}/s)"
+        )
+
+        # Latency of every proxy helps to find slow ones
+        if len(proxies) > 1:
+            for proxy in proxies:
+                proxy_time, proxy_requests = self.get_histogram(
+                    "allegro_request_seconds", proxy=proxy
+                )
+                summary.append(
+                    f"Proxy {proxy}: {proxy_requests} requests, "
+                    f"{proxy_time / proxy_requests:.2f}s on average"
+                )
+
+        return summary
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self):
+        body = self.registry.render().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics request: {format % args}")
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    ### Overview
+    - Http server exposing metrics in Prometheus text format, runs in a daemon thread.
+
+    ### Args
+    - registry: `MetricsRegistry` rendered registry
+    - port: `int` port of the server, 0 picks free port
+    - host: `str` address of the server, all interfaces by default
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = ""):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        super().__init__((host, port), handler)
+
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="allegro-metrics", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_metrics_server(
+    port: int, registry: MetricsRegistry = None, host: str = ""
+) -> MetricsServer:
+    """
+    ### Args
+    - port: `int` port of the server, 0 picks free port
+    - registry: `MetricsRegistry` rendered registry, registry set with `set_metrics`
+                                  if `None`
+    - host: `str` address of the server, all interfaces by default
+
+    ### Returns
+    - `MetricsServer` running server, `stop` shuts it down
+    """
+
+    if registry is None:
+        metrics = get_metrics()
+        if not isinstance(metrics, MetricsRegistry):
+            raise ValueError("Metrics set with set_metrics can't be rendered")
+
+        registry = metrics
+
+    return MetricsServer(registry, port, host).start()
+
+
+def get_proxy_label(proxies: dict = None) -> str:
+    """
+    ### Args
+    - proxies: `dict` proxy object passed to requests
+
+    ### Returns
+    - `str` address of the proxy without credentials, "direct" without proxy
+    """
+
+    if not proxies:
+        return "direct"
+
+    proxy = proxies.get("https") or proxies.get("http") or ""
+
+    return proxy.split("://", 1)[-1].rsplit("@", 1)[-1].rstrip("/")
+
+
+def set_metrics(metrics: Metrics):
+    """
+    ### Args
+    - metrics: `Metrics` object collecting metrics of the scraper
+    """
+
+    global _metrics
+
+    _metrics = metrics
+
+
+def get_metrics() -> Metrics:
+    """
+    ### Returns
+    - `Metrics` object collecting metrics of the scraper, by default metrics are ignored
+    """
+
+    return _metrics
@@ -0,0 +1,350 @@
+import io
+import sys
+import time
+import pstats
+import socket
+import cProfile
+import threading
+
+from typing import Dict, List, Optional
+
+# Phases of one request, in the order they happen
+PHASES = ("dns", "connect", "ttfb", "download", "parse", "extract")
+
+# Number of requests shown in the slowest requests section of the report
+_SLOWEST_REQUESTS = 20
+
+# Number of functions shown in the cpu profile section of the report
+_PROFILE_FUNCTIONS = 50
+
+_profiler: Optional["Profiler"] = None
+
+
+class _Stats:
+    # Stats of other process, loaded by `pstats.Stats` like a profile
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class _TimedSocket:
+    # Socket module used by urllib3, name lookups are timed
+    def __init__(self, profiler: "Profiler"):
+        self._profiler = profiler
+
+    def __getattr__(self, name: str):
+        return getattr(socket, name)
+
+    def getaddrinfo(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return socket.getaddrinfo(*args, **kwargs)
+        finally:
+            self._profiler.record("dns", time.perf_counter() - start)
+
+
+class Profiler:
+    """
+    ### Overview
+    - Collects cpu profile of every thread started after `start` and timeline of
+      every request split into phases: name lookup, connect, time to first byte
+      (tls handshake included), download, parse and extract.
+
+    ### Public attributes
+    - started: `float` time when profiling started
+
+    ### Notes
+    - Profiler is pickled to worker processes, `flush` and `merge` are used to send
+      profiles of offers scraped in worker processes back to the main process.
+    - Phases are measured in the thread sending the request, so they are assigned
+      to the request started last by the thread.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+
+        self._profiles: List[cProfile.Profile] = []
+        self._stats: List[dict] = []
+        self._timeline: List[dict] = []
+        self._latest: Dict[str, dict] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._patched: Optional[tuple] = None
+
+    def __reduce__(self):
+        # Worker processes start with empty profile
+        return (self.__class__, ())
+
+    def _enable_thread(self, *args):
+        # Called by the first event of a new thread, replaced by profile of the thread
+        profile = cProfile.Profile()
+        self._local.profile = profile
+
+        with self._lock:
+            self._profiles.append(profile)
+
+        profile.enable()
+
+    def start(self):
+        """
+        ### Notes
+        - Profiles current thread and threads started later.
+        """
+
+        import urllib3.util.connection as connection
+
+        self.started = time.time()
+
+        # Since python 3.12 profile covers all threads
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._enable_thread)
+
+        self._enable_thread()
+
+        # Name lookup and connect are done by urllib3
+        create_connection = connection.create_connection
+
+        def timed_create_connection(*args, **kwargs):
+            start = time.perf_counter()
+            dns = self.get_time("dns")
+
+            try:
+                return create_connection(*args, **kwargs)
+            finally:
+                lookup = self.get_time("dns") - dns
+                self.record("connect", time.perf_counter() - start - lookup)
+
+        self._patched = (connection.socket, create_connection)
+        connection.socket = _TimedSocket(self)  # type: ignore
+        connection.create_connection = timed_create_connection
+
+    def stop(self):
+        """
+        ### Notes
+        - Threads that are still running are profiled until their profile is read.
+        """
+
+        import urllib3.util.connection as connection
+
+        threading.setprofile(None)  # type: ignore
+
+        profile = getattr(self._local, "profile", None)
+        if profile is not None:
+            profile.disable()
+
+        if self._patched is not None:
+            connection.socket, connection.create_connection = self._patched
+            self._patched = None
+
+    def begin(self, url: str, proxy: str):
+        """
+        ### Args
+        - url: `str` requested url
+        - proxy: `str` address of the proxy, "direct" without proxy
+        """
+
+        entry = {"url": url, "proxy": proxy, "start": time.time(), "kind": ""}
+        self._local.entry = entry
+
+        with self._lock:
+            self._timeline.append(entry)
+            self._latest[url] = entry
+
+    def end(self, kind: str):
+        """
+        ### Args
+        - kind: `str` kind of the response of the request started last by the thread
+        """
+
+        entry = self._get_entry()
+        if entry is not None:
+            entry["kind"] = kind
+
+    def _get_entry(self, url: str = None) -> Optional[dict]:
+        if url is not None:
+            with self._lock:
+                return self._latest.get(url)
+
+        return getattr(self._local, "entry", None)
+
+    def record(self, phase: str, seconds: float, url: str = None):
+        """
+        ### Args
+        - phase: `str` one of `PHASES`
+        - seconds: `float` duration of the phase
+        - url: `str` url of the request, request started last by the thread if `None`
+        """
+
+        entry = self._get_entry(url)
+        if entry is not None:
+            entry[phase] = entry.get(phase, 0.0) + seconds
+
+    def get_time(self, *phases: str) -> float:
+        """
+        ### Args
+        - phases: `str` phases of the request started last by the thread
+
+        ### Returns
+        - `float` seconds of the phases
+        """
+
+        entry = self._get_entry()
+        if entry is None:
+            return 0.0
+
+        return sum(entry.get(phase, 0.0) for phase in phases)
+
+    def flush(self) -> dict:
+        """
+        ### Returns
+        - `dict` profile of the current thread and timeline collected since last flush
+        """
+
+        data: dict = {"stats": {}, "timeline": []}
+
+        profile = getattr(self._local, "profile", None)
+        if profile is not None:
+            profile.create_stats()
+            data["stats"] = profile.stats  # type: ignore
+            profile.clear()
+            profile.enable()
+
+        with self._lock:
+            data["timeline"] = self._timeline
+            self._timeline = []
+            self._latest = {}
+
+        return data
+
+    def merge(self, data: Optional[dict]):
+        """
+        ### Args
+        - data: `Optional[dict]` data returned by `flush` of other profiler
+        """
+
+        if data is None:
+            return
+
+        with self._lock:
+            if data["stats"]:
+                self._stats.append(data["stats"])
+
+            self._timeline.extend(data["timeline"])
+
+    def get_stats(self) -> pstats.Stats:
+        """
+        ### Returns
+        - `pstats.Stats` cpu profile of all threads and worker processes
+        """
+
+        stats = pstats.Stats()
+
+        with self._lock:
+            profiles = list(self._profiles)
+            merged = list(self._stats)
+
+        for profile in profiles:
+            profile.create_stats()
+            stats.add(_Stats(profile.stats))  # type: ignore
+
+        for data in merged:
+            stats.add(_Stats(data))  # type: ignore
+
+        return stats
+
+    def get_timeline(self) -> List[dict]:
+        """
+        ### Returns
+        - `List[dict]` requests sorted by start time, with seconds of every phase
+        """
+
+        with self._lock:
+            return sorted(self._timeline, key=lambda entry: entry["start"])
+
+    def get_report(self) -> str:
+        """
+        ### Returns
+        - `str` phases summary, slowest requests, cpu profile and timeline
+        """
+
+        timeline = self.get_timeline()
+        report = io.StringIO()
+
+        report.write(f"Profile of {time.time() - self.started:.1f}s\n\n")
+
+        report.write(f"Phases of {len(timeline)} requests (seconds)\n")
+        report.write(f"{'phase':<10}{'total':>10}{'average':>10}{'max':>10}{'count':>8}\n")
+        for phase in PHASES:
+            values = [entry[phase] for entry in timeline if phase in entry]
+            if len(values) == 0:
+                continue
+
+            report.write(
+                f"{phase:<10}{sum(values):>10.3f}{sum(values) / len(values):>10.3f}"
+                f"{max(values):>10.3f}{len(values):>8}\n"
+            )
+
+        def write_requests(entries: List[dict]):
+            report.write(
+                f"{'start':>8}{'total':>8}"
+                + "".join(f"{phase:>9}" for phase in PHASES)
+                + "  kind  proxy  url\n"
+            )
+            for entry in entries:
+                report.write(
+                    f"{entry['start'] - self.started:>8.2f}"
+                    f"{sum(entry.get(phase, 0.0) for phase in PHASES):>8.3f}"
+                    + "".join(f"{entry.get(phase, 0.0):>9.3f}" for phase in PHASES)
+                    + f"  {entry['kind']}  {entry['proxy']}  {entry['url']}\n"
+                )
+
+        slowest = sorted(
+            timeline,
+            key=lambda entry: sum(entry.get(phase, 0.0) for phase in PHASES),
+            reverse=True,
+        )[:_SLOWEST_REQUESTS]
+
+        report.write("\nSlowest requests (seconds from start, seconds of phases)\n")
+        write_requests(slowest)
+
+        report.write("\nCpu profile (by cumulative time)\n")
+        stats = self.get_stats()
+        if stats.stats:  # type: ignore
+            stats.stream = report  # type: ignore
+            stats.sort_stats("cumulative").print_stats(_PROFILE_FUNCTIONS)
+
+        report.write("\nTimeline of all requests\n")
+        write_requests(timeline)
+
+        return report.getvalue()
+
+    def write_report(self, path: str):
+        """
+        ### Args
+        - path: `str` path to the report file
+        """
+
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.get_report())
+
+
+def set_profiler(profiler: Optional[Profiler]):
+    """
+    ### Args
+    - profiler: `Optional[Profiler]` started profiler, `None` disables profiling
+    """
+
+    global _profiler
+
+    _profiler = profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    """
+    ### Returns
+    - `Optional[Profiler]` profiler, `None` if profiling is disabled
+    """
+
+    return _profiler
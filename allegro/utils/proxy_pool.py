@@ -0,0 +1,286 @@
+import time
+import random
+import threading
+
+from dataclasses import dataclass
+from typing import Collection, Dict, List, Optional, Tuple
+from allegro.constants import DEFAULT_PROXY_COOLDOWN, DEFAULT_PROXY_MAX_COOLDOWN
+from allegro.utils.check import ResponseKind
+
+# Latency assumed for proxies that weren't used yet
+_DEFAULT_LATENCY = 1.0
+
+# Weight of the last request in the latency average
+_LATENCY_SMOOTHING = 0.3
+
+# Number of connection errors in a row after which proxy is quarantined
+_MAX_ERRORS = 3
+
+# Pools shared by all requests using the same proxies list
+_pools: Dict[Tuple[str, ...], "ProxyPool"] = {}
+_pools_lock = threading.Lock()
+
+
+@dataclass
+class ProxyStats:
+    """
+    ### Overview
+    - Health of one proxy.
+
+    ### Public attributes
+    - successes: `int` number of pages fetched with the proxy
+    - failures: `int` number of failed requests
+    - blocks: `int` number of captcha, javascript and rate limit responses
+    - latency: `Optional[float]` moving average of request time in seconds
+    - errors_in_row: `int` number of failed requests since last success
+    - blocks_in_row: `int` number of blocks since last success
+    - blocked_until: `float` `time.monotonic` time when quarantine ends
+    - last_block: `float` `time.time` time of the last block, `0.0` if never blocked
+    """
+
+    successes: int = 0
+    failures: int = 0
+    blocks: int = 0
+    latency: Optional[float] = None
+    errors_in_row: int = 0
+    blocks_in_row: int = 0
+    blocked_until: float = 0.0
+    last_block: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Unused proxies start in the middle, so they are tried too
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else _DEFAULT_LATENCY
+
+        return self.success_rate / max(latency, 0.05)
+
+
+class ProxyPool:
+    """
+    ### Overview
+    - Picks proxies by weighted random choice, proxies with high success rate and
+      low latency are used more often. Blocked proxies are quarantined, quarantine
+      gets longer every time the proxy is blocked again.
+    - Safe to use from threads and from the event loop, no method blocks.
+    - Pool is pickled to worker processes with its stats, `flush` and `merge` are
+      used to send outcomes of requests sent by worker processes back to the pool
+      of the main process.
+
+    ### Args
+    - proxies: `List[str]` proxies in `ip:port` format
+    - cooldown: `float` number of seconds blocked proxy is not used
+    - max_cooldown: `float` max number of seconds of quarantine
+    - stats: `Dict[str, ProxyStats]` initial health of proxies, ex. from previous runs
+    """
+
+    def __init__(
+        self,
+        proxies: List[str],
+        cooldown: float = DEFAULT_PROXY_COOLDOWN,
+        max_cooldown: float = DEFAULT_PROXY_MAX_COOLDOWN,
+        stats: Dict[str, ProxyStats] = None,
+    ):
+        self.proxies = list(dict.fromkeys(proxies))
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._stats = {
+            proxy: (stats or {}).get(proxy) or ProxyStats() for proxy in self.proxies
+        }
+        self._lock = threading.Lock()
+
+        # Outcomes of requests are kept only by copies sent to worker processes
+        self._reports: Optional[List[tuple]] = None
+
+    def __reduce__(self):
+        # Worker processes start with current stats and keep their outcomes
+        with self._lock:
+            stats = {proxy: ProxyStats(**vars(item)) for proxy, item in self._stats.items()}
+
+        return (
+            _restore_pool,
+            (self.proxies, self.cooldown, self.max_cooldown, stats),
+        )
+
+    def __len__(self) -> int:
+        return len(self.proxies)
+
+    def __iter__(self):
+        return iter(self.proxies)
+
+    def acquire(self, exclude: Collection[str] = ()) -> Optional[str]:
+        """
+        ### Args
+        - exclude: `Collection[str]` proxies that shouldn't be used, ex. already tried
+
+        ### Returns
+        - `Optional[str]` proxy to use, `None` if all proxies are quarantined or excluded
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            candidates = [
+                (proxy, stats.score)
+                for proxy, stats in self._stats.items()
+                if stats.blocked_until <= now and proxy not in exclude
+            ]
+
+        if len(candidates) == 0:
+            return None
+
+        proxies, weights = zip(*candidates)
+
+        return random.choices(proxies, weights=weights)[0]
+
+    def get_wait(self, exclude: Collection[str] = ()) -> Optional[float]:
+        """
+        ### Args
+        - exclude: `Collection[str]` proxies that shouldn't be used, ex. already tried
+
+        ### Returns
+        - `Optional[float]` number of seconds until the first quarantine ends, at most
+                            `max_cooldown`, `None` if all proxies are excluded
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            blocked_until = [
+                stats.blocked_until
+                for proxy, stats in self._stats.items()
+                if proxy not in exclude
+            ]
+
+        if len(blocked_until) == 0:
+            return None
+
+        return min(max(min(blocked_until) - now, 0.0), self.max_cooldown)
+
+    def report_success(self, proxy: str, latency: float):
+        """
+        ### Args
+        - proxy: `str` proxy used to fetch the page
+        - latency: `float` request time in seconds
+        """
+
+        with self._lock:
+            if self._reports is not None:
+                self._reports.append((proxy, latency, None))
+
+            stats = self._stats.setdefault(proxy, ProxyStats())
+            stats.successes += 1
+            stats.errors_in_row = 0
+            stats.blocks_in_row = 0
+
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += _LATENCY_SMOOTHING * (latency - stats.latency)
+
+    def report_failure(self, proxy: str, kind: ResponseKind):
+        """
+        ### Args
+        - proxy: `str` proxy used to fetch the page
+        - kind: `ResponseKind` kind of the response, blocks quarantine the proxy
+        """
+
+        with self._lock:
+            if self._reports is not None:
+                self._reports.append((proxy, None, kind))
+
+            stats = self._stats.setdefault(proxy, ProxyStats())
+            stats.failures += 1
+
+            if not kind.blocked:
+                stats.errors_in_row += 1
+
+                # Proxy is probably down
+                if stats.errors_in_row < _MAX_ERRORS:
+                    return
+            else:
+                stats.blocks += 1
+                stats.blocks_in_row += 1
+                stats.last_block = time.time()
+
+            # Quarantine gets longer every time proxy is blocked in a row
+            cooldown = self.cooldown * 2 ** max(stats.blocks_in_row - 1, 0)
+            stats.blocked_until = time.monotonic() + min(cooldown, self.max_cooldown)
+
+    def get_stats(self, proxy: str) -> ProxyStats:
+        """
+        ### Args
+        - proxy: `str` proxy in `ip:port` format
+
+        ### Returns
+        - `ProxyStats` copy of the proxy health
+        """
+
+        with self._lock:
+            stats = self._stats.get(proxy, ProxyStats())
+
+            return ProxyStats(**vars(stats))
+
+    def flush(self) -> Optional[List[tuple]]:
+        """
+        ### Returns
+        - `Optional[List[tuple]]` outcomes reported since last flush, `None` if the
+          pool wasn't sent to a worker process
+        """
+
+        with self._lock:
+            if self._reports is None:
+                return None
+
+            reports = self._reports
+            self._reports = []
+
+        return reports
+
+    def merge(self, reports: Optional[List[tuple]]):
+        """
+        ### Args
+        - reports: `Optional[List[tuple]]` outcomes returned by `flush` of other pool
+        """
+
+        for proxy, latency, kind in reports or []:
+            if kind is None:
+                self.report_success(proxy, latency)
+            else:
+                self.report_failure(proxy, kind)
+
+
+def _restore_pool(
+    proxies: List[str],
+    cooldown: float,
+    max_cooldown: float,
+    stats: Dict[str, ProxyStats],
+) -> ProxyPool:
+    pool = ProxyPool(proxies, cooldown, max_cooldown, stats)
+    pool._reports = []
+
+    return pool
+
+
+def get_proxy_pool(proxies: List[str]) -> ProxyPool:
+    """
+    ### Args
+    - proxies: `List[str]` proxies in `ip:port` format
+
+    ### Returns
+    - `ProxyPool` pool shared by all requests using the same proxies list
+    """
+
+    key = tuple(proxies)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+
+        if pool is None:
+            pool = _pools[key] = ProxyPool(proxies)
+
+        return pool
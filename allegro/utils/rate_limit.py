@@ -0,0 +1,192 @@
+import time
+import threading
+
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from allegro.types import Options
+
+_rate_limiter: Optional["RateLimiter"] = None
+
+
+class TokenBucket:
+    """
+    ### Overview
+    - Token bucket, `rate` tokens are added every second up to `burst` tokens.
+      Tokens are reserved, so waiting threads are served in order.
+
+    ### Args
+    - rate: `float` sustained number of requests per second
+    - burst: `int` number of requests that can be sent at once
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        ### Returns
+        - `float` number of seconds to wait before the request can be sent
+        """
+
+        with self._lock:
+            now = time.monotonic()
+
+            # Refill tokens added since last reservation
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    ### Overview
+    - Paces requests with one token bucket per target host and one per proxy.
+
+    ### Args
+    - host_rate: `float` requests per second sent to one host, `None` disables the limit
+    - host_burst: `int` requests that can be sent to one host at once
+    - proxy_rate: `float` requests per second sent through one proxy, `None` disables
+                          the limit
+    - proxy_burst: `int` requests that can be sent through one proxy at once
+
+    ### Public attributes
+    - split_from: `Optional[tuple]` settings of the limiter this one is a part of
+    """
+
+    def __init__(
+        self,
+        host_rate: float = None,
+        host_burst: int = 1,
+        proxy_rate: float = None,
+        proxy_burst: int = 1,
+    ):
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.proxy_rate = proxy_rate
+        self.proxy_burst = proxy_burst
+        self.split_from: Optional[tuple] = None
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Buckets are not shared with worker processes
+        return (self.__class__, self.get_settings())
+
+    def get_settings(self) -> tuple:
+        """
+        ### Returns
+        - `tuple` rates and bursts of the limiter
+        """
+
+        return (self.host_rate, self.host_burst, self.proxy_rate, self.proxy_burst)
+
+    def split(self, parts: int) -> "RateLimiter":
+        """
+        ### Args
+        - parts: `int` number of processes sharing the limits
+
+        ### Returns
+        - `RateLimiter` limiter with rates divided between processes
+        """
+
+        limiter = RateLimiter(
+            self.host_rate / parts if self.host_rate else None,
+            max(self.host_burst // parts, 1),
+            self.proxy_rate / parts if self.proxy_rate else None,
+            max(self.proxy_burst // parts, 1),
+        )
+        limiter.split_from = self.get_settings()
+
+        return limiter
+
+    def _get_bucket(self, key: str, rate: float, burst: int) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+
+            return bucket
+
+    def wait(self, url: str, proxies: dict = None):
+        """
+        ### Args
+        - url: `str` url of the page that will be requested
+        - proxies: `dict` proxy object passed to requests
+
+        ### Notes
+        - Blocks until request can be sent.
+        """
+
+        delay = 0.0
+
+        if self.host_rate:
+            host = urlsplit(url).netloc.lower()
+            delay = self._get_bucket(
+                f"host:{host}", self.host_rate, self.host_burst
+            ).reserve()
+
+        if self.proxy_rate and proxies:
+            proxy = proxies.get("https") or proxies.get("http")
+            delay = max(
+                delay,
+                self._get_bucket(
+                    f"proxy:{proxy}", self.proxy_rate, self.proxy_burst
+                ).reserve(),
+            )
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+def rate_limiter_from_options(options: Options) -> Optional[RateLimiter]:
+    """
+    ### Args
+    - options: `Options` options with rate limits
+
+    ### Returns
+    - `Optional[RateLimiter]` limiter, `None` if no limit is set
+    """
+
+    if options.get("rate_limit") is None and options.get("proxy_rate_limit") is None:
+        return None
+
+    return RateLimiter(
+        host_rate=options.get("rate_limit"),
+        host_burst=options.get("rate_burst") or 1,
+        proxy_rate=options.get("proxy_rate_limit"),
+        proxy_burst=options.get("proxy_rate_burst") or 1,
+    )
+
+
+def set_rate_limiter(rate_limiter: Optional[RateLimiter]):
+    """
+    ### Args
+    - rate_limiter: `Optional[RateLimiter]` limiter used by `get_soup`, `None` disables it
+    """
+
+    global _rate_limiter
+
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """
+    ### Returns
+    - `Optional[RateLimiter]` limiter used by `get_soup`
+    """
+
+    return _rate_limiter
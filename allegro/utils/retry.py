@@ -0,0 +1,239 @@
+import time
+import random
+import logging
+import threading
+
+from collections import deque
+from typing import Deque, Optional
+from allegro.constants import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_BACKOFF,
+    DEFAULT_RETRY_MAX_BACKOFF,
+    DEFAULT_BREAKER_WINDOW,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_BREAKER_COOLDOWN,
+)
+from allegro.types import Options
+from allegro.utils.check import ResponseKind
+
+
+class CircuitBreaker:
+    """
+    ### Overview
+    - Stops sending requests for `cooldown` seconds when too many recent requests
+      failed. After the pause requests are sent again and the window starts from scratch.
+
+    ### Args
+    - window: `int` number of recent requests that are checked
+    - threshold: `float` part of failed requests that opens the breaker
+    - cooldown: `float` number of seconds requests are not sent
+    """
+
+    def __init__(
+        self,
+        window: int = DEFAULT_BREAKER_WINDOW,
+        threshold: float = DEFAULT_BREAKER_THRESHOLD,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+    ):
+        self.window = window
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._results: Deque[bool] = deque(maxlen=window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, failed: bool):
+        """
+        ### Args
+        - failed: `bool` whether the request failed
+        """
+
+        with self._lock:
+            self._results.append(failed)
+
+            if len(self._results) < self.window:
+                return
+
+            if sum(self._results) / self.window >= self.threshold:
+                logging.warning(
+                    f"Too many requests failed, pausing for {self.cooldown:.0f} seconds"
+                )
+                self._open_until = time.monotonic() + self.cooldown
+                self._results.clear()
+
+    @property
+    def open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def wait(self):
+        """
+        ### Notes
+        - Blocks until requests can be sent.
+        """
+
+        delay = self._open_until - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RetryPolicy:
+    """
+    ### Overview
+    - Decides which failed requests are sent again and how long to wait before that.
+      Only transient failures (timeouts, connection errors, 5xx, 429) are retried.
+
+    ### Args
+    - max_retries: `int` max number of retries of one page
+    - backoff: `float` number of seconds before first retry, doubled on every retry
+    - max_backoff: `float` max number of seconds between retries
+    - budget: `int` number of retries shared by all pages, `None` for no limit
+    - breaker: `CircuitBreaker` breaker fed with the results of requests
+
+    ### Public attributes
+    - breaker: `CircuitBreaker` breaker fed with the results of requests
+    - split_from: `Optional[tuple]` settings of the policy this one is a part of
+    """
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_RETRY_BACKOFF,
+        max_backoff: float = DEFAULT_RETRY_MAX_BACKOFF,
+        budget: int = None,
+        breaker: CircuitBreaker = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.split_from: Optional[tuple] = None
+
+        self._budget_left = budget
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Budget left and breaker state are not shared with worker processes
+        return (self.__class__, self.get_settings())
+
+    def get_settings(self) -> tuple:
+        """
+        ### Returns
+        - `tuple` retry limits and backoff of the policy
+        """
+
+        return (self.max_retries, self.backoff, self.max_backoff, self.budget)
+
+    def split(self, parts: int) -> "RetryPolicy":
+        """
+        ### Args
+        - parts: `int` number of processes sharing the budget
+
+        ### Returns
+        - `RetryPolicy` policy with budget divided between processes
+        """
+
+        # Breaker is not pickled, so only the process that splits the policy shares it
+        policy = RetryPolicy(
+            self.max_retries,
+            self.backoff,
+            self.max_backoff,
+            self.budget // parts if self.budget is not None else None,
+            self.breaker,
+        )
+        policy.split_from = self.get_settings()
+
+        return policy
+
+    def should_retry(self, kind: ResponseKind, attempt: int) -> bool:
+        """
+        ### Args
+        - kind: `ResponseKind` kind of the failed response
+        - attempt: `int` number of retries of the page so far
+
+        ### Returns
+        - `bool` whether the page should be requested again, takes retry from the budget
+        """
+
+        if not kind.transient or attempt >= self.max_retries:
+            return False
+
+        with self._lock:
+            if self._budget_left is not None:
+                if self._budget_left <= 0:
+                    logging.debug("Retry budget is used up")
+                    return False
+
+                self._budget_left -= 1
+
+        return True
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        ### Args
+        - attempt: `int` number of retries of the page so far
+
+        ### Returns
+        - `float` number of seconds to wait, random part of the exponential backoff
+        """
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def record(self, kind: ResponseKind):
+        """
+        ### Args
+        - kind: `ResponseKind` kind of the response, blocks are not counted
+        """
+
+        if kind.transient:
+            self.breaker.record(True)
+        elif kind is ResponseKind.OK:
+            self.breaker.record(False)
+
+
+_retry_policy: RetryPolicy = RetryPolicy()
+
+
+def retry_policy_from_options(options: Options) -> Optional[RetryPolicy]:
+    """
+    ### Args
+    - options: `Options` options with retry settings
+
+    ### Returns
+    - `Optional[RetryPolicy]` policy, `None` if no retry setting is set
+    """
+
+    keys = ("max_retries", "retry_backoff", "retry_budget")
+    if all(options.get(key) is None for key in keys):
+        return None
+
+    max_retries = options.get("max_retries")
+    backoff = options.get("retry_backoff")
+
+    return RetryPolicy(
+        max_retries=max_retries if max_retries is not None else DEFAULT_MAX_RETRIES,
+        backoff=backoff if backoff is not None else DEFAULT_RETRY_BACKOFF,
+        budget=options.get("retry_budget"),
+    )
+
+
+def set_retry_policy(retry_policy: RetryPolicy):
+    """
+    ### Args
+    - retry_policy: `RetryPolicy` policy used by `get_soup`
+    """
+
+    global _retry_policy
+
+    _retry_policy = retry_policy
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    ### Returns
+    - `RetryPolicy` policy used by `get_soup`
+    """
+
+    return _retry_policy
@@ -0,0 +1,113 @@
+import threading
+import requests
+
+from typing import Dict, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from allegro.constants import DEFAULT_POOL_SIZE
+
+# Sessions keyed by proxy, None key is used for direct traffic
+_sessions: Dict[Optional[Tuple], requests.Session] = {}
+_pool_size = DEFAULT_POOL_SIZE
+_sessions_lock = threading.Lock()
+
+
+def _get_session_key(proxies: dict = None) -> Optional[Tuple]:
+    if not proxies:
+        return None
+
+    return tuple(sorted(proxies.items()))
+
+
+def get_proxy_object(proxy: str) -> dict:
+    """
+    ### Args
+    - proxy: `str` proxy in `ip:port` format
+
+    ### Returns
+    - `dict` proxy object passed to requests
+    """
+
+    return {"http": f"https://{proxy}", "https": f"https://{proxy}"}
+
+
+def _mount_adapter(session: requests.Session):
+    # Keep up to pool size connections open to each host
+    adapter = HTTPAdapter(pool_connections=_pool_size, pool_maxsize=_pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def get_session(proxies: dict = None) -> requests.Session:
+    """
+    ### Args
+    - proxies: `dict` proxy object passed to requests, `None` for direct traffic
+
+    ### Returns
+    - `requests.Session` keep-alive session shared by all requests using this proxy
+    """
+
+    key = _get_session_key(proxies)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+
+        if session is None:
+            session = requests.Session()
+            _mount_adapter(session)
+
+            if proxies:
+                session.proxies.update(proxies)
+
+            _sessions[key] = session
+
+        return session
+
+
+def set_pool_size(pool_size: int):
+    """
+    ### Args
+    - pool_size: `int` number of connections kept open per host and proxy
+
+    ### Notes
+    - Open sessions are closed, new sessions will use the new pool size.
+    """
+
+    global _pool_size
+
+    close_sessions()
+
+    with _sessions_lock:
+        _pool_size = pool_size
+
+
+def ensure_pool_size(pool_size: int):
+    """
+    ### Args
+    - pool_size: `int` min number of connections kept open per host and proxy
+
+    ### Notes
+    - Open sessions get bigger pools, requests in flight finish on their old pools.
+    """
+
+    global _pool_size
+
+    with _sessions_lock:
+        if pool_size <= _pool_size:
+            return
+
+        _pool_size = pool_size
+
+        for session in _sessions.values():
+            _mount_adapter(session)
+
+
+def close_sessions():
+    """
+    Close all sessions and their connection pools
+    """
+
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+
+        _sessions.clear()
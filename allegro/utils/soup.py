@@ -1,84 +1,202 @@
+import asyncio
 import logging
-import requests
+import threading
+import time
 
-from itertools import cycle
+from functools import partial
+from weakref import WeakKeyDictionary
+from concurrent.futures import ThreadPoolExecutor
 
-from bs4 import BeautifulSoup
-from typing import Optional, List
-from allegro.constants import HEADERS
-from allegro.utils.check import check_captcha
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import List, Set, Tuple, Union
+from allegro.constants import DEFAULT_CONCURRENCY
+from allegro.utils.check import check_page, ResponseKind
+from allegro.utils.session import get_proxy_object, ensure_pool_size
+from allegro.utils.proxy_pool import ProxyPool, get_proxy_pool
+from allegro.utils.retry import get_retry_policy
+from allegro.utils.metrics import get_metrics
 
+# Executors used by the async functions to run blocking requests, one per event loop
+_io_executors: "WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[int, ThreadPoolExecutor]]"
+_io_executors = WeakKeyDictionary()
+_io_executor_lock = threading.Lock()
 
-def check_soup(
-    url: str, proxies: dict = None, timeout: int = None
-) -> Optional[BeautifulSoup]:
-    try:
-        # Send http GET request
-        request = requests.get(url, headers=HEADERS, proxies=proxies, timeout=timeout)
-    except Exception as e:
-        logging.debug("Failed to get response from server")
-        logging.debug(e)
-        return None
 
-    # Parse website
-    soup = BeautifulSoup(request.text, "html.parser")
+def get_soup(
+    url: str,
+    proxies: Union[List[str], ProxyPool] = None,
+    timeout: int = None,
+    parse_only: SoupStrainer = None,
+) -> BeautifulSoup:
+    """
+    ### Args
+    - url: `str` url of the page
+    - proxies: `Union[List[str], ProxyPool]` proxies, lists share one pool per list
+    - timeout: `int` request timeout
+    - parse_only: `SoupStrainer` only matching parts of the page are parsed
 
-    if check_captcha(soup):
-        return None
-    else:
-        return soup
-
-
-def get_soup(url: str, proxies: List[str] = None, timeout: int = None):
-    # Default values
-    proxy_cycle = None
-    current_proxy = None
-    start_proxy = None
-    proxy_object = None
-
-    # Init proxy cycle
-    if proxies is not None and len(proxies) >= 1:
-        proxy_cycle = cycle(proxies)
-        current_proxy = next(proxy_cycle)
-        start_proxy = current_proxy
-        if current_proxy is not None:
-            proxy_object = {
-                "https": f"https://{current_proxy}",
-            }
-
-    # try to get soup
-    soup = check_soup(url, proxies=proxy_object, timeout=timeout)
-
-    # captcha is required
-    if soup is None:
-        # Proxy failed so we change proxy
-        if proxy_cycle is not None:
-            current_proxy = next(proxy_cycle)
-            logging.debug(f'Changing proxy to "{current_proxy}"')
+    ### Returns
+    - `BeautifulSoup` parsed page
+
+    ### Notes
+    - Transient failures are retried with backoff according to the retry policy.
+    - Each proxy is tried once, when the proxies left are quarantined the first
+      quarantine is waited for, at most `max_cooldown` of the pool.
+    """
+
+    retry_policy = get_retry_policy()
 
+    # Number of retries of this page
+    attempt = 0
+
+    # No proxies, so only transient failures can be retried
+    if proxies is None or len(proxies) == 0:
         while True:
-            if proxy_cycle is not None and current_proxy is not None:
-                # We've run out of proxies to use
-                if start_proxy == current_proxy:
-                    raise OSError("We can't bypass IP block")
-
-                # Update proxy object
-                proxy_object = {
-                    "https": f"https://{current_proxy}",
-                }
-
-                # Get soup
-                soup = check_soup(url=url, proxies=proxy_object)
-
-                # soup is fine return it
-                if soup is not None:
-                    return soup
-                else:
-                    # Soup is wrong, try again
-                    current_proxy = next(proxy_cycle)
-                    logging.debug(f'Changing proxy to "{current_proxy}"')
-            else:
+            retry_policy.breaker.wait()
+            soup, kind = check_page(url, timeout=timeout, parse_only=parse_only)
+            retry_policy.record(kind)
+
+            if soup is not None:
+                return soup
+
+            if retry_policy.should_retry(kind, attempt):
+                delay = retry_policy.get_delay(attempt)
+                attempt += 1
+                get_metrics().inc("allegro_retries_total", kind=kind.value)
+
+                logging.debug(
+                    f'Got "{kind.value}" from "{url}", retrying in {delay:.1f} seconds'
+                )
+                time.sleep(delay)
+            elif kind is ResponseKind.RATE_LIMIT:
+                raise OSError("You are being rate limited, please use proxies")
+            elif kind.blocked:
                 raise OSError("You are being IP restricted, please use proxies")
+            else:
+                raise OSError(f'Failed to get response from "{url}"')
+
+    if isinstance(proxies, ProxyPool):
+        proxy_pool = proxies
     else:
+        proxy_pool = get_proxy_pool(proxies)
+
+    # Each proxy is tried at most once per page
+    tried: Set[str] = set()
+
+    while True:
+        proxy = proxy_pool.acquire(exclude=tried)
+
+        if proxy is None:
+            wait = proxy_pool.get_wait(exclude=tried)
+
+            # We've run out of proxies to use
+            if wait is None:
+                raise OSError("We can't bypass IP block")
+
+            # Proxies that weren't tried are quarantined, so wait for the first one
+            logging.info(f"All proxies are quarantined, waiting {wait:.1f} seconds")
+            time.sleep(wait)
+            continue
+
+        retry_policy.breaker.wait()
+
+        start = time.monotonic()
+        soup, kind = check_page(
+            url,
+            proxies=get_proxy_object(proxy),
+            timeout=timeout,
+            parse_only=parse_only,
+        )
+
         # soup is fine return it
-        return soup
+        if soup is not None:
+            proxy_pool.report_success(proxy, time.monotonic() - start)
+            retry_policy.record(kind)
+            return soup
+
+        proxy_pool.report_failure(proxy, kind)
+
+        # Block of one proxy is handled by the pool, it doesn't pause all requests
+        if not kind.blocked:
+            retry_policy.record(kind)
+
+        # Rate limit is a block of the proxy, so proxy is changed right away
+        if kind is not ResponseKind.RATE_LIMIT and retry_policy.should_retry(
+            kind, attempt
+        ):
+            delay = retry_policy.get_delay(attempt)
+            attempt += 1
+            get_metrics().inc("allegro_retries_total", kind=kind.value)
+
+            logging.debug(
+                f'Got "{kind.value}" using proxy "{proxy}", retrying in {delay:.1f} seconds'
+            )
+            time.sleep(delay)
+            continue
+
+        tried.add(proxy)
+        logging.debug(f'Got "{kind.value}" using proxy "{proxy}", changing proxy')
+
+
+def _get_io_executor(loop: asyncio.AbstractEventLoop, concurrency: int) -> ThreadPoolExecutor:
+    with _io_executor_lock:
+        size, executor = _io_executors.get(loop, (0, None))
+
+        if executor is not None and size >= concurrency:
+            return executor
+
+        # Requests of the loop are submitted from its thread only, so nobody submits
+        # to the smaller executor after it's shut down, its requests still finish
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="allegro-io")
+        _io_executors[loop] = (concurrency, executor)
+
+    # Default executor is shut down with the loop, ex. by `asyncio.run`
+    loop.set_default_executor(executor)
+
+    # Every thread keeps its connection open, so the pools have to fit all of them
+    ensure_pool_size(concurrency)
+
+    return executor
+
+
+async def async_get_soup(
+    url: str,
+    proxies: Union[List[str], ProxyPool] = None,
+    timeout: int = None,
+    concurrency: int = None,
+    parse_only: SoupStrainer = None,
+) -> BeautifulSoup:
+    """
+    ### Args
+    - url: `str` url of the page
+    - proxies: `Union[List[str], ProxyPool]` proxies, lists share one pool per list
+    - timeout: `int` request timeout
+    - concurrency: `int` number of requests that can be in flight at once
+    - parse_only: `SoupStrainer` only matching parts of the page are parsed
+
+    ### Returns
+    - `BeautifulSoup` parsed page
+
+    ### Notes
+    - This is a thread-backed shim, not an asyncio http client: blocking `get_soup`
+      is run in a thread pool, so the event loop is never blocked and vcr cassettes,
+      proxies and sessions work the same as in `get_soup`.
+    - Every request in flight takes one thread, so `concurrency` is also the number
+      of threads started. Threads are shared by requests of one event loop, the pool
+      is sized for the highest concurrency used and shut down with the loop.
+    - Connection pools of sessions are grown to `concurrency`, so connections of all
+      threads are kept alive.
+    """
+
+    loop = asyncio.get_running_loop()
+    executor = _get_io_executor(loop, concurrency or DEFAULT_CONCURRENCY)
+
+    return await loop.run_in_executor(
+        executor,
+        partial(
+            get_soup, url=url, proxies=proxies, timeout=timeout, parse_only=parse_only
+        ),
+    )
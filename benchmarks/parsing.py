@@ -0,0 +1,382 @@
+"""
+Offline parse throughput benchmark, replays pages recorded in the test cassettes.
+
+Usage: `python -m benchmarks.parsing [--save-baseline] [--threshold 0.2]`
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import platform
+
+from argparse import ArgumentParser
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from allegro.utils import PARSER_BACKENDS, make_soup
+from allegro.search.product import (
+    LISTING_STRAINER,
+    Product,
+    find_offer_sections,
+    find_offer_url,
+    find_offer_price,
+    get_listing_fingerprint,
+    is_last_page,
+)
+from allegro.parsers import (
+    extract_product,
+    is_buynow_offer,
+    find_product_name,
+    find_product_category,
+    find_product_price,
+    find_product_seller,
+    find_product_quantity,
+    find_product_rating,
+    find_product_images,
+    find_product_parameters,
+)
+
+# Directory with pytest-vcr cassettes
+CASSETTES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "cassettes")
+
+# File with stored results, compared with every run
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Run is failed when benchmark is slower than baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.2
+
+# Number of rounds of every benchmark, fastest round is reported
+DEFAULT_REPEAT = 5
+
+# Benchmarks run on listing pages, they get list of offer sections
+LISTING_BENCHMARKS: List[Tuple[str, Callable]] = [
+    ("find_offer_sections", find_offer_sections),
+    ("find_offer_url", lambda sections: [find_offer_url(s) for s in sections]),
+    ("find_offer_price", lambda sections: [find_offer_price(s) for s in sections]),
+    (
+        "get_listing_fingerprint",
+        lambda sections: [get_listing_fingerprint(s) for s in sections],
+    ),
+    ("from_section", lambda sections: [Product.from_section(s) for s in sections]),
+]
+
+# Benchmarks run on offer pages, they get parsed page
+OFFER_BENCHMARKS: List[Tuple[str, Callable]] = [
+    ("extract_product", extract_product),
+    ("is_buynow_offer", is_buynow_offer),
+    ("find_product_name", find_product_name),
+    ("find_product_category", find_product_category),
+    ("find_product_price", find_product_price),
+    ("find_product_seller", find_product_seller),
+    ("find_product_quantity", find_product_quantity),
+    ("find_product_rating", find_product_rating),
+    ("find_product_images", find_product_images),
+    ("find_product_parameters", find_product_parameters),
+]
+
+
+def load_pages(cassettes_dir: str = CASSETTES_DIR) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    ### Args
+    - cassettes_dir: `str` directory with recorded responses
+
+    ### Returns
+    - `Dict[str, List[Tuple[str, str]]]` `(url, html)` of listing and offer pages,
+      under "listing" and "offer" keys
+    """
+
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    pages: Dict[str, Dict[str, str]] = {"listing": {}, "offer": {}}
+
+    for name in sorted(os.listdir(cassettes_dir)):
+        if not name.endswith(".yaml"):
+            continue
+
+        with open(os.path.join(cassettes_dir, name), "r", encoding="utf-8") as file:
+            cassette = yaml.load(file, Loader=loader)
+
+        for interaction in cassette["interactions"]:
+            url = interaction["request"]["uri"]
+            response = interaction["response"]
+
+            # Skip proxy pages and responses of blocked requests
+            if not url.startswith("https://allegro.pl/"):
+                continue
+
+            if response["status"]["code"] != 200:
+                continue
+
+            if url.startswith("https://allegro.pl/listing"):
+                kind = "listing"
+            elif url.startswith("https://allegro.pl/oferta/"):
+                kind = "offer"
+            else:
+                continue
+
+            body = response["body"]["string"]
+            headers = {key.lower(): value for key, value in response["headers"].items()}
+
+            if isinstance(body, bytes):
+                if "gzip" in headers.get("content-encoding", []):
+                    body = gzip.decompress(body)
+
+                body = body.decode("utf-8", "replace")
+
+            # Same page is recorded by several tests, tracking params are ignored
+            pages[kind].setdefault(url.split("?bi_s=")[0], body)
+
+    return {kind: list(kind_pages.items()) for kind, kind_pages in pages.items()}
+
+
+def _call(function: Callable, argument):
+    # Some parsers fail on pages without given field, time is still counted
+    try:
+        function(argument)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        pass
+
+
+def _measure(function: Callable, arguments: list, repeat: int) -> float:
+    """
+    Returns time of the fastest round of calling `function` with every argument
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for argument in arguments:
+            _call(function, argument)
+
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def get_backends() -> List[str]:
+    """
+    ### Returns
+    - `List[str]` parser backends that are installed
+    """
+
+    backends = []
+    for backend in PARSER_BACKENDS:
+        try:
+            make_soup("<html></html>", backend)
+        except Exception:
+            continue
+
+        backends.append(backend)
+
+    return backends
+
+
+def run_benchmarks(
+    pages: Dict[str, List[Tuple[str, str]]],
+    backends: Iterable[str] = None,
+    repeat: int = DEFAULT_REPEAT,
+) -> Dict[str, dict]:
+    """
+    ### Args
+    - pages: `Dict[str, List[Tuple[str, str]]]` pages returned by `load_pages`
+    - backends: `Iterable[str]` parser backends, every installed backend if `None`
+    - repeat: `int` number of rounds, fastest one is used
+
+    ### Returns
+    - `Dict[str, dict]` results keyed by "backend/kind/benchmark", every result has
+      `seconds` per page and `pages_per_second`
+    """
+
+    results: Dict[str, dict] = {}
+
+    def add_result(key: str, seconds: float, pages_num: int):
+        results[key] = {
+            "seconds": seconds / pages_num,
+            "pages_per_second": pages_num / seconds if seconds > 0 else float("inf"),
+        }
+
+    for backend in backends or get_backends():
+        listings = [html for _, html in pages["listing"]]
+        offers = [html for _, html in pages["offer"]]
+
+        # Page parsing done by `check_soup`, crawler only keeps offers on listings
+        if listings:
+            add_result(
+                f"{backend}/listing/make_soup",
+                _measure(
+                    lambda html: make_soup(html, backend, LISTING_STRAINER),
+                    listings,
+                    repeat,
+                ),
+                len(listings),
+            )
+
+            soups = [make_soup(html, backend, LISTING_STRAINER) for html in listings]
+            sections = [find_offer_sections(soup) for soup in soups]
+            add_result(
+                f"{backend}/listing/is_last_page",
+                _measure(lambda soup: is_last_page(soup, 1), soups, repeat),
+                len(soups),
+            )
+
+            for name, function in LISTING_BENCHMARKS:
+                arguments = soups if name == "find_offer_sections" else sections
+                add_result(
+                    f"{backend}/listing/{name}",
+                    _measure(function, arguments, repeat),
+                    len(arguments),
+                )
+
+        if offers:
+            add_result(
+                f"{backend}/offer/make_soup",
+                _measure(lambda html: make_soup(html, backend), offers, repeat),
+                len(offers),
+            )
+
+            soups = [make_soup(html, backend) for html in offers]
+            for name, function in OFFER_BENCHMARKS:
+                add_result(
+                    f"{backend}/offer/{name}",
+                    _measure(function, soups, repeat),
+                    len(soups),
+                )
+
+    return results
+
+
+def compare_results(
+    results: Dict[str, dict],
+    baseline: Dict[str, dict],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """
+    ### Args
+    - results: `Dict[str, dict]` results of `run_benchmarks`
+    - baseline: `Dict[str, dict]` stored results
+    - threshold: `float` allowed slowdown, 0.2 means 20% slower than baseline
+
+    ### Returns
+    - `List[str]` descriptions of regressions, benchmarks missing in baseline are
+      skipped
+    """
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        expected = baseline[key]["seconds"]
+        if result["seconds"] > expected * (1 + threshold):
+            regressions.append(
+                f"{key}: {result['seconds'] * 1000:.3f} ms, "
+                f"baseline {expected * 1000:.3f} ms "
+                f"(+{(result['seconds'] / expected - 1) * 100:.0f}%)"
+            )
+
+    return regressions
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Optional[Dict[str, dict]]:
+    """
+    ### Args
+    - path: `str` path to the baseline file
+
+    ### Returns
+    - `Optional[Dict[str, dict]]` stored results, `None` if there is no baseline
+    """
+
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def save_baseline(results: Dict[str, dict], path: str = BASELINE_PATH):
+    """
+    ### Args
+    - results: `Dict[str, dict]` results of `run_benchmarks`
+    - path: `str` path to the baseline file
+    """
+
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4, sort_keys=True)
+
+
+def main(args: List[str] = None) -> int:
+    parser = ArgumentParser(
+        prog="python -m benchmarks.parsing",
+        description="Offline parse throughput benchmark",
+    )
+    parser.add_argument(
+        "--cassettes", default=CASSETTES_DIR, help="Directory with recorded pages"
+    )
+    parser.add_argument(
+        "--backend",
+        action="append",
+        choices=PARSER_BACKENDS,
+        dest="backends",
+        help="Parser backend to benchmark, every installed backend by default",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="Number of rounds"
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store results as new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown compared to baseline, 0.2 means 20%%",
+    )
+
+    arguments = parser.parse_args(args)
+
+    pages = load_pages(arguments.cassettes)
+    results = run_benchmarks(pages, arguments.backends, arguments.repeat)
+
+    print(
+        f"{len(pages['listing'])} listing pages, {len(pages['offer'])} offer pages, "
+        f"best of {arguments.repeat} rounds"
+    )
+    print(f"{'benchmark':<48} {'ms/page':>10} {'pages/s':>10}")
+    for key, result in results.items():
+        print(
+            f"{key:<48} {result['seconds'] * 1000:>10.3f} "
+            f"{result['pages_per_second']:>10.1f}"
+        )
+
+    if arguments.save_baseline:
+        save_baseline(results, arguments.baseline)
+        print(f"Saved baseline to {arguments.baseline}")
+        return 0
+
+    baseline = load_baseline(arguments.baseline)
+    if baseline is None:
+        print("No baseline, run with --save-baseline to store one")
+        return 0
+
+    regressions = compare_results(results, baseline, arguments.threshold)
+    if regressions:
+        print(f"Slower than baseline by more than {arguments.threshold * 100:.0f}%:")
+        for regression in regressions:
+            print(f"- {regression}")
+
+        return 1
+
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
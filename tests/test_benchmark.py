@@ -0,0 +1,46 @@
+from benchmarks.parsing import compare_results, load_pages, run_benchmarks, main
+
+
+def test_load_pages():
+    pages = load_pages()
+
+    assert [url for url, _ in pages["listing"]] == [
+        "https://allegro.pl/listing?string=kabel&p=1",
+        "https://allegro.pl/listing?string=sadvnasdvjkasvdkjbasvdabsdvjkabsj",
+    ]
+    assert len(pages["offer"]) == 7
+    assert all(html.lstrip().startswith("<!") for _, html in pages["offer"])
+
+
+def test_run_benchmarks():
+    pages = load_pages()
+    pages["offer"] = pages["offer"][:1]
+
+    results = run_benchmarks(pages, ["html.parser"], repeat=1)
+
+    assert results["html.parser/listing/find_offer_sections"]["seconds"] > 0
+    assert results["html.parser/offer/find_product_parameters"]["pages_per_second"] > 0
+    assert all(key.startswith("html.parser/") for key in results)
+
+
+def test_compare_results():
+    baseline = {"lxml/offer/make_soup": {"seconds": 0.1}}
+
+    assert compare_results({"lxml/offer/make_soup": {"seconds": 0.11}}, baseline) == []
+    assert compare_results({"new": {"seconds": 1.0}}, baseline) == []
+    assert compare_results(
+        {"lxml/offer/make_soup": {"seconds": 0.13}}, baseline, threshold=0.2
+    ) == ["lxml/offer/make_soup: 130.000 ms, baseline 100.000 ms (+30%)"]
+
+
+def test_baseline_regression(tmp_path, mocker):
+    baseline = str(tmp_path / "baseline.json")
+    args = ["--backend", "html.parser", "--repeat", "1", "--baseline", baseline]
+    results = {"html.parser/offer/make_soup": {"seconds": 0.1, "pages_per_second": 10.0}}
+
+    mocker.patch("benchmarks.parsing.run_benchmarks", return_value=results)
+    assert main(args + ["--save-baseline"]) == 0
+    assert main(args) == 0
+
+    results["html.parser/offer/make_soup"]["seconds"] = 0.5
+    assert main(args) == 1
@@ -1,7 +1,65 @@
+import json
+import time
+import asyncio
+import threading
+
 import pytest
 
+from bs4 import BeautifulSoup
+from functools import partial
+from concurrent.futures import Future
 from allegro.types import Options
-from allegro.search import search, crawl
+from allegro.utils import MetricsRegistry, get_metrics
+from allegro.utils import RetryPolicy, get_rate_limiter, get_retry_policy
+from allegro.search import crawler, pipeline, pool as pool_module
+from allegro.search import (
+    search,
+    crawl,
+    crawl_many,
+    iter_crawl,
+    async_crawl,
+    async_iter_crawl,
+    Product,
+    WorkerPool,
+    SeenOffers,
+    get_offer_id,
+    get_checkpoint,
+    iter_queries,
+)
+from allegro.console.output import JsonLinesWriter
+
+
+def fake_offer_url(page_num, index):
+    """This is a helper to build url of offer with unique id"""
+    return f"https://allegro.pl/oferta/kabel-{page_num * 100 + index}"
+
+
+def fake_listing_page(
+    url, proxies=None, timeout=None, parse_only=None, max_page=5, offers=3
+):
+    """This is a helper to build listing page with offers, page number is taken from url"""
+    page_num = int(url.split("&p=")[-1])
+
+    articles = "".join(
+        '<article data-role="offer" data-analytics-view-custom-index0="0" '
+        'data-analytics-view-custom-deliverylabel="" '
+        f'data-analytics-view-custom-page="{page_num}" data-analytics-view-value="1">'
+        f'<a rel="nofollow" tabindex="-1" href="{fake_offer_url(page_num, index)}">'
+        "</a></article>"
+        for index in range(offers)
+    )
+
+    return BeautifulSoup(
+        f"<html><body>{articles}"
+        f'<input data-role="page-number-input" data-page="{page_num}" '
+        f'data-maxpage="{max_page}"/></body></html>',
+        "html.parser",
+        parse_only=parse_only,
+    )
+
+
+def fake_product(url, *args, **kwargs):
+    return Product(url, "kabel", "", 1.0, "", 1, 0.0, [], {})
 
 
 @pytest.mark.vcr()
@@ -18,3 +76,466 @@ def test_crawl_max_results():
     products = crawl("kabel", options=options)
 
     assert len(products) == 3
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_crawl_max_results"])
+def test_async_crawl_max_results(mocker, vcr_cassette_name):
+    options: Options = {"max_results": 3, "concurrency": 8}  # type: ignore
+
+    async def from_url(url, proxies=None, timeout=None, concurrency=None):
+        return Product(url, "kabel", "", 1.0, "", 1, 0.0, [], {})
+
+    mocker.patch.object(Product, "async_from_url", side_effect=from_url)
+
+    products = asyncio.run(async_crawl("kabel", options=options))
+
+    assert len(products) == 3
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_crawl_max_results"])
+def test_crawl_shared_pool(mocker, vcr_cassette_name):
+    options: Options = {"max_results": 3}  # type: ignore
+
+    def from_url(url, proxies=None, timeout=None):
+        return Product(url, "kabel", "", 1.0, "", 1, 0.0, [], {})
+
+    mocker.patch.object(Product, "from_url", side_effect=from_url)
+
+    with WorkerPool(4, "thread") as pool:
+        products = crawl("kabel", options=options, pool=pool)
+
+        # Pool is still usable after the crawl
+        assert pool.submit("https://allegro.pl/oferta/kabel-1").result().name == "kabel"
+
+    assert len(products) == 3
+
+
+@pytest.mark.parametrize("kind", ["thread", "async"])
+def test_worker_pool_kinds(mocker, kind):
+    async def async_from_url(url, proxies=None, timeout=None, concurrency=None):
+        return Product(url, "async", "", 1.0, "", 1, 0.0, [], {})
+
+    def from_url(url, proxies=None, timeout=None):
+        return Product(url, "thread", "", 1.0, "", 1, 0.0, [], {})
+
+    mocker.patch.object(Product, "async_from_url", side_effect=async_from_url)
+    mocker.patch.object(Product, "from_url", side_effect=from_url)
+
+    with WorkerPool(2, kind) as pool:
+        futures = [pool.submit(f"https://allegro.pl/oferta/{i}") for i in range(5)]
+
+        assert [future.result().name for future in futures] == [kind] * 5
+
+
+def test_worker_pool_metrics(mocker):
+    """
+    Test that metrics of offers scraped in worker processes are merged
+    """
+    main_metrics = MetricsRegistry()
+    mocker.patch("allegro.utils.metrics._metrics", main_metrics)
+
+    def from_url(url, proxies=None, timeout=None):
+        get_metrics().inc("allegro_products_total")
+        if url.endswith("auction"):
+            raise NotImplementedError("Auctions and advertisements are not supported")
+
+        return Product(url, "process", "", 1.0, "", 1, 0.0, [], {})
+
+    mocker.patch.object(Product, "from_url", side_effect=from_url)
+
+    for url in ["https://allegro.pl/oferta/1", "https://allegro.pl/oferta/auction"]:
+        # Metrics are collected by the registry of the worker process
+        mocker.patch("allegro.utils.metrics._metrics", MetricsRegistry())
+        future: Future = Future()
+        future.set_result(pool_module._scrape_offer(url))
+
+        mocker.patch("allegro.utils.metrics._metrics", main_metrics)
+        result: Future = Future()
+        pool_module._resolve_offer(result, None, future)
+
+    assert result.exception() is not None
+    assert main_metrics.get_value("allegro_products_total") == 2
+
+
+def test_worker_pool_cancel(mocker):
+    """
+    Test that cancelled offer is not scraped by worker process
+    """
+    pool = WorkerPool(1, "process")
+    inner: Future = Future()
+    mocker.patch.object(pool._executor, "submit", return_value=inner)
+
+    try:
+        result = pool.submit("https://allegro.pl/oferta/1")
+
+        assert result.cancel()
+        assert inner.cancelled()
+    finally:
+        pool.shutdown()
+
+
+def test_worker_pool_limits(mocker):
+    """
+    Test that main process of process pool gets its part of the limits
+    """
+    options: Options = {"rate_limit": 6, "retry_budget": 30}  # type: ignore
+    mocker.patch("allegro.utils.rate_limit._rate_limiter", None)
+    mocker.patch("allegro.utils.retry._retry_policy", RetryPolicy())
+
+    crawler._apply_options(options)
+    rate_limiter, retry_policy = get_rate_limiter(), get_retry_policy()
+
+    pool = WorkerPool(2, "process")
+    try:
+        assert get_rate_limiter().host_rate == 2
+        assert get_retry_policy().budget == 10
+        assert get_retry_policy().breaker is retry_policy.breaker
+
+        # Part of the limits is kept by next queries
+        part_limiter = get_rate_limiter()
+        crawler._apply_options(options)
+        assert get_rate_limiter() is part_limiter
+    finally:
+        pool.shutdown()
+
+    assert get_rate_limiter() is rate_limiter
+    assert get_retry_policy() is retry_policy
+
+
+@pytest.mark.parametrize("threads", [None, 4])
+def test_crawl_pipeline(mocker, threads):
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 3,
+        "threads": threads,
+        "worker_kind": "thread",
+        "queue_size": 2,
+    }
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    products = crawl("kabel", options=options)
+
+    assert sorted(product.url for product in products) == [
+        fake_offer_url(page, index) for page in range(1, 4) for index in range(3)
+    ]
+
+
+def test_crawl_pipeline_last_page(mocker):
+    options: Options = {"start_page": 4}  # type: ignore
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    products = crawl("kabel", options=options)
+
+    assert len(products) == 6
+
+
+def test_iter_crawl(mocker):
+    options: Options = {"max_results": 4, "queue_size": 1}  # type: ignore
+
+    get_soup = mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    products = iter_crawl("kabel", options=options)
+
+    # First product is returned before rest of the pages is fetched
+    assert next(products).url == fake_offer_url(1, 0)
+    assert get_soup.call_count <= 2
+
+    assert len(list(products)) == 3
+
+
+def test_async_iter_crawl(mocker):
+    options: Options = {"pages_to_fetch": 2, "concurrency": 2}  # type: ignore
+
+    async def async_get_soup(
+        url, proxies=None, timeout=None, concurrency=None, parse_only=None
+    ):
+        return fake_listing_page(url, parse_only=parse_only)
+
+    async def async_from_url(url, proxies=None, timeout=None, concurrency=None):
+        return fake_product(url)
+
+    mocker.patch.object(pipeline, "async_get_soup", side_effect=async_get_soup)
+    mocker.patch.object(Product, "async_from_url", side_effect=async_from_url)
+
+    async def collect():
+        return [product.url async for product in async_iter_crawl("kabel", options)]
+
+    urls = asyncio.run(collect())
+
+    assert sorted(urls) == [
+        fake_offer_url(page, index) for page in range(1, 3) for index in range(3)
+    ]
+
+
+def test_offer_id():
+    redirect = (
+        "https://allegro.pl/events/clicks?emission_unit_id=3c6eb04c&type=OFFER"
+        "&redirect=https%3A%2F%2Fallegro.pl%2Foferta%2Fkabel-3w1-micro-10757269825"
+        "%3Fbi_s%3Dads"
+    )
+
+    assert get_offer_id(redirect) == "10757269825"
+    assert get_offer_id("https://allegro.pl/oferta/kabel-3w1-micro-10757269825") == (
+        "10757269825"
+    )
+    assert redirect in SeenOffers().filter([redirect, redirect])
+
+
+def test_crawl_skips_duplicates(mocker):
+    def promoted_listing_page(url, *args, **kwargs):
+        # Every page shows the same promoted offers
+        return fake_listing_page(url.rsplit("&p=", 1)[0] + "&p=1", *args, **kwargs)
+
+    options: Options = {"pages_to_fetch": 3}  # type: ignore
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=promoted_listing_page)
+    from_url = mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    seen = SeenOffers()
+
+    assert len(crawl("kabel", options=options, seen=seen)) == 3
+    assert len(crawl("kabel usb", options=options, seen=seen)) == 0
+    assert from_url.call_count == 3
+
+
+def test_crawl_releases_unscraped_offers(mocker):
+    """
+    Test that offers queued by query stopped early can be scraped by the next query
+    """
+    mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    seen = SeenOffers()
+
+    first = crawl("kabel", options={"max_results": 2, "pages_to_fetch": 3}, seen=seen)
+    second = crawl("kabel usb", options={"max_results": 5, "pages_to_fetch": 3}, seen=seen)
+
+    assert len(first) == 2
+    assert len(second) == 5
+    assert not {product.url for product in first} & {product.url for product in second}
+    assert len(seen) == 7
+
+
+def test_incremental_crawl(mocker, tmp_path):
+    def changed_listing_page(url, *args, **kwargs):
+        # Delivery of offers from first page changed since last crawl
+        soup = fake_listing_page(url, *args, **kwargs)
+        if url.endswith("&p=1"):
+            for section in soup.find_all("article"):
+                section["data-analytics-view-custom-deliverylabel"] = "dostawa jutro"
+
+        return soup
+
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 2,
+        "index_path": str(tmp_path / "index.db"),
+    }
+
+    get_soup = mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    from_url = mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    assert len(crawl("kabel", options=options)) == 6
+    assert len(crawl("kabel", options=options)) == 6
+    assert from_url.call_count == 6
+
+    get_soup.side_effect = changed_listing_page
+    products = crawl("kabel", options=options)
+
+    assert sorted(product.url for product in products) == [
+        fake_offer_url(page, index) for page in range(1, 3) for index in range(3)
+    ]
+    assert from_url.call_count == 9
+
+
+def test_listing_only(mocker):
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 2,
+        "listing_only": True,
+        "fetch_if": lambda product: product.url == fake_offer_url(2, 1),
+    }
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    from_url = mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    products = crawl("kabel", options=options)
+
+    assert sorted(product.url for product in products) == [
+        fake_offer_url(page, index) for page in range(1, 3) for index in range(3)
+    ]
+    assert from_url.call_count == 1
+
+
+def test_listing_only_search(mocker):
+    options: Options = {"listing_only": True}  # type: ignore
+
+    mocker.patch.object(
+        crawler,
+        "get_soup",
+        side_effect=lambda url, **kwargs: fake_listing_page(url + "&p=1", **kwargs),
+    )
+    from_url = mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    seen = SeenOffers()
+
+    assert len(search("kabel", options=options, seen=seen)) == 3
+    assert len(search("kabel", options=options, seen=seen)) == 0
+    assert from_url.call_count == 0
+
+
+def test_resume_crawl(mocker, tmp_path):
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 3,
+        "queue_size": 2,
+        "checkpoint_path": str(tmp_path / "checkpoint.json"),
+    }
+
+    def flaky_product(url, *args, **kwargs):
+        if url == fake_offer_url(2, 1):
+            raise OSError("We can't bypass IP block")
+
+        return fake_product(url)
+
+    get_soup = mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    from_url = mocker.patch.object(Product, "from_url", side_effect=flaky_product)
+
+    # Crawl fails partway, products scrapped before the failure are kept
+    urls = []
+    with pytest.raises(OSError):
+        for product in iter_crawl("kabel", options=options):
+            urls.append(product.url)
+
+    assert urls == [fake_offer_url(1, index) for index in range(3)] + [
+        fake_offer_url(2, 0)
+    ]
+
+    # Completed offers are not scraped again
+    from_url.reset_mock(side_effect=True)
+    from_url.side_effect = fake_product
+    get_soup.reset_mock()
+
+    options["resume"] = True
+    urls.extend(product.url for product in crawl("kabel", options=options))
+
+    assert sorted(urls) == [
+        fake_offer_url(page, index) for page in range(1, 4) for index in range(3)
+    ]
+    assert from_url.call_count == 5
+    assert all("&p=1" not in call.args[0] for call in get_soup.call_args_list)
+
+    # Finished crawl is not repeated
+    assert crawl("kabel", options=options) == []
+    assert from_url.call_count == 5
+
+
+def test_checkpoint_saved_after_flush(mocker, tmp_path):
+    """
+    Test that offers of products that weren't flushed are not saved as completed
+    """
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 3,
+        "checkpoint_path": str(tmp_path / "checkpoint.json"),
+    }
+    output = str(tmp_path / "products.jsonl")
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    checkpoint = get_checkpoint(options["checkpoint_path"])
+    checkpoint.autosave = False
+    writer = JsonLinesWriter(output, flush_interval=3600, on_flush=checkpoint.save)
+
+    # Run is killed after the first flush, products written since then are lost
+    queries = [("kabel", partial(iter_crawl, "kabel", options=options))]
+    for index, (query, product) in enumerate(iter_queries(queries)):
+        writer.write(product, query=query)
+
+        if index == 1:
+            # Query has time to run ahead of the writer
+            time.sleep(0.2)
+            writer.flush()
+        elif index == 4:
+            break
+
+    with open(options["checkpoint_path"], "r", encoding="utf-8") as file:
+        completed = json.load(file)["queries"]["kabel"]["completed"]
+    with open(output, "r", encoding="utf-8") as file:
+        saved = [get_offer_id(json.loads(line)["url"]) for line in file]
+
+    assert 0 < len(completed) <= len(saved) == 2
+    assert set(completed) <= set(saved)
+
+
+def test_jsonl_writer_flush_interval(tmp_path):
+    """
+    Test that product is flushed after the interval, even if no product comes after it
+    """
+    output = str(tmp_path / "products.jsonl")
+    flushed = threading.Event()
+    writer = JsonLinesWriter(output, flush_interval=0.05, on_flush=flushed.set)
+
+    writer.write(fake_product(fake_offer_url(1, 0)), query="kabel")
+
+    assert flushed.wait(5)
+    with open(output, "r", encoding="utf-8") as file:
+        assert json.loads(file.read())["query"] == "kabel"
+
+    writer.close()
+
+
+def test_iter_queries_close():
+    """
+    Test that closed iterator waits until query threads are finished
+    """
+    finished = []
+
+    def job():
+        try:
+            for index in range(100):
+                time.sleep(0.01)
+                yield fake_product(fake_offer_url(1, index))
+        finally:
+            finished.append(threading.current_thread().name)
+
+    products = iter_queries([("kabel", job), ("ladowarka", job)])
+
+    assert next(products)[1].url == fake_offer_url(1, 0)
+
+    products.close()
+
+    assert len(finished) == 2
+
+
+@pytest.mark.parametrize("threads", [None, 2])
+def test_crawl_many(mocker, threads):
+    options: Options = {  # type: ignore
+        "pages_to_fetch": 2,
+        "threads": threads,
+        "worker_kind": "thread",
+        "max_queries": 2,
+    }
+    started = {"kabel": threading.Event(), "ladowarka": threading.Event()}
+
+    def listing_page(url, *args, **kwargs):
+        started[url.split("string=")[1].split("&")[0]].set()
+
+        # Both queries are running at once
+        assert all(event.wait(5) for event in started.values())
+
+        return fake_listing_page(url, *args, **kwargs)
+
+    mocker.patch.object(pipeline, "get_soup", side_effect=listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    products = crawl_many(["kabel", "ladowarka", "brak"], options=options)
+
+    assert list(products) == ["kabel", "ladowarka", "brak"]
+    assert len(products["kabel"]) == len(products["ladowarka"]) == 6
+
+    # Failed query doesn't stop other queries
+    assert products["brak"] == []
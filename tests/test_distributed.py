@@ -0,0 +1,301 @@
+import time
+import threading
+
+import pytest
+
+from allegro.types import Options
+from allegro.search import distributed
+from allegro.search import (
+    Product,
+    UnsupportedOfferError,
+    SeenOffers,
+    WorkQueue,
+    MemoryQueue,
+    SQLiteQueue,
+    RedisQueue,
+    distributed_crawl,
+    run_worker,
+    get_offer_id,
+)
+from tests.test_crawler import fake_listing_page, fake_offer_url, fake_product
+
+
+class FakeRedis:
+    """This is a helper implementing redis commands used by the queue in memory"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _expire(self):
+        for name, expires in list(self.expires.items()):
+            if expires <= time.time():
+                self.data.pop(name, None)
+                del self.expires[name]
+
+    def set(self, name, value, nx=False, px=None):
+        self._expire()
+        if nx and name in self.data:
+            return None
+
+        self.data[name] = value
+        if px is not None:
+            self.expires[name] = time.time() + px / 1000
+
+        return True
+
+    def delete(self, *names):
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+    def hsetnx(self, name, key, value):
+        values = self.data.setdefault(name, {})
+        if key in values:
+            return 0
+
+        values[key] = value
+        return 1
+
+    def hget(self, name, key):
+        return self.data.get(name, {}).get(key)
+
+    def hincrby(self, name, key, amount=1):
+        values = self.data.setdefault(name, {})
+        values[key] = values.get(key, 0) + amount
+        return values[key]
+
+    def sadd(self, name, *values):
+        self.data.setdefault(name, set()).update(values)
+
+    def srem(self, name, *values):
+        self.data.setdefault(name, set()).difference_update(values)
+
+    def smembers(self, name):
+        return set(self.data.get(name, set()))
+
+    def scard(self, name):
+        return len(self.data.get(name, set()))
+
+    def zadd(self, name, mapping, nx=False, xx=False):
+        values = self.data.setdefault(name, {})
+        for key, score in mapping.items():
+            if (nx and key in values) or (xx and key not in values):
+                continue
+            values[key] = score
+
+    def zrangebyscore(self, name, min, max, start=None, num=None):
+        values = self.data.get(name, {})
+        keys = sorted((score, key) for key, score in values.items() if score <= max)
+        return [key for _, key in keys][start:start + num]
+
+    def zrem(self, name, *values):
+        return sum(self.data.get(name, {}).pop(value, None) is not None for value in values)
+
+    def rpush(self, name, *values):
+        self.data.setdefault(name, []).extend(values)
+
+    def lrange(self, name, start, end):
+        return self.data.get(name, [])[start:end + 1]
+
+    def ltrim(self, name, start, end):
+        self.data[name] = self.data.get(name, [])[start:]
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args: self.calls.append((name, args))
+
+            def execute(self):
+                return [getattr(client, name)(*args) for name, args in self.calls]
+
+        return Pipeline()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def work_queue(request, tmp_path):
+    if request.param == "memory":
+        return MemoryQueue(lease=10, max_attempts=2)
+
+    if request.param == "sqlite":
+        return SQLiteQueue(str(tmp_path / "queue.db"), lease=10, max_attempts=2)
+
+    return RedisQueue(lease=10, max_attempts=2, client=FakeRedis())
+
+
+def test_work_queue_lease(mocker, work_queue):
+    """
+    Test that task of crashed worker is given to another worker
+    """
+    now = time.time()
+    clock = mocker.patch("time.time", return_value=now)
+
+    assert work_queue.put("offer:1", "offer", {"url": fake_offer_url(1, 1)}, "kabel")
+    assert not work_queue.put("offer:1", "offer", {"url": fake_offer_url(1, 1)}, "kabel")
+
+    task = work_queue.claim("worker-1")
+    assert task.payload == {"url": fake_offer_url(1, 1)} and task.attempts == 1
+    assert work_queue.claim("worker-2") is None
+
+    # Lease of the first worker has ended
+    clock.return_value = now + 11
+    retried = work_queue.claim("worker-2")
+    assert retried.id == "offer:1" and retried.attempts == 2
+
+    work_queue.complete(retried, "product")
+    work_queue.complete(task, "product")
+
+    assert work_queue.pending("kabel") == 0
+    assert work_queue.pop_results("kabel") == ["product"]
+    assert work_queue.pop_results("kabel") == []
+
+    # Task is dropped after max attempts
+    work_queue.put("offer:2", "offer", {}, "kabel")
+    for attempt in range(2):
+        work_queue.release(work_queue.claim("worker-1"))
+
+    assert work_queue.claim("worker-1") is None
+    assert work_queue.pending("kabel") == 0
+
+
+def test_distributed_crawl(mocker):
+    options: Options = {"pages_to_fetch": 3}  # type: ignore
+    work_queue = MemoryQueue()
+    stop_event = threading.Event()
+
+    def flaky_product(url, *args, **kwargs):
+        # First try of one offer fails, it's retried by other worker
+        if url == fake_offer_url(2, 1) and not flaky_product.failed:
+            flaky_product.failed = True
+            raise OSError("We can't bypass IP block")
+
+        return fake_product(url)
+
+    flaky_product.failed = False
+
+    mocker.patch.object(distributed, "_POLL_INTERVAL", 0.01)
+    mocker.patch.object(distributed, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=flaky_product)
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(work_queue,),
+        kwargs={"threads": 2, "idle_timeout": None, "stop_event": stop_event},
+    )
+    worker.start()
+
+    try:
+        products = distributed_crawl("kabel", work_queue, options=options)
+    finally:
+        stop_event.set()
+        worker.join()
+
+    assert sorted(product.url for product in products) == [
+        fake_offer_url(page, index) for page in range(1, 4) for index in range(3)
+    ]
+
+
+def test_work_queue_abstract():
+    """
+    Test that queue without backend can't be created
+    """
+    with pytest.raises(TypeError):
+        WorkQueue()  # type: ignore
+
+
+def test_run_worker_skipped_offers(mocker):
+    """
+    Test that auctions are completed and other failures are retried
+    """
+    work_queue = MemoryQueue(max_attempts=2)
+    work_queue.put("offer:auction", "offer", {"url": fake_offer_url(1, 0)}, "kabel")
+    work_queue.put("offer:broken", "offer", {"url": fake_offer_url(1, 1)}, "kabel")
+
+    def from_url(url, *args, **kwargs):
+        if url == fake_offer_url(1, 0):
+            raise UnsupportedOfferError("Auctions and advertisements are not supported")
+
+        raise NotImplementedError
+
+    from_url_mock = mocker.patch.object(Product, "from_url", side_effect=from_url)
+
+    assert run_worker(work_queue, idle_timeout=0) == 1
+    assert from_url_mock.call_count == 3
+    assert work_queue.pop_results("kabel") == []
+
+
+def test_distributed_crawl_seen(mocker):
+    """
+    Test that offers returned by other queries are not queued
+    """
+    options: Options = {"pages_to_fetch": 1}  # type: ignore
+    work_queue = MemoryQueue()
+    stop_event = threading.Event()
+
+    seen = SeenOffers()
+    seen.add(fake_offer_url(1, 0))
+    put = mocker.spy(work_queue, "put")
+
+    mocker.patch.object(distributed, "_POLL_INTERVAL", 0.01)
+    mocker.patch.object(distributed, "get_soup", side_effect=fake_listing_page)
+    from_url = mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(work_queue,),
+        kwargs={"idle_timeout": None, "stop_event": stop_event},
+    )
+    worker.start()
+
+    try:
+        products = distributed_crawl("kabel", work_queue, options=options, seen=seen)
+    finally:
+        stop_event.set()
+        worker.join()
+
+    assert sorted(product.url for product in products) == [
+        fake_offer_url(1, index) for index in range(1, 3)
+    ]
+    assert from_url.call_count == 2
+    assert not any(
+        call.args[0].endswith(get_offer_id(fake_offer_url(1, 0)))
+        for call in put.call_args_list
+    )
+
+
+def test_distributed_crawl_releases_unscraped_offers(mocker):
+    """
+    Test that offers dropped by crawl stopped early can be scraped by the next crawl
+    """
+    work_queue = MemoryQueue()
+    stop_event = threading.Event()
+    seen = SeenOffers()
+
+    mocker.patch.object(distributed, "_POLL_INTERVAL", 0.01)
+    mocker.patch.object(distributed, "get_soup", side_effect=fake_listing_page)
+    mocker.patch.object(Product, "from_url", side_effect=fake_product)
+
+    worker = threading.Thread(
+        target=run_worker,
+        args=(work_queue,),
+        kwargs={"idle_timeout": None, "stop_event": stop_event},
+    )
+    worker.start()
+
+    try:
+        first = distributed_crawl(
+            "kabel", work_queue, options={"max_results": 2, "pages_to_fetch": 3}, seen=seen
+        )
+        second = distributed_crawl(
+            "kabel usb", work_queue, options={"max_results": 5, "pages_to_fetch": 3}, seen=seen
+        )
+    finally:
+        stop_event.set()
+        worker.join()
+
+    assert len(first) == 2
+    assert len(second) == 5
+    assert not {product.url for product in first} & {product.url for product in second}
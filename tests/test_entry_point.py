@@ -1,3 +1,4 @@
+import json
 import logging
 import sys
 
@@ -122,6 +123,49 @@ def test_crawl(caplog, monkeypatch, tmpdir):
     ) in caplog.record_tuples
 
 
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_crawl"])
+def test_crawl_jsonl(caplog, monkeypatch, tmpdir, vcr_cassette_name):
+    """
+    This will crawl 5 results and save them as json lines
+    """
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "dummy",
+            "-c",
+            "kabel",
+            "--max-results",
+            "5",
+            "--pages-to-fetch",
+            "20",
+            "--output",
+            "crawl.jsonl",
+            "--format",
+            "jsonl",
+            "--flush-interval",
+            "0",
+        ],
+    )
+
+    caplog.set_level(logging.INFO)
+
+    console_entry_point()
+
+    with open("crawl.jsonl", encoding="utf-8") as output:
+        products = [json.loads(line) for line in output]
+
+    assert len(products) == 5
+    assert all(product["url"] for product in products)
+    assert (
+        "root",
+        logging.INFO,
+        "Saved 5 products to crawl.jsonl",
+    ) in caplog.record_tuples
+
+
 @pytest.mark.vcr()
 def test_wrong_search(caplog, monkeypatch, tmpdir):
     """
@@ -0,0 +1,119 @@
+import pytest
+
+from allegro.constants import HEADERS
+from allegro.utils import get_session, make_soup, PARSER_BACKENDS
+from allegro.parsers import (
+    extract_product,
+    find_product_category,
+    find_product_images,
+    find_product_name,
+    find_product_parameters,
+    find_product_price,
+    find_product_quantity,
+    find_product_rating,
+    find_product_seller,
+    is_buynow_offer,
+)
+from allegro.search import Product
+from allegro.search.product import (
+    LISTING_STRAINER,
+    find_offer_sections,
+    find_offer_url,
+    find_offer_price,
+    get_listing_fingerprint,
+    is_last_page,
+)
+
+OFFER_URL = "https://allegro.pl/oferta/5-x-test-antygenowy-domowy-dokladnosc-96-79-10572320477"
+LISTING_URL = "https://allegro.pl/listing?string=kabel&p=1"
+
+
+@pytest.fixture()
+def offer_page(vcr_cassette_name):
+    """This is a helper fixture to get recorded offer page"""
+    return get_session().get(OFFER_URL, headers=HEADERS).text
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_scrape_from_url"])
+@pytest.mark.parametrize("backend", PARSER_BACKENDS)
+def test_parser_backends(offer_page, backend):
+    """
+    Test that every parser backend gives the same product
+    """
+    expected = Product.from_soup(OFFER_URL, make_soup(offer_page, "html.parser"))
+
+    product = Product.from_soup(OFFER_URL, make_soup(offer_page, backend))
+
+    assert product == expected
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_scrape_from_url"])
+@pytest.mark.parametrize("backend", PARSER_BACKENDS)
+def test_extract_product(offer_page, backend):
+    """
+    Test that single pass extractor gives the same fields as field parsers
+    """
+    soup = make_soup(offer_page, backend)
+
+    assert extract_product(soup) == {
+        "buy_now": is_buynow_offer(soup),
+        "name": find_product_name(soup),
+        "category": find_product_category(soup),
+        "price": find_product_price(soup),
+        "seller": find_product_seller(soup),
+        "quantity": find_product_quantity(soup),
+        "rating": find_product_rating(soup),
+        "images": find_product_images(soup),
+        "parameters": find_product_parameters(soup),
+    }
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_crawl_max_results"])
+@pytest.mark.parametrize("backend", PARSER_BACKENDS)
+def test_listing_parser_backends(vcr_cassette_name, backend):
+    """
+    Test that every parser backend finds the same offers on listing page
+    """
+    listing_page = get_session().get(LISTING_URL, headers=HEADERS).text
+
+    expected = make_soup(listing_page, "html.parser")
+    soup = make_soup(listing_page, backend)
+
+    assert [find_offer_url(section) for section in find_offer_sections(soup)] == [
+        find_offer_url(section) for section in find_offer_sections(expected)
+    ]
+    assert [
+        get_listing_fingerprint(section) for section in find_offer_sections(soup)
+    ] == [get_listing_fingerprint(section) for section in find_offer_sections(expected)]
+    assert len(find_offer_sections(soup)) >= 50
+    assert find_offer_price(find_offer_sections(soup)[2]) == 22.0
+    assert Product.from_section(find_offer_sections(soup)[0]) == Product.from_section(
+        find_offer_sections(expected)[0]
+    )
+    assert Product.from_section(find_offer_sections(soup)[0]).name == "Kabel 3w1 micro"
+    assert is_last_page(soup, 1) is False
+
+
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_crawl_max_results"])
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_partial_listing_parsing(vcr_cassette_name, backend):
+    """
+    Test that listing page parsed with strainer has the same offers
+    """
+    listing_page = get_session().get(LISTING_URL, headers=HEADERS).text
+
+    expected = make_soup(listing_page, backend)
+    soup = make_soup(listing_page, backend, parse_only=LISTING_STRAINER)
+
+    assert [find_offer_url(section) for section in find_offer_sections(soup)] == [
+        find_offer_url(section) for section in find_offer_sections(expected)
+    ]
+    assert is_last_page(soup, 1) is False
+    assert len(soup.find_all("div")) < len(expected.find_all("div"))
+
+    # Results that fit on one page have no pagination
+    assert is_last_page(make_soup("<html><body></body></html>", backend), 1) is True
@@ -1,5 +1,6 @@
 # flake8: noqa: E501
 
+import asyncio
 import json
 
 import pytest
@@ -30,6 +31,23 @@ def test_scrape_from_url():
     assert len(product.parameters.keys()) >= 3
 
 
+@pytest.mark.vcr()
+@pytest.mark.parametrize("vcr_cassette_name", ["test_scrape_from_url"])
+def test_async_scrape_from_url(vcr_cassette_name):
+    """
+    Test create product from url using async engine
+    """
+    product = asyncio.run(
+        Product.async_from_url(
+            "https://allegro.pl/oferta/5-x-test-antygenowy-domowy-dokladnosc-96-79-10572320477"
+        )
+    )
+
+    assert product.name == "5 x TEST ANTYGENOWY DOMOWY DOKŁADNOŚĆ 96,79"
+    assert product.price == 57.98
+    assert product.seller == "Simon-Trade"
+
+
 def test_product_from_dump():
     """
     Test create product from dump
@@ -1,6 +1,11 @@
 from allegro.proxy import load_from_file, filter_proxies, scrape_free_proxy_lists
+from allegro.proxy import validate_proxies, ProxyCheck, ProxyReputation
+from allegro.utils import ResponseKind
 
+import time
 import pytest
+import requests
+import threading
 
 
 @pytest.mark.vcr()
@@ -54,3 +59,119 @@ def test_check_proxies():
     proxies = filter_proxies(proxies, timeout=1)
 
     assert len(proxies) != 50
+
+
+def test_validate_proxies(mocker):
+    """
+    Test that proxies are checked at once, ranked by latency and checking stops early
+    """
+    page = b"<html><body>" + b"<div>offer</div>" * 20 + b"</body></html>"
+    latencies = {"1.1.1.1:80": 0.2, "2.2.2.2:80": 0.05, "3.3.3.3:80": 0.1}
+    running = []
+    lock = threading.Lock()
+
+    def fake_get(self, url, proxies=None, **kwargs):
+        proxy = proxies["https"].split("//")[1]
+
+        with lock:
+            running.append(proxy)
+
+        if proxy == "4.4.4.4:80":
+            raise requests.ConnectionError()
+
+        time.sleep(latencies.get(proxy, 0.01))
+
+        response = requests.Response()
+        response.status_code = 403 if proxy == "5.5.5.5:80" else 200
+        response._content = page
+        response.url = url
+
+        return response
+
+    get = mocker.patch.object(requests.Session, "get", autospec=True, side_effect=fake_get)
+
+    results = validate_proxies(
+        ["1.1.1.1:80", "2.2.2.2:80", "3.3.3.3:80", "4.4.4.4:80", "5.5.5.5:80"],
+        workers=5,
+        url="http://127.0.0.1:8000/offer",
+    )
+
+    assert [result.proxy for result in results if result.working] == [
+        "2.2.2.2:80",
+        "3.3.3.3:80",
+        "1.1.1.1:80",
+    ]
+    assert {result.proxy: result.kind for result in results}["4.4.4.4:80"] is (
+        ResponseKind.CONNECTION
+    )
+    assert all(call.kwargs["url"] == "http://127.0.0.1:8000/offer" for call in get.call_args_list)
+
+    running.clear()
+    proxies = filter_proxies(list(latencies) * 10, workers=2, max_proxies=2)
+
+    assert len(proxies) == 2
+    assert len(running) < 30
+
+
+def test_proxy_reputation(tmp_path):
+    """
+    Test that proxy history is kept between runs
+    """
+    path = str(tmp_path / "proxies.json")
+    reputation = ProxyReputation(path)
+
+    reputation.record_check(ProxyCheck("1.1.1.1:80", ResponseKind.OK, 0.3))
+    reputation.record_check(ProxyCheck("2.2.2.2:80", ResponseKind.OK, 0.1))
+    for _ in range(3):
+        reputation.record_check(ProxyCheck("3.3.3.3:80", ResponseKind.CAPTCHA, 0.1))
+    reputation.save()
+
+    reputation = ProxyReputation(path)
+    good, dead, unknown = reputation.split(
+        ["1.1.1.1:80", "2.2.2.2:80", "3.3.3.3:80", "4.4.4.4:80"]
+    )
+
+    assert good == ["2.2.2.2:80", "1.1.1.1:80"]
+    assert dead == ["3.3.3.3:80"]
+    assert unknown == ["4.4.4.4:80"]
+
+    pool = reputation.get_pool(["1.1.1.1:80", "3.3.3.3:80"])
+
+    # Recently blocked proxy stays in quarantine
+    assert {pool.acquire() for _ in range(20)} == {"1.1.1.1:80"}
+    assert pool.get_stats("1.1.1.1:80").latency == 0.3
+
+    pool.report_success("1.1.1.1:80", 0.5)
+    reputation.record_pool(pool)
+
+    # Moving average of the pool is kept apart from check samples
+    assert reputation.get("1.1.1.1:80").successes == 2
+    assert reputation.get("1.1.1.1:80").median_latency == 0.3
+    assert reputation.get("1.1.1.1:80").latency == pytest.approx(0.36)
+    assert reputation.get_pool(["1.1.1.1:80"]).get_stats(
+        "1.1.1.1:80"
+    ).latency == pytest.approx(0.36)
+
+
+def test_filter_proxies_reputation(mocker, tmp_path):
+    """
+    Test that proxies known from previous runs are not checked again
+    """
+    reputation = ProxyReputation(str(tmp_path / "proxies.json"))
+    reputation.record_check(ProxyCheck("1.1.1.1:80", ResponseKind.OK, 0.3))
+
+    check = mocker.patch(
+        "allegro.proxy.proxy_checker.validate_proxy",
+        side_effect=lambda proxy, *args: ProxyCheck(proxy, ResponseKind.OK, 0.2),
+    )
+
+    assert filter_proxies(["1.1.1.1:80", "2.2.2.2:80"], reputation=reputation) == [
+        "1.1.1.1:80",
+        "2.2.2.2:80",
+    ]
+    assert check.call_count == 1
+    assert filter_proxies(["1.1.1.1:80", "2.2.2.2:80"], reputation=reputation) == [
+        "2.2.2.2:80",
+        "1.1.1.1:80",
+    ]
+    assert check.call_count == 1
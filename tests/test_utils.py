@@ -0,0 +1,666 @@
+import asyncio
+import time
+import pickle
+import threading
+import urllib.request
+
+import pytest
+import requests
+
+from allegro.utils import get_session, get_proxy_object, set_pool_size, close_sessions
+from allegro.utils import ensure_pool_size
+from allegro.utils import classify_response, check_page, get_soup, ResponseKind
+from allegro.utils import ResponseCache, set_cache, normalize_url, get_url_kind
+from allegro.utils import cache_from_options
+from allegro.utils import ProxyPool, TokenBucket, RateLimiter
+from allegro.utils import classify_exception, RetryPolicy, CircuitBreaker
+from allegro.utils import MetricsRegistry, start_metrics_server, Profiler
+from allegro.utils import soup as soup_module
+
+PAGE = b"<html><body>" + b"<div>offer</div>" * 20 + b"</body></html>"
+OFFER_URL = "https://allegro.pl/oferta/kabel-7865547535"
+
+
+def make_response(status_code=200, content=b"", headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+
+    return response
+
+
+def test_session_reused_per_proxy():
+    """
+    Test that one session is kept for direct traffic and for each proxy
+    """
+    close_sessions()
+
+    proxy_object = get_proxy_object("127.0.0.1:8080")
+
+    assert get_session() is get_session()
+    assert get_session(proxy_object) is get_session(get_proxy_object("127.0.0.1:8080"))
+    assert get_session(proxy_object) is not get_session()
+    assert get_session(proxy_object).proxies["https"] == "https://127.0.0.1:8080"
+
+
+def test_session_pool_size():
+    """
+    Test that pool size is applied to new sessions
+    """
+    set_pool_size(4)
+
+    adapter = get_session().get_adapter("https://allegro.pl")
+
+    assert adapter._pool_maxsize == 4
+
+    # Open sessions get bigger pools, smaller size doesn't shrink them
+    session = get_session()
+    ensure_pool_size(8)
+    ensure_pool_size(6)
+
+    assert get_session() is session
+    assert session.get_adapter("https://allegro.pl")._pool_maxsize == 8
+
+    set_pool_size(32)
+
+
+def test_classify_response():
+    """
+    Test that block pages are classified without parsing
+    """
+    page = PAGE
+    js_wall = (
+        b"<html><body>Please enable JS and disable any ad blocker"
+        b"<script src='https://ct.captcha-delivery.com/c.js'></script></body></html>"
+    )
+    captcha = b"<script>var dd={'t':'fe','host':'geo.captcha-delivery.com'}</script>"
+
+    assert classify_response(make_response(content=page)) is ResponseKind.OK
+    assert classify_response(make_response(403, js_wall)) is ResponseKind.JS_WALL
+    assert classify_response(make_response(403, captcha)) is ResponseKind.CAPTCHA
+    assert classify_response(make_response(200, b"<div></div>")) is ResponseKind.JS_WALL
+    assert classify_response(make_response(429, page)) is ResponseKind.RATE_LIMIT
+    assert (
+        classify_response(make_response(200, page, {"x-reason": "Too Many Requests"}))
+        is ResponseKind.RATE_LIMIT
+    )
+
+
+def test_blocked_page_not_parsed(mocker):
+    """
+    Test that blocked pages are never parsed and the reason is reported
+    """
+    close_sessions()
+
+    mocker.patch.object(
+        requests.Session, "get", return_value=make_response(429, b"Too Many Requests")
+    )
+    make_soup = mocker.patch("allegro.utils.check.make_soup")
+
+    assert check_page("https://allegro.pl") == (None, ResponseKind.RATE_LIMIT)
+    make_soup.assert_not_called()
+
+    # Rate limit is retried before giving up
+    sleep = mocker.patch("time.sleep")
+    with pytest.raises(OSError, match="rate limited"):
+        get_soup("https://allegro.pl")
+
+    assert sleep.call_count == 3
+
+
+def test_normalize_url():
+    """
+    Test that equal urls share cache key
+    """
+    assert normalize_url("HTTPS://Allegro.pl/listing?p=2&string=gtx#top") == (
+        "https://allegro.pl/listing?p=2&string=gtx"
+    )
+    assert normalize_url("https://allegro.pl/listing?string=gtx&p=2") == (
+        normalize_url("https://allegro.pl/listing?p=2&string=gtx")
+    )
+    assert get_url_kind(OFFER_URL) == "offer"
+    assert get_url_kind("https://allegro.pl/listing?string=gtx") == "listing"
+
+
+def test_response_cache(mocker, tmp_path):
+    """
+    Test that fresh pages are not requested again and blocked pages are not cached
+    """
+    close_sessions()
+    set_cache(ResponseCache(str(tmp_path)))
+
+    try:
+        get = mocker.patch.object(
+            requests.Session,
+            "get",
+            side_effect=[make_response(429), make_response(content=PAGE)],
+        )
+
+        assert check_page(OFFER_URL)[1] is ResponseKind.RATE_LIMIT
+        assert check_page(OFFER_URL)[1] is ResponseKind.OK
+
+        soup, kind = check_page(OFFER_URL)
+
+        assert kind is ResponseKind.OK
+        assert len(soup.find_all("div")) == 20
+        assert get.call_count == 2
+        assert len(list(tmp_path.glob("*.gz"))) == 1
+    finally:
+        set_cache(None)
+
+
+def test_response_cache_revalidation(mocker, tmp_path):
+    """
+    Test that stale pages are revalidated with etag
+    """
+    close_sessions()
+    set_cache(ResponseCache(str(tmp_path), listing_ttl=0))
+
+    try:
+        get = mocker.patch.object(
+            requests.Session,
+            "get",
+            side_effect=[
+                make_response(content=PAGE, headers={"ETag": '"v1"'}),
+                make_response(304),
+            ],
+        )
+
+        check_page("https://allegro.pl/listing?string=gtx")
+        soup, kind = check_page("https://allegro.pl/listing?string=gtx")
+
+        assert kind is ResponseKind.OK
+        assert len(soup.find_all("div")) == 20
+        assert get.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+    finally:
+        set_cache(None)
+
+
+def test_response_cache_eviction(tmp_path):
+    """
+    Test that least recently used pages are removed when cache is full
+    """
+    cache = ResponseCache(str(tmp_path))
+
+    cache.store(OFFER_URL, {}, make_response(content=PAGE))
+    cache.max_size = int(next(tmp_path.glob("*.gz")).stat().st_size * 2.5)
+
+    cache.store("https://allegro.pl/oferta/second-1", {}, make_response(content=PAGE))
+    cache.load(OFFER_URL)
+    cache.store("https://allegro.pl/oferta/third-1", {}, make_response(content=PAGE))
+
+    assert cache.load(OFFER_URL) is not None
+    assert cache.load("https://allegro.pl/oferta/second-1") is None
+    assert cache.load("https://allegro.pl/oferta/third-1").fresh is True
+
+
+def test_cache_from_options(tmp_path):
+    """
+    Test that zero cache settings are not replaced by defaults
+    """
+    options = {
+        "cache_dir": str(tmp_path),
+        "cache_listing_ttl": 0,
+        "cache_offer_ttl": 0,
+        "cache_size": 0,
+    }
+    cache = cache_from_options(options)  # type: ignore
+
+    assert (cache.listing_ttl, cache.offer_ttl, cache.max_size) == (0, 0, 0)
+
+    cache = cache_from_options({"cache_dir": str(tmp_path)})  # type: ignore
+
+    assert cache.listing_ttl > 0 and cache.offer_ttl > 0 and cache.max_size > 0
+
+
+def test_proxy_pool_weights():
+    """
+    Test that fast and healthy proxies are picked more often
+    """
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"])
+
+    for _ in range(20):
+        pool.report_success("1.1.1.1:80", 0.1)
+        pool.report_failure("2.2.2.2:80", ResponseKind.ERROR)
+        pool.report_success("2.2.2.2:80", 2.0)
+
+    picked = [pool.acquire() for _ in range(200)]
+
+    assert picked.count("1.1.1.1:80") > 150
+    assert pool.get_stats("1.1.1.1:80").success_rate > 0.9
+
+
+def test_proxy_pool_quarantine(mocker):
+    """
+    Test that blocked proxies are not used until cooldown ends
+    """
+    monotonic = mocker.patch("time.monotonic", return_value=1000.0)
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"], cooldown=10)
+
+    pool.report_failure("1.1.1.1:80", ResponseKind.CAPTCHA)
+    pool.report_failure("1.1.1.1:80", ResponseKind.CAPTCHA)
+
+    assert {pool.acquire() for _ in range(20)} == {"2.2.2.2:80"}
+    assert pool.acquire(exclude={"2.2.2.2:80"}) is None
+
+    # Second block in a row doubles the cooldown
+    monotonic.return_value = 1015.0
+    assert pool.acquire(exclude={"2.2.2.2:80"}) is None
+
+    monotonic.return_value = 1021.0
+    assert pool.acquire(exclude={"2.2.2.2:80"}) == "1.1.1.1:80"
+
+
+def test_proxy_pool_worker_process(mocker):
+    """
+    Test that worker process gets stats of the pool and sends its outcomes back
+    """
+    mocker.patch("time.monotonic", return_value=1000.0)
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"], cooldown=10)
+    pool.report_failure("1.1.1.1:80", ResponseKind.CAPTCHA)
+
+    worker_pool = pickle.loads(pickle.dumps(pool))
+
+    assert {worker_pool.acquire() for _ in range(20)} == {"2.2.2.2:80"}
+    assert pool.flush() is None
+
+    worker_pool.report_success("2.2.2.2:80", 0.2)
+    worker_pool.report_failure("2.2.2.2:80", ResponseKind.RATE_LIMIT)
+    pool.merge(worker_pool.flush())
+
+    assert worker_pool.flush() == []
+    assert pool.get_stats("2.2.2.2:80").successes == 1
+    assert pool.get_stats("2.2.2.2:80").latency == 0.2
+    assert pool.acquire() is None
+
+
+def test_get_soup_proxy_pool(mocker):
+    """
+    Test that blocked proxy is replaced and timeout is kept on retries
+    """
+    check_page = mocker.patch.object(
+        soup_module,
+        "check_page",
+        side_effect=[(None, ResponseKind.CAPTCHA), ("soup", ResponseKind.OK)],
+    )
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"])
+
+    assert get_soup("https://allegro.pl", proxies=pool, timeout=5) == "soup"
+
+    first, second = [call.kwargs["proxies"]["https"] for call in check_page.call_args_list]
+
+    assert first != second
+    assert all(call.kwargs["timeout"] == 5 for call in check_page.call_args_list)
+    assert pool.get_stats(first[len("https://"):]).blocks == 1
+
+    # Quarantined proxy is waited for, error is raised after both proxies are tried
+    clock = [time.monotonic()]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    mocker.patch("time.monotonic", side_effect=lambda: clock[0])
+    sleep_mock = mocker.patch("time.sleep", side_effect=sleep)
+    check_page.side_effect = [(None, ResponseKind.JS_WALL)] * 2
+    with pytest.raises(OSError, match="bypass"):
+        get_soup("https://allegro.pl", proxies=pool, timeout=5)
+
+    assert check_page.call_count == 4
+    assert sleep_mock.call_count == 1
+
+
+def test_get_soup_proxies_quarantined(mocker):
+    """
+    Test that page is fetched after quarantine ends when all proxies are quarantined
+    """
+    clock = [1000.0]
+
+    def sleep(seconds):
+        clock[0] += seconds
+
+    mocker.patch("time.monotonic", side_effect=lambda: clock[0])
+    sleep_mock = mocker.patch("time.sleep", side_effect=sleep)
+    check_page = mocker.patch.object(
+        soup_module, "check_page", return_value=("soup", ResponseKind.OK)
+    )
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"], cooldown=10, max_cooldown=20)
+    pool.report_failure("1.1.1.1:80", ResponseKind.CAPTCHA)
+    clock[0] += 5
+    pool.report_failure("2.2.2.2:80", ResponseKind.RATE_LIMIT)
+
+    assert pool.get_wait() == 5
+    assert pool.get_wait(exclude={"1.1.1.1:80"}) == 10
+    assert pool.get_wait(exclude={"1.1.1.1:80", "2.2.2.2:80"}) is None
+
+    assert get_soup("https://allegro.pl", proxies=pool) == "soup"
+    assert check_page.call_args.kwargs["proxies"]["https"] == "https://1.1.1.1:80"
+    sleep_mock.assert_called_once_with(5)
+
+
+def test_token_bucket(mocker):
+    """
+    Test that burst is sent at once and later requests are paced
+    """
+    mocker.patch("time.monotonic", return_value=1000.0)
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert [bucket.reserve() for _ in range(2)] == [0.5, 1.0]
+
+
+def test_rate_limiter(mocker):
+    """
+    Test that hosts and proxies have separate buckets
+    """
+    mocker.patch("time.monotonic", return_value=1000.0)
+    sleep = mocker.patch("time.sleep")
+    limiter = RateLimiter(host_rate=10, proxy_rate=1)
+    proxies = {"http": "http://1.1.1.1:80", "https": "https://1.1.1.1:80"}
+
+    limiter.wait("https://allegro.pl/listing", proxies)
+    limiter.wait("https://www.allegro.pl/listing")
+    sleep.assert_not_called()
+
+    limiter.wait("https://allegro.pl/oferta/kabel-1")
+    sleep.assert_called_once_with(pytest.approx(0.1))
+
+    # Proxy limit is lower than host limit
+    limiter.wait("https://www.allegro.pl/oferta/kabel-2", proxies)
+    sleep.assert_called_with(pytest.approx(1.0))
+
+    assert limiter.split(2).get_settings() == (5, 1, 0.5, 1)
+
+
+def test_classify_failures():
+    """
+    Test that transient failures are told apart from blocks
+    """
+    assert classify_response(make_response(503, PAGE)) is ResponseKind.SERVER_ERROR
+    assert classify_exception(requests.ConnectTimeout()) is ResponseKind.TIMEOUT
+    assert classify_exception(requests.ReadTimeout()) is ResponseKind.TIMEOUT
+    assert classify_exception(requests.ConnectionError()) is ResponseKind.CONNECTION
+    assert classify_exception(ValueError()) is ResponseKind.ERROR
+
+    assert ResponseKind.SERVER_ERROR.transient and not ResponseKind.SERVER_ERROR.blocked
+    assert ResponseKind.RATE_LIMIT.transient and ResponseKind.RATE_LIMIT.blocked
+    assert not ResponseKind.CAPTCHA.transient
+
+
+def test_get_soup_retries(mocker):
+    """
+    Test that transient failures are retried with backoff until budget is used up
+    """
+    sleep = mocker.patch("time.sleep")
+    policy = RetryPolicy(max_retries=3, backoff=1.0, budget=3)
+    mocker.patch.object(soup_module, "get_retry_policy", return_value=policy)
+    check_page = mocker.patch.object(
+        soup_module,
+        "check_page",
+        side_effect=[
+            (None, ResponseKind.TIMEOUT),
+            (None, ResponseKind.SERVER_ERROR),
+            ("soup", ResponseKind.OK),
+        ],
+    )
+
+    assert get_soup("https://allegro.pl") == "soup"
+    assert check_page.call_count == 3
+
+    # Backoff grows with every retry
+    first, second = [call.args[0] for call in sleep.call_args_list]
+    assert 0 <= first <= 1.0 and 0 <= second <= 2.0
+
+    # Blocks are not retried
+    check_page.side_effect = [(None, ResponseKind.CAPTCHA)]
+    with pytest.raises(OSError, match="IP restricted"):
+        get_soup("https://allegro.pl")
+
+    # Only one retry is left in the budget
+    check_page.side_effect = [(None, ResponseKind.CONNECTION)] * 2
+    with pytest.raises(OSError, match="Failed to get response"):
+        get_soup("https://allegro.pl")
+
+    assert sleep.call_count == 3
+
+
+def test_get_soup_proxy_retries(mocker):
+    """
+    Test that proxy is not dropped after one timeout
+    """
+    mocker.patch("time.sleep")
+    policy = RetryPolicy(max_retries=1)
+    mocker.patch.object(soup_module, "get_retry_policy", return_value=policy)
+    check_page = mocker.patch.object(
+        soup_module,
+        "check_page",
+        side_effect=[
+            (None, ResponseKind.TIMEOUT),
+            (None, ResponseKind.TIMEOUT),
+            ("soup", ResponseKind.OK),
+        ],
+    )
+    pool = ProxyPool(["1.1.1.1:80", "2.2.2.2:80"])
+
+    assert get_soup("https://allegro.pl", proxies=pool) == "soup"
+    assert check_page.call_count == 3
+    assert pool.get_stats("1.1.1.1:80").blocks == 0
+    assert pool.get_stats("2.2.2.2:80").blocks == 0
+
+
+def test_get_soup_proxy_rate_limit_breaker(mocker):
+    """
+    Test that rate limits of single proxies don't open the breaker
+    """
+    sleep = mocker.patch("time.sleep")
+    policy = RetryPolicy(breaker=CircuitBreaker(window=4, threshold=0.5, cooldown=10))
+    mocker.patch.object(soup_module, "get_retry_policy", return_value=policy)
+    check_page = mocker.patch.object(
+        soup_module,
+        "check_page",
+        side_effect=[(None, ResponseKind.RATE_LIMIT)] * 4 + [("soup", ResponseKind.OK)],
+    )
+    pool = ProxyPool([f"{index}.{index}.{index}.{index}:80" for index in range(1, 6)])
+
+    assert get_soup("https://allegro.pl", proxies=pool) == "soup"
+    assert check_page.call_count == 5
+    assert not policy.breaker.open
+    sleep.assert_not_called()
+
+
+def test_circuit_breaker(mocker):
+    """
+    Test that requests are paused when most of recent requests failed
+    """
+    monotonic = mocker.patch("time.monotonic", return_value=1000.0)
+    sleep = mocker.patch("time.sleep")
+    breaker = CircuitBreaker(window=4, threshold=0.5, cooldown=10)
+
+    for failed in (False, False, True, False):
+        breaker.record(failed)
+
+    breaker.wait()
+    assert not breaker.open
+    sleep.assert_not_called()
+
+    breaker.record(True)
+    assert breaker.open
+
+    monotonic.return_value = 1004.0
+    breaker.wait()
+    sleep.assert_called_once_with(6.0)
+
+    monotonic.return_value = 1010.0
+    assert not breaker.open
+
+
+def test_metrics_registry():
+    """
+    Test that metrics are rendered in prometheus format and merged from workers
+    """
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.inc("allegro_responses_total", kind="ok")
+    metrics.inc("allegro_responses_total", 2, kind="captcha")
+    metrics.observe("allegro_request_seconds", 0.5, proxy='1.1.1.1:80"')
+    metrics.set("allegro_queue_depth", 4, queue="offers")
+
+    assert metrics.render().splitlines() == [
+        "# HELP allegro_responses_total Responses by kind, blocked pages included",
+        "# TYPE allegro_responses_total counter",
+        'allegro_responses_total{kind="captcha"} 2',
+        'allegro_responses_total{kind="ok"} 1',
+        "# HELP allegro_queue_depth Offers and tasks waiting to be scraped, by queue",
+        "# TYPE allegro_queue_depth gauge",
+        'allegro_queue_depth{queue="offers"} 4',
+        "# HELP allegro_request_seconds Time of http requests, by proxy",
+        "# TYPE allegro_request_seconds histogram",
+        'allegro_request_seconds_bucket{proxy="1.1.1.1:80\\"",le="0.1"} 0',
+        'allegro_request_seconds_bucket{proxy="1.1.1.1:80\\"",le="1.0"} 1',
+        'allegro_request_seconds_bucket{proxy="1.1.1.1:80\\"",le="+Inf"} 1',
+        'allegro_request_seconds_sum{proxy="1.1.1.1:80\\""} 0.5',
+        'allegro_request_seconds_count{proxy="1.1.1.1:80\\""} 1',
+    ]
+
+    # Worker process starts with empty registry and sends its metrics back
+    worker = pickle.loads(pickle.dumps(metrics))
+    assert worker.buckets == (0.1, 1.0) and worker.flush() == {
+        "counters": {},
+        "histograms": {},
+    }
+
+    worker.inc("allegro_responses_total", kind="ok")
+    worker.observe("allegro_request_seconds", 0.05, proxy='1.1.1.1:80"')
+    metrics.merge(worker.flush())
+
+    assert worker.get_value("allegro_responses_total") == 0
+    assert metrics.get_value("allegro_responses_total") == 4
+    assert metrics.get_value("allegro_responses_total", kind="ok") == 2
+    assert metrics.get_histogram("allegro_request_seconds") == (0.55, 2)
+
+    summary = metrics.get_summary()
+    assert summary[0].startswith("Requests: 2, 0.28s on average")
+    assert summary[1] == "Responses: captcha 2, ok 2 (50.0% blocked)"
+
+
+def test_metrics_server():
+    """
+    Test that metrics can be scraped over http
+    """
+    metrics = MetricsRegistry()
+    metrics.inc("allegro_products_total", 3)
+
+    server = start_metrics_server(0, metrics, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.stop()
+
+    assert "allegro_products_total 3\n" in body
+
+
+def test_check_page_metrics(mocker):
+    """
+    Test that requests, downloaded bytes and parse time are measured
+    """
+    close_sessions()
+
+    metrics = MetricsRegistry()
+    mocker.patch("allegro.utils.metrics._metrics", metrics)
+    get = mocker.patch.object(requests.Session, "get", return_value=make_response(200, PAGE))
+
+    check_page("https://allegro.pl", proxies=get_proxy_object("user:pass@1.1.1.1:80"))
+
+    get.return_value = make_response(429, b"Too Many Requests")
+    check_page("https://allegro.pl")
+
+    assert metrics.get_histogram("allegro_request_seconds", proxy="1.1.1.1:80")[1] == 1
+    assert metrics.get_histogram("allegro_request_seconds", proxy="direct")[1] == 1
+    assert metrics.get_value("allegro_downloaded_bytes_total") == len(PAGE) + 17
+    assert metrics.get_value("allegro_responses_total", kind="rate_limit") == 1
+
+    # Blocked pages are not parsed
+    assert metrics.get_histogram("allegro_parse_seconds")[1] == 1
+
+
+def test_profiler(mocker, tmp_path):
+    """
+    Test that requests are split into phases and profiles of workers are merged
+    """
+    close_sessions()
+
+    metrics = MetricsRegistry()
+    metrics.inc("allegro_products_total")
+    server = start_metrics_server(0, metrics, host="127.0.0.1")
+    url = f"http://localhost:{server.port}/metrics"
+
+    profiler = Profiler()
+    mocker.patch("allegro.utils.profiler._profiler", profiler)
+    profiler.start()
+
+    try:
+        check_page(url)
+
+        # Threads started after the profiler are profiled too
+        thread = threading.Thread(target=check_page, args=(url + "?thread",))
+        thread.start()
+        thread.join()
+    finally:
+        profiler.stop()
+        server.stop()
+        close_sessions()
+
+    first, second = profiler.get_timeline()
+    assert (first["url"], second["url"]) == (url, url + "?thread")
+    assert first["kind"] == "js_wall" and first["proxy"] == "direct"
+    assert all(first[phase] >= 0 for phase in ["dns", "connect", "ttfb", "download"])
+
+    # Blocked pages are not parsed
+    assert "parse" not in first
+
+    # Worker process starts with empty profiler and sends its profile back
+    worker = pickle.loads(pickle.dumps(profiler))
+    worker.begin(OFFER_URL, "1.1.1.1:80")
+    worker.record("extract", 0.25, url=OFFER_URL)
+    profiler.merge(worker.flush())
+
+    assert profiler.get_timeline()[-1]["extract"] == 0.25
+    assert worker.get_timeline() == []
+
+    path = tmp_path / "profile.txt"
+    profiler.write_report(str(path))
+    report = path.read_text(encoding="utf-8")
+
+    assert "Phases of 3 requests" in report
+    assert "extract        0.250     0.250     0.250       1" in report
+    assert report.count("(check_page)") == 1
+    assert f"1.1.1.1:80  {OFFER_URL}" in report
+
+
+def test_io_executor_per_loop(mocker):
+    """
+    Test that executor used by async requests is grown and shut down with its loop
+    """
+    ensure_pool_size = mocker.patch.object(soup_module, "ensure_pool_size")
+
+    async def get_executors():
+        loop = asyncio.get_running_loop()
+        executor = soup_module._get_io_executor(loop, 3)
+
+        assert soup_module._get_io_executor(loop, 2) is executor
+        sent = executor.submit(time.sleep, 0.1)
+        bigger = soup_module._get_io_executor(loop, 5)
+
+        # Smaller executor finishes requests that were already sent
+        await asyncio.wrap_future(sent)
+
+        return executor, bigger
+
+    executor, bigger = asyncio.run(get_executors())
+
+    assert bigger is not executor
+    assert ensure_pool_size.call_args.args == (5,)
+
+    # Loop has shut its executor down
+    with pytest.raises(RuntimeError):
+        bigger.submit(sum, [1, 2])